@@ -4,7 +4,7 @@ import json
 import re
 import os
 from ..services.volc_llm_client import VolcLLMClient
-from ..repositories.system_config_repo import SystemConfigRepo
+from ..services.config_singleton import config_cache
 from ..models.model_config import ModelConfig
 from ..db import SessionLocal
 
@@ -61,15 +61,13 @@ Requirements:
         try:
             # Get API Key
             # Priority: Environment Variable > DB Config
-            sys_repo = SystemConfigRepo()
             api_key = os.getenv("ARK_API_KEY")
             
             print(f"StoryAgent Debug: Env Key = {api_key[:6] if api_key else 'None'}...")
             
             if not api_key:
                 print("StoryAgent Debug: Env Key missing, checking DB...")
-                api_key_cfg = sys_repo.get(db, "volc_api_key")
-                api_key = api_key_cfg.value if api_key_cfg else None
+                api_key = config_cache.get("volc_api_key")
                 print(f"StoryAgent Debug: DB Key = {api_key[:6] if api_key else 'None'}...")
             
             if not api_key:
@@ -9,6 +9,7 @@ from ..repositories.asset_repo import AssetRepo
 from ..services.storage_service import StorageService
 from ..services.asset_service import AssetService
 from ..services.asset_resolver import AssetResolver
+from ..services.blob_singleton import blobs
 from ..schemas.asset import AssetCreate, AssetOut, AssetSearchRequest, AssetResolverRequest, AssetResolverResponse
 from pydantic import BaseModel
 import time
@@ -51,24 +52,21 @@ async def upload_asset_file(
              print(f"DEBUG: Invalid image format: {ext}")
              raise HTTPException(400, f"Invalid image format: {ext}")
     
-    # Calculate absolute path to backend/app/static/uploads to match main.py mount
-    current_dir = os.path.dirname(os.path.abspath(__file__)) # backend/app/api
-    app_dir = os.path.dirname(current_dir) # backend/app
-    upload_dir = os.path.join(app_dir, "static", "uploads")
-    
-    if not os.path.exists(upload_dir):
-        os.makedirs(upload_dir)
-    
-    unique_name = f"{uuid.uuid4()}{ext}"
-    file_path = os.path.join(upload_dir, unique_name)
-    
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    # Stored by content (static/blobs); the same file uploaded twice is kept once
+    tmp_path = blobs.incoming_path()
+    try:
+        with open(tmp_path, "wb") as buffer:
+            shutil.copyfileobj(file.file, buffer)
+        blob = await blobs.put_file(tmp_path, filename, move=True, remote=False)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    file_path = blobs.local_file(blob)
         
     db = SessionLocal()
     asset_service = AssetService(db)
     try:
-        url = f"/static/uploads/{unique_name}"
+        url = f"/{blob.local_path}"
         
         # Determine if it is an image based on extension
         is_image = ext in [".jpg", ".jpeg", ".png", ".gif", ".webp"]
@@ -89,6 +87,7 @@ async def upload_asset_file(
             user_id=user["id"],
             asset_data=asset_data
         )
+        blobs.ref(db, blob.sha256, "asset", asset["asset_id"], "media")
         
         return AssetOut(
             id=asset["id"],
@@ -271,6 +270,7 @@ async def delete_asset(
         success = asset_service.delete_asset(asset_id)
         if not success:
             raise HTTPException(404, "Asset not found")
+        await blobs.release("asset", asset_id, reason="asset_deleted")
         
         return {"message": "Asset deleted"}
     finally:
@@ -8,9 +8,11 @@ import base64
 from pydantic import BaseModel
 from sqlalchemy.orm import Session
 from ..db import get_db
-from ..repositories.system_config_repo import SystemConfigRepo
+from ..services.config_singleton import config_cache
 from ..services.tos_service import TOSService
 from ..services.storage_service import StorageService
+from ..services.io_singleton import io_pools
+from ..services.media_singleton import media_cache
 
 import importlib.util
 
@@ -65,30 +67,38 @@ class OptimizeResponse(BaseModel):
     negative_prompt: Optional[str] = None
     edit_instructions: Optional[List[Dict[str, Any]]] = None
 
-def get_image_payload(url: str):
+CONFIG_KEYS = [
+    "volc_access_key", "volc_secret_key", "volc_api_key",
+    "badcase_api_endpoint", "badcase_api_key", "badcase_agent_id", "badcase_llm_endpoint",
+]
+
+def load_configs() -> Dict[str, Optional[str]]:
+    """Config values this endpoint needs (None if unset), from the process-wide cache."""
+    return config_cache.get_many(CONFIG_KEYS)
+
+def _sign_tos_url(url: str) -> Optional[str]:
+    try:
+        return TOSService().sign_url(url, expires=3600)
+    except Exception as e:
+        print(f"Error signing TOS url: {e}")
+        return None
+
+async def get_image_payload(url: str):
     if not url:
         return None
         
     if url.startswith("tos://"):
-        try:
-            service = TOSService()
-            signed_url = service.sign_url(url, expires=3600)
-            return {"type": "image_url", "image_url": {"url": signed_url}}
-        except Exception as e:
-            print(f"Error signing TOS url: {e}")
-            return None
+        signed_url = await io_pools.run("storage", _sign_tos_url, url)
+        return {"type": "image_url", "image_url": {"url": signed_url}} if signed_url else None
             
     if url.startswith("/static/"):
-        # Local file
+        # Local file, resolved through the media cache (counted as badcase hits/misses)
         try:
-            # Resolve path. Assume running from project root
-            # url: /static/imported/xxx.png
-            # path: backend/app/static/imported/xxx.png
-            path = f"backend/app{url}"
-            if os.path.exists(path):
-                with open(path, "rb") as f:
-                    b64 = base64.b64encode(f.read()).decode("utf-8")
-                    return {"type": "image_url", "image_url": {"url": f"data:image/png;base64,{b64}"}}
+            path, _ = await media_cache.local_copy(url, "badcase")
+            if path:
+                data = await io_pools.run("file", _read_bytes, path)
+                b64 = base64.b64encode(data).decode("utf-8")
+                return {"type": "image_url", "image_url": {"url": f"data:image/png;base64,{b64}"}}
         except Exception as e:
             print(f"Error reading local file: {e}")
             return None
@@ -96,34 +106,38 @@ def get_image_payload(url: str):
     # Regular HTTP URL
     return {"type": "image_url", "image_url": {"url": url}}
 
+def _read_bytes(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
 @router.post("/optimize", response_model=OptimizeResponse)
 async def optimize_badcase(req: OptimizeRequest, db: Session = Depends(get_db)):
     # 1. Setup Env Vars from DB
-    repo = SystemConfigRepo()
-    ak = repo.get(db, "volc_access_key")
-    sk = repo.get(db, "volc_secret_key")
-    ark_key = repo.get(db, "volc_api_key")
+    configs = load_configs()
+    ak = configs.get("volc_access_key")
+    sk = configs.get("volc_secret_key")
+    ark_key = configs.get("volc_api_key")
     
-    if ak and ak.value:
-        print(f"DEBUG: Setting VOLC_ACCESSKEY from DB: {ak.value[:4]}...")
-        os.environ["VOLC_ACCESSKEY"] = ak.value
-        os.environ["VOLC_ACCESS_KEY"] = ak.value
+    if ak:
+        print(f"DEBUG: Setting VOLC_ACCESSKEY from DB: {ak[:4]}...")
+        os.environ["VOLC_ACCESSKEY"] = ak
+        os.environ["VOLC_ACCESS_KEY"] = ak
     else:
         print("DEBUG: volc_access_key not found in DB")
 
-    if sk and sk.value:
-        os.environ["VOLC_SECRETKEY"] = sk.value
-        os.environ["VOLC_SECRET_KEY"] = sk.value
+    if sk:
+        os.environ["VOLC_SECRETKEY"] = sk
+        os.environ["VOLC_SECRET_KEY"] = sk
     
-    if ark_key and ark_key.value:
-        os.environ["ARK_API_KEY"] = ark_key.value
+    if ark_key:
+        os.environ["ARK_API_KEY"] = ark_key
 
     # Check for Custom Agent Endpoint first
-    custom_ep = repo.get(db, "badcase_api_endpoint")
+    custom_ep = configs.get("badcase_api_endpoint")
     should_use_local = True
-    if custom_ep and custom_ep.value:
+    if custom_ep:
         should_use_local = False
-        print(f"DEBUG: Custom Endpoint configured ({custom_ep.value}), skipping Local Agent.")
+        print(f"DEBUG: Custom Endpoint configured ({custom_ep}), skipping Local Agent.")
 
     # 2. Dynamic Import
     runner = None
@@ -157,7 +171,7 @@ async def optimize_badcase(req: OptimizeRequest, db: Session = Depends(get_db)):
             session_id = f"sess_{os.urandom(4).hex()}"
             
             prompt_text = req.prompt
-            img_payload = get_image_payload(req.image_url)
+            img_payload = await get_image_payload(req.image_url)
             if img_payload:
                 url_to_send = img_payload["image_url"]["url"]
                 prompt_text = f"Badcase Image URL: {url_to_send}\n\nPrompt: {prompt_text}"
@@ -233,27 +247,24 @@ async def optimize_badcase(req: OptimizeRequest, db: Session = Depends(get_db)):
                 checklist=["Verify flat coloring", "Check character eyes"]
             )
 
-    repo = SystemConfigRepo()
-    
     # 1. Check for Custom Agent Endpoint (User Provided)
-    custom_ep = repo.get(db, "badcase_api_endpoint")
-    custom_key = repo.get(db, "badcase_api_key")
+    custom_ep = configs.get("badcase_api_endpoint")
+    custom_key = configs.get("badcase_api_key")
     
-    if custom_ep and custom_ep.value:
-        url = custom_ep.value
+    if custom_ep:
+        url = custom_ep
         if "chat/completions" not in url:
              # Append standard Ark path if missing
              url = url.rstrip('/') + "/api/v3/chat/completions"
              
-        api_key = custom_key.value if custom_key else ""
+        api_key = custom_key or ""
         print(f"Using Custom Agent Endpoint: {url}")
         
-        agent_id_cfg = repo.get(db, "badcase_agent_id")
-        llm_ep = agent_id_cfg.value if agent_id_cfg else "custom-agent"
+        llm_ep = configs.get("badcase_agent_id") or "custom-agent"
     else:
         # Fallback to Ark
-        api_key_cfg = repo.get(db, "volc_api_key")
-        if not api_key_cfg or not api_key_cfg.value:
+        api_key = configs.get("volc_api_key")
+        if not api_key:
             # Fallback to env
             api_key = os.getenv("ARK_API_KEY")
             if not api_key:
@@ -272,24 +283,21 @@ async def optimize_badcase(req: OptimizeRequest, db: Session = Depends(get_db)):
                     optimized_prompt=f"{req.prompt}, anime style, flat color, cel shading, high quality",
                     checklist=["Verify flat coloring", "Check character eyes"]
                 )
-        else:
-            api_key = api_key_cfg.value
             
-        llm_ep_cfg = repo.get(db, "badcase_llm_endpoint")
-        llm_ep = llm_ep_cfg.value if llm_ep_cfg else "ep-20250205183353-v7b9x" 
+        llm_ep = configs.get("badcase_llm_endpoint") or "ep-20250205183353-v7b9x" 
         url = "https://ark.cn-beijing.volces.com/api/v3/chat/completions"
 
     # Construct messages
     content = [{"type": "text", "text": f"Prompt: {req.prompt}"}]
     
-    img_payload = get_image_payload(req.image_url)
+    img_payload = await get_image_payload(req.image_url)
     if img_payload:
         content.append(img_payload)
     else:
         raise HTTPException(400, "Invalid image_url")
         
     if req.reference_url:
-        ref_payload = get_image_payload(req.reference_url)
+        ref_payload = await get_image_payload(req.reference_url)
         if ref_payload:
             content.append({"type": "text", "text": "Reference Image:"})
             content.append(ref_payload)
@@ -317,11 +325,11 @@ async def optimize_badcase(req: OptimizeRequest, db: Session = Depends(get_db)):
             resp = await client.post(url, json=payload, headers=headers)
             
             # Fallback for Native AgentKit API (if OpenAI format fails with 404/400)
-            if resp.status_code != 200 and custom_ep and custom_ep.value:
+            if resp.status_code != 200 and custom_ep:
                 print(f"OpenAI format failed ({resp.status_code}), trying Native AgentKit format...")
                 
                 # Construct Native Payload
-                img_p = get_image_payload(req.image_url)
+                img_p = await get_image_payload(req.image_url)
                 final_url = ""
                 
                 if img_p:
@@ -329,10 +337,9 @@ async def optimize_badcase(req: OptimizeRequest, db: Session = Depends(get_db)):
                     # If Base64 (Local File), Upload to TOS
                     if final_url.startswith("data:") and req.image_url.startswith("/static/"):
                         try:
-                            local_path = f"backend/app{req.image_url}"
-                            if os.path.exists(local_path):
-                                with open(local_path, "rb") as f:
-                                    file_content = f.read()
+                            local_path, _ = await media_cache.local_copy(req.image_url, "badcase")
+                            if local_path:
+                                file_content = await io_pools.run("file", _read_bytes, local_path)
                                 storage = StorageService(db)
                                 filename = os.path.basename(local_path)
                                 # Use task_id=0, type='badcase_temp'
@@ -356,7 +363,7 @@ async def optimize_badcase(req: OptimizeRequest, db: Session = Depends(get_db)):
                     "session_id": f"sess_{os.urandom(4).hex()}"
                 }
                 
-                base_url = custom_ep.value
+                base_url = custom_ep
                 # Try Base URL
                 resp = await client.post(base_url, json=native_payload, headers=native_headers)
                 
@@ -2,12 +2,12 @@ from fastapi import APIRouter, Depends, HTTPException, Body, UploadFile, File
 from sqlalchemy.orm import Session
 from ..db import get_db
 from ..models.best_practice import BestPractice
+from ..services.blob_singleton import blobs
 from pydantic import BaseModel
 from typing import Optional, List
 import time
 import shutil
 import os
-import uuid
 
 router = APIRouter(prefix="/api/best_practices", tags=["best_practices"])
 
@@ -44,25 +44,20 @@ async def upload_best_practice_file(file: UploadFile = File(...)):
     if ext not in allowed_exts:
         raise HTTPException(400, "Invalid file format. Allowed: Image/Video")
     
-    # Path: backend/app/static/best_practices
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-    app_dir = os.path.dirname(current_dir)
-    upload_dir = os.path.join(app_dir, "static", "best_practices")
-    
-    if not os.path.exists(upload_dir):
-        os.makedirs(upload_dir)
-        
-    unique_name = f"{uuid.uuid4()}{ext}"
-    file_path = os.path.join(upload_dir, unique_name)
-    
+    # Stored by content (static/blobs); the same file uploaded twice is kept once
+    tmp_path = blobs.incoming_path()
     try:
-        with open(file_path, "wb") as buffer:
+        with open(tmp_path, "wb") as buffer:
             shutil.copyfileobj(file.file, buffer)
+        blob = await blobs.put_file(tmp_path, filename, move=True, remote=False)
     except Exception as e:
         print(f"Upload failed: {e}")
         raise HTTPException(500, f"File save failed: {e}")
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
         
-    return {"url": f"/static/best_practices/{unique_name}"}
+    return {"url": f"/{blob.local_path}"}
 
 @router.post("", response_model=BestPracticeRead)
 def create_best_practice(item: BestPracticeCreate, db: Session = Depends(get_db)):
@@ -74,6 +69,7 @@ def create_best_practice(item: BestPracticeCreate, db: Session = Depends(get_db)
         db.add(db_item)
         db.commit()
         db.refresh(db_item)
+        blobs.ref_urls(db, [db_item.url], "best_practice", db_item.id, "media")
         return db_item
     except Exception as e:
         print(f"DEBUG: Create failed: {e}")
@@ -86,4 +82,5 @@ def delete_best_practice(id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="Not found")
     db.delete(item)
     db.commit()
+    blobs.release_blocking(db, "best_practice", id, reason="best_practice_deleted")
     return {"status": "success"}
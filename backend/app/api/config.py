@@ -5,7 +5,15 @@ from ..db import SessionLocal
 from ..repositories.model_repo import ModelConfigRepo
 from ..models.model_config import ModelConfig
 from ..services.worker_singleton import worker
-from ..services.token_bucket import TokenBucket
+from ..services.http_singleton import http_clients
+from ..services.io_singleton import io_pools, loop_monitor
+from ..services.config_singleton import config_cache
+from ..services.tos_singleton import tos_clients, signed_urls
+from ..services.blob_singleton import blobs
+from ..services.media_singleton import media_cache
+from ..services.gc_singleton import storage_gc
+from ..services.stitch_singleton import stitch_engine
+from ..services.mezzanine_singleton import mezzanines
 from ..repositories.system_config_repo import SystemConfigRepo
 from ..schemas.system_config import SystemConfigOut, SystemConfigIn
 from ..services.llm_models.manager import model_manager
@@ -32,28 +40,28 @@ def list_models():
     db.close()
     return out
 
+# Limiters live on the event loop, so the model endpoints are async and hop to the db pool for writes
 @router.post("/models", response_model=ModelConfigOut)
-def create_model(payload: ModelConfigIn):
+async def create_model(payload: ModelConfigIn):
     db: Session = SessionLocal()
     repo = ModelConfigRepo()
-    mc = repo.create(db, payload.dict())
-    worker.buckets[mc.id] = TokenBucket(mc.concurrency_quota)
+    mc = await io_pools.run("db", repo.create, db, payload.dict())
+    worker.configure_model(mc)
     db.close()
     return ModelConfigOut(id=mc.id, name=mc.name, endpoint_id=mc.endpoint_id, type=mc.type, concurrency_quota=mc.concurrency_quota, request_quota=mc.request_quota)
 
 @router.put("/models/{model_id}", response_model=ModelConfigOut)
-def update_model(model_id: int, payload: ModelConfigIn):
+async def update_model(model_id: int, payload: ModelConfigIn):
     db: Session = SessionLocal()
     repo = ModelConfigRepo()
-    mc = repo.update(db, model_id, payload.dict())
+    mc = await io_pools.run("db", repo.update, db, model_id, payload.dict())
     if not mc:
         db.close()
         raise HTTPException(status_code=404, detail="Model not found")
     
-    # Update token bucket if concurrency quota changed
-    if mc.concurrency_quota:
-         worker.buckets[mc.id] = TokenBucket(mc.concurrency_quota)
-         
+    # Resize in place: replacing the bucket would lose track of jobs already holding slots
+    worker.configure_model(mc)
+
     db.close()
     return ModelConfigOut(id=mc.id, name=mc.name, endpoint_id=mc.endpoint_id, type=mc.type, concurrency_quota=mc.concurrency_quota, request_quota=mc.request_quota)
 
@@ -71,5 +79,101 @@ def update_system_config(payload: SystemConfigIn):
     db: Session = SessionLocal()
     repo = SystemConfigRepo()
     c = repo.set(db, payload.key, payload.value, payload.description)
+    # Reload now in this process; other workers see the bumped version on their next check
+    config_cache.invalidate(db)
     db.close()
     return SystemConfigOut(key=c.key, value=c.value, description=c.description)
+
+@router.get("/http-pools")
+def http_pool_stats():
+    """Connection reuse per client profile and upstream host."""
+    return http_clients.stats()
+
+@router.get("/rate-limits")
+async def rate_limit_stats():
+    """Per-model limiter state: slots in use, waiters, remaining request tokens."""
+    return worker.limits()
+
+@router.get("/adaptive-concurrency")
+def adaptive_concurrency_stats():
+    """Effective per-model concurrency chosen by the AIMD controller and its recent decisions."""
+    return worker.adaptive.stats()
+
+@router.get("/result-cache")
+def result_cache_stats():
+    """Hit rate, coalesced requests and size of the generation result cache."""
+    db: Session = SessionLocal()
+    try:
+        return worker.result_cache.stats(db)
+    finally:
+        db.close()
+
+@router.get("/config-cache")
+def config_cache_stats():
+    """Version and reload count of the in-process SystemConfig cache."""
+    return config_cache.stats()
+
+@router.get("/tos-pool")
+def tos_pool_stats():
+    """Pooled TOS clients and the pre-signed URL cache."""
+    return {"clients": tos_clients.stats(), "signed_urls": signed_urls.stats()}
+
+@router.get("/blobs")
+def blob_stats():
+    """Content-addressed storage: stored blobs, references, and uploads skipped as duplicates."""
+    db: Session = SessionLocal()
+    try:
+        return blobs.stats(db)
+    finally:
+        db.close()
+
+@router.get("/media-cache")
+def media_cache_stats():
+    """Local media cache: bytes against the budget, evictions, pins, hit/miss per consumer (stitch, badcase)."""
+    return media_cache.stats()
+
+@router.get("/storage-gc")
+def storage_gc_stats():
+    """Pending storage tombstones, batched deletes and failures, last reconciliation."""
+    db: Session = SessionLocal()
+    try:
+        return storage_gc.stats(db)
+    finally:
+        db.close()
+
+@router.post("/storage-gc/reconcile")
+def storage_gc_reconcile():
+    """Compare the database with the bucket and local disk now and tombstone orphans."""
+    db: Session = SessionLocal()
+    try:
+        return storage_gc.reconcile(db)
+    finally:
+        db.close()
+
+@router.get("/stitch")
+async def stitch_stats():
+    """Stitch workers, jobs queued/processing and the progress of the ones running here."""
+    return await stitch_engine.stats()
+
+@router.get("/mezzanines")
+def mezzanine_stats():
+    """Mezzanine transcodes by status, and how many stitch clips were served from one."""
+    db: Session = SessionLocal()
+    try:
+        return mezzanines.stats(db)
+    finally:
+        db.close()
+
+@router.post("/mezzanines/backfill")
+def mezzanine_backfill(limit: int = 1000):
+    """Queue mezzanines for the most recent succeeded video tasks that have none."""
+    db: Session = SessionLocal()
+    try:
+        return mezzanines.backfill(db, limit)
+    finally:
+        db.close()
+
+@router.get("/loop-lag")
+def loop_lag_stats():
+    """Event loop stalls (with the coroutine that held the loop) and blocking I/O pool usage."""
+    return {"loop": loop_monitor.stats(), "io_pools": io_pools.stats()}
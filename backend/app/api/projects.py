@@ -5,10 +5,30 @@ from typing import List, Optional, Dict, Any
 from pydantic import BaseModel
 from ..db import get_db
 from ..repositories.project_repo import ProjectRepo
+from ..services.media_singleton import media_cache
+from .. import settings
 
 router = APIRouter()
 repo = ProjectRepo()
 
+def _media_urls(value):
+    """Strings in project data that may point at media (scene images, clips)."""
+    if isinstance(value, dict):
+        for v in value.values():
+            yield from _media_urls(v)
+    elif isinstance(value, list):
+        for v in value:
+            yield from _media_urls(v)
+    elif isinstance(value, str) and (value.startswith("http") or value.startswith("/api/storage/redirect")):
+        yield value
+
+def _pin_media(data: Optional[Dict[str, Any]]):
+    # Media of a project being worked on stays in the local cache for a while
+    try:
+        media_cache.pin_urls(_media_urls(data or {}), settings.MEDIA_CACHE_PROJECT_PIN_SECONDS)
+    except Exception as e:
+        print(f"Project media pin failed: {e}")
+
 class ProjectCreate(BaseModel):
     title: str
     cover_image: Optional[str] = None
@@ -21,6 +41,7 @@ class ProjectUpdate(BaseModel):
 
 @router.post("", response_model=Dict[str, Any])
 def create_project(req: ProjectCreate, db: Session = Depends(get_db)):
+    _pin_media(req.data)
     return repo.create(db, req.title, req.cover_image, req.data).to_dict()
 
 @router.get("", response_model=List[Dict[str, Any]])
@@ -45,6 +66,7 @@ def update_project(project_id: str, req: ProjectUpdate, db: Session = Depends(ge
     title = req.title or p.title
     cover = req.cover_image or p.cover_image
     data = req.data or {} # In real app, might want to merge
+    _pin_media(data)
     
     return repo.update(db, project_id, title, cover, data).to_dict()
 
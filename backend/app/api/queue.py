@@ -1,7 +1,12 @@
 from fastapi import APIRouter
+from ..services.worker_singleton import worker
 
 router = APIRouter(prefix="/api/queue", tags=["queue"])
 
 @router.post("/callback")
 def callback():
     return {"ok": True}
+
+@router.get("/stats")
+def queue_stats():
+    return worker.stats()
@@ -4,7 +4,7 @@ import json
 import os
 import aiofiles
 from typing import Optional
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query, Response
 from sqlalchemy.orm import Session
 from ..schemas.task import CreateTaskRequest, TaskOut
 from .deps import get_current_user
@@ -14,13 +14,74 @@ from ..services.task_service import TaskService
 from ..models.model_config import ModelConfig
 from ..services.worker_singleton import worker
 from ..services.storage_service import StorageService
+from ..services.io_singleton import io_pools
+from ..services.fair_scheduler import normalize_priority
+from ..services.upload_service import UploadService, is_upload_ref
+from ..services.input_staging import InputStager, decode_data_uri
+from ..services.blob_store import is_blob_url
+from ..services.blob_singleton import blobs
+from ..services.gc_singleton import storage_gc
+from .. import settings
 import base64
 
 router = APIRouter(prefix="/api/tasks", tags=["tasks"])
 
+CANCELLABLE_STATUSES = ("queued", "running")
+
+def _upstream_payload(m: ModelConfig, payload: CreateTaskRequest, images: list) -> dict:
+    if payload.type == "image":
+        return {"model": m.name, "prompt": payload.prompt or "", "images": images, "size": payload.size}
+    # Construct content payload for video tasks
+    content = []
+    
+    # 1. Add text prompt
+    if payload.prompt:
+        content.append({"type": "text", "text": payload.prompt})
+    
+    # 2. Add images with roles (first_frame, last_frame)
+    # Logic: If 1 image -> first_frame
+    #        If 2 images -> first_frame, last_frame
+    if images:
+        if len(images) >= 1:
+            content.append({
+                "type": "image_url", 
+                "image_url": {"url": images[0]},
+                "role": "first_frame"
+            })
+        if len(images) >= 2:
+            content.append({
+                "type": "image_url", 
+                "image_url": {"url": images[1]},
+                "role": "last_frame"
+            })
+    
+    p = {"model": m.name, "content": content}
+    if payload.params:
+        p.update(payload.params)
+    return p
+
+def _resolve_uploads(db: Session, refs: list, user_id: int) -> dict:
+    """ref -> (stored url, content identity)."""
+    service = UploadService(db)
+    out = {}
+    for ref in refs:
+        u = service.resolve(ref, user_id)
+        out[ref] = (u.url, service.identity(u))
+    return out
+
 @router.post("", response_model=TaskOut)
 async def create_task(payload: CreateTaskRequest, user=Depends(get_current_user)):
+    priority = normalize_priority(payload.priority)
+    if not priority:
+        raise HTTPException(status_code=400, detail=f"Unknown priority: {payload.priority}")
     db: Session = SessionLocal()
+    # Object references from /api/uploads are checked before anything is written
+    refs = [img for img in payload.images or [] if is_upload_ref(img)]
+    try:
+        resolved = await io_pools.run("db", _resolve_uploads, db, refs, user.get("id")) if refs else {}
+    except ValueError as e:
+        db.close()
+        raise HTTPException(status_code=400, detail=str(e))
     repo = TaskRepo()
     service = TaskService(repo)
     data = {
@@ -32,7 +93,8 @@ async def create_task(payload: CreateTaskRequest, user=Depends(get_current_user)
         "status": "queued",
         "created_at": int(time.time()),
     }
-    t = service.create_task(db, data)
+    t = await io_pools.run("db", service.create_task, db, data)
+    task_id = t.id # read once; attributes expire on the commit below
     
     # Upload inputs to Storage
     storage = StorageService(db)
@@ -40,46 +102,39 @@ async def create_task(payload: CreateTaskRequest, user=Depends(get_current_user)
     
     # Upload Prompt
     if payload.prompt:
-        await storage.upload_content(payload.prompt, t.id, payload.type, "prompt.txt")
+        await storage.upload_content(payload.prompt, task_id, payload.type, "prompt.txt", role="prompt")
     
-    # Upload Images
+    # Stage Images: each distinct image is stored once by content; the queued payload
+    # only carries its URL, which the worker signs (or inlines) right before the upstream call
     content_images = []
+    cache_images = [] # same images by content identity, for the result cache key
     if payload.images:
+        stager = InputStager(storage)
         for i, img_str in enumerate(payload.images):
+            if is_upload_ref(img_str):
+                # Already in storage via /api/uploads
+                url, identity = resolved[img_str]
+                if identity.startswith("sha256:"):
+                    await io_pools.run("db", blobs.ref, db, identity[7:], "task", task_id, "input")
+                uploaded_images.append(url)
+                content_images.append(url)
+                cache_images.append(identity)
             # Check if base64
-            if img_str.startswith("data:image"):
-                # Decode base64
+            elif img_str.startswith("data:image"):
                 try:
-                    header, encoded = img_str.split(",", 1)
-                    
-                    # Ensure MIME type is lowercase (e.g. data:image/PNG -> data:image/png)
-                    # Volcengine requires lowercase image format
-                    mime_part = header.split(";")[0]
-                    if mime_part != mime_part.lower():
-                        header = mime_part.lower() + ";base64"
-                        
-                    # Remove newlines/carriage returns from base64 string
-                    encoded = encoded.replace("\n", "").replace("\r", "")
-                    
-                    # Reconstruct standardized Data URI
-                    img_str = f"{header},{encoded}"
-                    
-                    image_data = base64.b64decode(encoded)
-                    ext = header.split(";")[0].split("/")[1]
-                    filename = f"input_{i}.{ext}"
-                    url = await storage.upload_content(image_data, t.id, payload.type, filename)
+                    # Volcengine requires a lowercase image format; decode_data_uri normalizes it
+                    image_data, mime = decode_data_uri(img_str)
+                    url, identity = await stager.stage(image_data, mime, owner=("task", task_id, "input"))
                     uploaded_images.append(url)
-                    # User requirement: Pass base64 directly to API, keeping the prefix
-                    # Documentation says: data:image/<type>;base64,<data>
-                    # Note <type> must be lowercase.
-                    # Frontend usually sends "data:image/png;base64,...", which is correct.
-                    content_images.append(img_str)
+                    content_images.append(url)
+                    cache_images.append(identity)
                 except Exception as e:
-                    print(f"Failed to upload image {i}: {e}")
-                    # Even if upload fails, we try to pass base64 to API
+                    print(f"Failed to stage image {i}: {e}")
+                    # Even if staging fails, we try to pass base64 to API
                     content_images.append(img_str)
+                    cache_images.append(img_str)
             else:
-                # Not a base64 string, reject it.
+                # Not a base64 string (nor an /api/uploads reference), reject it.
                 # User requirement: Backend accepts only base64 data.
                 print(f"Error: Received non-base64 image input at index {i}")
                 # We do NOT append to content_images, effectively dropping it.
@@ -89,69 +144,87 @@ async def create_task(payload: CreateTaskRequest, user=Depends(get_current_user)
     
     # Update DB with uploaded URLs
     t.input_images = json.dumps(uploaded_images)
-    db.commit()
+    await io_pools.run("db", db.commit)
     
-    m = db.query(ModelConfig).get(payload.model_id)
+    m = await io_pools.run("db", db.get, ModelConfig, payload.model_id)
     if m:
-        if payload.type == "image":
-            p = {"model": m.name, "prompt": payload.prompt or "", "images": content_images, "size": payload.size}
-        else:
-            # Construct content payload for video tasks
-            content = []
-            
-            # 1. Add text prompt
-            if payload.prompt:
-                content.append({"type": "text", "text": payload.prompt})
-            
-            # 2. Add images with roles (first_frame, last_frame)
-            # Logic: If 1 image -> first_frame
-            #        If 2 images -> first_frame, last_frame
-            if content_images:
-                if len(content_images) >= 1:
-                    content.append({
-                        "type": "image_url", 
-                        "image_url": {"url": content_images[0]},
-                        "role": "first_frame"
-                    })
-                if len(content_images) >= 2:
-                    content.append({
-                        "type": "image_url", 
-                        "image_url": {"url": content_images[1]},
-                        "role": "last_frame"
-                    })
-            
-            p = {"model": m.name, "content": content}
-            if payload.params:
-                p.update(payload.params)
-        asyncio.create_task(worker.enqueue(t.id, payload.model_id, payload.type, p))
+        p = _upstream_payload(m, payload, content_images)
+        # Persisted before returning so queued work survives restarts/redeploys
+        cache_key = None
+        if worker.result_cache.enabled:
+            cache_key = await io_pools.run("file", worker.result_cache.key_for, payload.model_id, payload.type,
+                                           _upstream_payload(m, payload, cache_images))
+        await io_pools.run(
+            "db", worker.submit, db, task_id, payload.model_id, payload.type, p,
+            priority, user.get("id"), payload.project_id, cache_key, payload.use_cache is not False
+        )
+    positions = await io_pools.run("db", worker.queue_positions, db, [task_id])
     db.close()
-    return TaskOut(id=str(t.id), status="queued", type=payload.type, created_at=data["created_at"], prompt=data["prompt"], input_images=uploaded_images)
+    position, wait = positions.get(task_id, (None, None))
+    return TaskOut(id=str(task_id), status="queued", type=payload.type, created_at=data["created_at"], prompt=data["prompt"], input_images=uploaded_images,
+                   queue_position=position, estimated_wait_seconds=wait)
+
+def _encode_cursor(t) -> str:
+    return base64.urlsafe_b64encode(f"{t.created_at}:{t.id}".encode()).decode()
+
+def _decode_cursor(cursor: str):
+    try:
+        created_at, task_id = base64.urlsafe_b64decode(cursor.encode()).decode().split(":")
+        return int(created_at), int(task_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def _parse_json_list(value: Optional[str]):
+    if not value:
+        return None
+    try:
+        return json.loads(value)
+    except:
+        return value.split(",")
 
 @router.get("", response_model=list[TaskOut])
-def list_tasks(user=Depends(get_current_user)):
+def list_tasks(
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=500, description="Page size; omit for the full list"),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor value from the previous page"),
+    type: Optional[str] = None,
+    status: Optional[str] = Query(None, description="Comma-separated statuses"),
+    model_id: Optional[int] = None,
+    since: Optional[int] = Query(None, description="created_at >= since (unix seconds)"),
+    until: Optional[int] = Query(None, description="created_at < until (unix seconds)"),
+    fields: Optional[str] = Query(None, description="'light' omits prompt and input_images"),
+    user=Depends(get_current_user),
+):
+    """
+    Tasks newest first, ordered and paginated by the DB on (created_at, id).
+    When more rows exist, the cursor for the next page is returned in the X-Next-Cursor header.
+    """
+    light = fields == "light"
+    after = _decode_cursor(cursor) if cursor else None
     db: Session = SessionLocal()
     repo = TaskRepo()
     storage = StorageService(db)
-    tasks = repo.list_by_user(db, 1)
+    tasks = repo.list_page(
+        db, 1, limit=limit + 1 if limit else None, after=after, light=light,
+        task_type=type, status=status, model_id=model_id, since=since, until=until,
+    )
+    if limit and len(tasks) > limit:
+        tasks = tasks[:limit]
+        response.headers["X-Next-Cursor"] = _encode_cursor(tasks[-1])
+    positions = worker.queue_positions(db, [t.id for t in tasks if t.status == "queued"])
     out = []
     for t in tasks:
-        try:
-            urls = json.loads(t.result_urls) if t.result_urls else None
-        except:
-            urls = t.result_urls.split(",") if t.result_urls else None
-            
+        urls = _parse_json_list(t.result_urls)
         # Refresh result URLs
         if urls:
             urls = [storage.refresh_signed_url(u) for u in urls]
-            
-        try:
-            in_imgs = json.loads(t.input_images) if t.input_images else None
-        except:
-            in_imgs = t.input_images.split(",") if t.input_images else None
-            
-        # Refresh input URLs
-        if in_imgs:
-            in_imgs = [storage.refresh_signed_url(u) for u in in_imgs]
+
+        in_imgs = None
+        if not light:
+            in_imgs = _parse_json_list(t.input_images)
+            # Refresh input URLs
+            if in_imgs:
+                in_imgs = [storage.refresh_signed_url(u) for u in in_imgs]
 
         # Refresh video URLs
         video_url = storage.refresh_signed_url(t.video_url)
@@ -168,67 +241,140 @@ def list_tasks(user=Depends(get_current_user)):
             created_at=t.created_at,
             finished_at=t.finished_at,
             input_images=in_imgs,
-            prompt=t.prompt,
+            prompt=None if light else t.prompt,
             resolution=t.resolution,
             ratio=t.ratio,
-            duration=t.duration
+            duration=t.duration,
+            queue_position=positions.get(t.id, (None, None))[0] if t.status == "queued" else None,
+            estimated_wait_seconds=positions.get(t.id, (None, None))[1] if t.status == "queued" else None
         ))
-    out.reverse() # Show newest first
     db.close()
     return out
 
+# (filters) -> (expires_at, count); counting is a full scan of the user's rows, so it is cached briefly
+_count_cache: dict = {}
+
+@router.get("/count")
+def count_tasks(
+    type: Optional[str] = None,
+    status: Optional[str] = None,
+    model_id: Optional[int] = None,
+    since: Optional[int] = None,
+    until: Optional[int] = None,
+    user=Depends(get_current_user),
+):
+    key = (type, status, model_id, since, until)
+    now = time.time()
+    hit = _count_cache.get(key)
+    if hit and hit[0] > now:
+        return {"total": hit[1], "cached": True}
+    db: Session = SessionLocal()
+    try:
+        total = TaskRepo().count(db, 1, task_type=type, status=status, model_id=model_id, since=since, until=until)
+    finally:
+        db.close()
+    if len(_count_cache) > 1000:
+        _count_cache.clear()
+    _count_cache[key] = (now + settings.TASK_COUNT_CACHE_SECONDS, total)
+    return {"total": total, "cached": False}
+
 @router.delete("")
-def clear_tasks(type: Optional[str] = None, user=Depends(get_current_user)):
+def clear_tasks(background_tasks: BackgroundTasks, type: Optional[str] = None, user=Depends(get_current_user)):
     db: Session = SessionLocal()
     repo = TaskRepo()
-    # TODO: Also delete files from storage for all tasks?
-    # Current implementation only clears DB records.
-    repo.clear_all(db, 1, type)
-    db.close()
+    try:
+        cleared = repo.clear_all(db, 1, type)
+        worker.queue_repo.delete_for_tasks(db, [row[0] for row in cleared])
+    finally:
+        db.close()
+    # Rows are gone; cached results and files are released after the response is sent
+    background_tasks.add_task(_release_cleared, cleared)
     return {"message": "All tasks cleared"}
 
+def _release_cleared(cleared: list):
+    db: Session = SessionLocal()
+    try:
+        for row in cleared:
+            try:
+                worker.result_cache.invalidate_task(db, row[0])
+                _release_task_files(db, *row, reason="tasks_cleared")
+            except Exception as e:
+                db.rollback()
+                print(f"Warning: Failed to release files of cleared task {row[0]}: {e}")
+    finally:
+        db.close()
+
+@router.post("/{task_id}/cancel", response_model=TaskOut)
+async def cancel_task(task_id: int, user=Depends(get_current_user)):
+    db: Session = SessionLocal()
+    repo = TaskRepo()
+    try:
+        task = await io_pools.run("db", repo.get, db, task_id)
+        if not task:
+            raise HTTPException(status_code=404, detail="Task not found")
+        if task.status not in CANCELLABLE_STATUSES:
+            raise HTTPException(status_code=409, detail=f"Task is already {task.status}")
+        ttype, model_id, created_at, prompt = task.type, task.model_id, task.created_at, task.prompt
+        await worker.cancel(task_id, ttype)
+        return TaskOut(id=str(task_id), status="cancelled", type=ttype, model_id=model_id, created_at=created_at, prompt=prompt)
+    finally:
+        db.close()
+
+def _legacy_urls(urls) -> list:
+    """URLs stored outside the blob store, which are deleted by URL rather than by refcount."""
+    return [u for u in urls if u and not is_blob_url(u)]
+
+def _url_list(value) -> list:
+    if not value:
+        return []
+    try:
+        return json.loads(value)
+    except:
+        return value.split(",")
+
+def _release_task_files(db: Session, task_id: int, result_urls, input_images, video_url, last_frame_url,
+                        reason: str = "task_deleted") -> None:
+    """
+    Tombstone a task's files for the storage GC (nothing is deleted inline).
+    Content-addressed files may be shared with other tasks, assets or best practices;
+    only blobs whose last reference was this task are released.
+    """
+    repo = TaskRepo()
+    blobs.release_blocking(db, "task", task_id, reason=reason)
+    # Files stored before the blob store existed go by URL (outputs may be shared
+    # with tasks served from the result cache, inputs with tasks using the same image)
+    outputs = _legacy_urls(_url_list(result_urls) + [video_url, last_frame_url])
+    urls = [u for u in outputs if not repo.is_output_shared(db, u, task_id)]
+    urls += [u for u in _legacy_urls(_url_list(input_images)) if not repo.is_input_shared(db, u, task_id)]
+    storage_gc.bury_urls(db, urls, reason)
+
 @router.delete("/{task_id}")
 async def delete_task(task_id: int, user=Depends(get_current_user)):
     db: Session = SessionLocal()
     repo = TaskRepo()
-    storage = StorageService(db)
-    
-    # 1. Get task info to find associated files
-    task = repo.get(db, task_id)
-    if not task:
-        db.close()
-        return {"message": "Task not found"}
-        
-    # 2. Delete files from storage
     try:
-        # Handle result_urls
-        if task.result_urls:
-            try:
-                urls = json.loads(task.result_urls)
-            except:
-                urls = task.result_urls.split(",")
-            for url in urls:
-                await storage.delete_file(url)
-                
-        # Handle input_images
-        if task.input_images:
-            try:
-                inputs = json.loads(task.input_images)
-            except:
-                inputs = task.input_images.split(",")
-            for url in inputs:
-                await storage.delete_file(url)
-                
-        # Handle video files
-        if task.video_url:
-            await storage.delete_file(task.video_url)
-        if task.last_frame_url:
-            await storage.delete_file(task.last_frame_url)
-    except Exception as e:
-        print(f"Warning: Failed to delete some files for task {task_id}: {e}")
-        # Proceed to delete DB record anyway
-
-    # 3. Delete from DB
-    repo.delete(db, task_id)
-    db.close()
-    return {"message": f"Task {task_id} deleted"}
+        task = await io_pools.run("db", repo.get, db, task_id)
+        if not task:
+            return {"message": "Task not found"}
+
+        # Stop its job/polling and free the slot before the row and files disappear
+        if task.status in CANCELLABLE_STATUSES:
+            await worker.cancel(task_id, task.type)
+
+        # Cached results point at this task's files; forget them before the files go
+        await io_pools.run("db", worker.result_cache.invalidate_task, db, task_id)
+
+        # Files are tombstoned and deleted by the storage GC in the background
+        try:
+            await io_pools.run("db", _release_task_files, db, task_id, task.result_urls, task.input_images,
+                               task.video_url, task.last_frame_url)
+        except Exception as e:
+            db.rollback()
+            print(f"Warning: Failed to release some files for task {task_id}: {e}")
+            # Proceed to delete DB record anyway; reconciliation picks up what was missed
+
+        await io_pools.run("db", repo.delete, db, task_id)
+        await io_pools.run("db", worker.queue_repo.delete_for_tasks, db, [task_id])
+        return {"message": f"Task {task_id} deleted"}
+    finally:
+        db.close()
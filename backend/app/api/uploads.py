@@ -0,0 +1,112 @@
+import os
+from fastapi import APIRouter, Depends, HTTPException, Request
+from sqlalchemy.orm import Session
+from .deps import get_current_user
+from ..db import SessionLocal
+from ..repositories.upload_session_repo import UploadSessionRepo
+from ..schemas.upload import UploadStartRequest, UploadStartResponse, UploadCompleteRequest, UploadOut
+from ..services.upload_service import UploadService, REF_PREFIX
+from ..services.asset_service import AssetService
+from ..services.io_singleton import io_pools
+from ..services.blob_singleton import blobs
+
+router = APIRouter(prefix="/api/uploads", tags=["uploads"])
+
+IMAGE_EXTS = (".jpg", ".jpeg", ".png", ".gif", ".webp")
+
+def _out(s, asset: dict = None) -> UploadOut:
+    return UploadOut(id=s.id, ref=REF_PREFIX + s.id, status=s.status, purpose=s.purpose, filename=s.filename,
+                     size=s.size, url=s.url, asset=asset)
+
+def _owned(db: Session, session_id: str, user_id: int):
+    s = UploadSessionRepo().get(db, session_id)
+    if not s or s.user_id != user_id:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    return s
+
+def _start(user_id: int, req: UploadStartRequest) -> dict:
+    db: Session = SessionLocal()
+    try:
+        return UploadService(db).start(user_id, req.filename, req.content_type, req.size, req.purpose)
+    finally:
+        db.close()
+
+def _register_asset(db: Session, s, asset_type: str) -> dict:
+    is_image = os.path.splitext(s.filename)[1].lower() in IMAGE_EXTS
+    meta = {"url": s.url, "original_name": s.filename, "upload_id": s.id}
+    if s.backend == "local":
+        meta["file_path"] = UploadService(db).local_path(s)
+    else:
+        meta["object_key"] = s.object_key
+    asset = AssetService(db).create_asset(user_id=s.user_id, asset_data={
+        "name": s.filename,
+        "type": asset_type or "script",
+        "source": "user_upload",
+        "cover_image": s.url if is_image else "",
+        "metadata": meta,
+    })
+    if s.sha256:
+        blobs.ref(db, s.sha256, "asset", asset["asset_id"], "media")
+    return asset
+
+def _complete(session_id: str, user_id: int, req: UploadCompleteRequest) -> UploadOut:
+    db: Session = SessionLocal()
+    try:
+        s = _owned(db, session_id, user_id)
+        was_completed = s.status == "completed"
+        parts = [p.dict() for p in req.parts] if req.parts else None
+        s = UploadService(db).complete(s, parts)
+        asset = None
+        if s.purpose == "asset" and not was_completed:
+            asset = _register_asset(db, s, req.asset_type)
+        return _out(s, asset)
+    finally:
+        db.close()
+
+def _get(session_id: str, user_id: int) -> UploadOut:
+    db: Session = SessionLocal()
+    try:
+        return _out(_owned(db, session_id, user_id))
+    finally:
+        db.close()
+
+@router.post("", response_model=UploadStartResponse)
+async def start_upload(req: UploadStartRequest, user=Depends(get_current_user)):
+    """
+    Open an upload session. PUT the file to `url` (or each slice to `parts[i].url`
+    for multipart), then POST /api/uploads/{id}/complete. Pass `ref` as a task image.
+    """
+    try:
+        return await io_pools.run("storage", _start, user["id"], req)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.put("/{session_id}/content")
+async def put_local_content(session_id: str, request: Request, user=Depends(get_current_user)):
+    """Upload target for storage_type local: the body is streamed to disk, never held in memory."""
+    db: Session = SessionLocal()
+    try:
+        s = await io_pools.run("db", _owned, db, session_id, user["id"])
+        if s.backend != "local" or s.status != "pending":
+            raise HTTPException(status_code=409, detail="Upload session does not accept content")
+        service = UploadService(db)
+        try:
+            size, sha256 = await service.receive_local(s, request.stream())
+        except ValueError as e:
+            raise HTTPException(status_code=413, detail=str(e))
+        await io_pools.run("db", service.repo.set_digest, db, session_id, size, sha256)
+        return {"id": session_id, "size": size, "sha256": sha256}
+    finally:
+        db.close()
+
+@router.post("/{session_id}/complete", response_model=UploadOut)
+async def complete_upload(session_id: str, req: UploadCompleteRequest = None, user=Depends(get_current_user)):
+    """Confirm the object is in storage (assembling multipart uploads) and register it."""
+    try:
+        return await io_pools.run("storage", _complete, session_id, user["id"], req or UploadCompleteRequest())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/{session_id}", response_model=UploadOut)
+async def get_upload(session_id: str, user=Depends(get_current_user)):
+    return await io_pools.run("db", _get, session_id, user["id"])
@@ -1,296 +1,62 @@
-from fastapi import APIRouter, HTTPException, BackgroundTasks
-from pydantic import BaseModel
-from typing import List
-import subprocess
 import os
-import uuid
-import httpx
-import base64
 from typing import List, Optional
-from fastapi import APIRouter, BackgroundTasks, HTTPException
+from fastapi import APIRouter, HTTPException, Query
 from pydantic import BaseModel
-import uuid
-import os
-import httpx
-import shutil
-import asyncio
-import subprocess
-from ..agents.editor_agent import EditorAgent
+from ..db import SessionLocal
+from ..services.blob_singleton import blobs
+from ..services.hls_singleton import hls
+from ..services.io_singleton import io_pools
+from ..services.stitch_singleton import stitch_engine
 
 router = APIRouter(prefix="/api/video", tags=["video"])
 
-# Initialize Agent
-editor_agent = EditorAgent()
-
 class StitchRequest(BaseModel):
     video_urls: List[str]
-    video_base64: Optional[List[str]] = None
-
-async def download_file_robust(url: str, dest: str) -> bool:
-    print(f"Downloading {url} to {dest}")
-    
-    # Strategy 1: HTTPX
-    try:
-        async with httpx.AsyncClient(verify=False, follow_redirects=True) as client:
-            resp = await client.get(url, timeout=30.0)
-            if resp.status_code == 200:
-                with open(dest, "wb") as f:
-                    f.write(resp.content)
-                print("Download success (httpx)")
-                return True
-            print(f"HTTPX failed: {resp.status_code}")
-    except Exception as e:
-        print(f"HTTPX error: {e}")
-
-    # Strategy 2: Curl
-    try:
-        print("Trying curl...")
-        subprocess.run(["curl", "-L", "-k", "-o", dest, url], check=True, timeout=60, capture_output=True)
-        if os.path.exists(dest) and os.path.getsize(dest) > 0:
-            print("Download success (curl)")
-            return True
-    except Exception as e:
-        print(f"Curl error: {e}")
-
-    return False
-
-stitch_tasks = {}
+    video_base64: Optional[List[str]] = None # accepted for older clients; clips are fetched by URL
 
 class StitchResponse(BaseModel):
     task_id: str
     status: str
     result_url: str = ""
 
-# Simple in-memory task store
-stitch_tasks = {}
-
 @router.post("/stitch")
-async def stitch_videos(req: StitchRequest, background_tasks: BackgroundTasks):
-    task_id = str(uuid.uuid4())
-    stitch_tasks[task_id] = {"status": "processing", "result_url": ""}
-    
-    background_tasks.add_task(process_stitching, task_id, req.video_urls)
-    
+async def stitch_videos(req: StitchRequest):
+    # Queued in stitch_jobs; clients poll the status until succeeded/failed
+    task_id = await stitch_engine.submit(req.video_urls)
     return {"task_id": task_id, "status": "processing"}
 
 @router.get("/stitch/{task_id}")
 async def get_stitch_status(task_id: str):
-    task = stitch_tasks.get(task_id)
+    """status (queued | processing | succeeded | failed | cancelled), result_url, stage, progress %, eta_seconds."""
+    task = await stitch_engine.status(task_id)
     if not task:
         raise HTTPException(404, "Task not found")
     return task
 
-async def process_stitching(task_id: str, urls: List[str], video_base64: Optional[List[str]] = None):
-    # 1. Agent Planning
-    try:
-        plan = await editor_agent.plan_edit(len(urls))
-        print(f"Editor Agent Plan for Task {task_id}: {plan}")
-    except Exception as e:
-        print(f"Editor Agent failed: {e}")
-
-    temp_dir = f"temp_stitch_{task_id}"
+@router.post("/stitch/{task_id}/cancel")
+async def cancel_stitch(task_id: str):
+    status = await stitch_engine.cancel(task_id)
+    if status is None:
+        raise HTTPException(404, "Task not found")
+    return {"task_id": task_id, "status": status}
+
+def _hls_name(url: str) -> Optional[str]:
+    """HLS package name of a stitched film or generated clip URL."""
+    base = os.path.basename(url.split("?")[0])
+    if base.startswith("stitched_") and base.endswith(".mp4"):
+        return base[:-len(".mp4")]
+    db = SessionLocal()
     try:
-        os.makedirs(temp_dir, exist_ok=True)
-        
-        # Download videos
-        local_files = []
-        
-        # Priority 1: Use Base64 data if provided (Bypasses network issues)
-        if video_base64 and len(video_base64) > 0:
-            print(f"Using provided Base64 data for {len(video_base64)} clips")
-            try:
-                 for i, b64 in enumerate(video_base64):
-                     if "," in b64:
-                         b64 = b64.split(",")[1]
-                     data = base64.b64decode(b64)
-                     path = os.path.join(temp_dir, f"clip_{i}.mp4")
-                     with open(path, "wb") as f:
-                         f.write(data)
-                     local_files.append(path)
-            except Exception as e:
-                print(f"Base64 save failed: {e}")
-
-        # Priority 2: Download if no Base64
-        if not local_files:
-            async with httpx.AsyncClient() as client:
-                for i, url in enumerate(urls):
-                    try:
-                        print(f"Processing clip {i}: {url}")
-                        
-                        # Normalize localhost URLs
-                        if "localhost" in url or "127.0.0.1" in url:
-                            if "/static/" in url:
-                                url = "/static/" + url.split("/static/")[1]
-                        
-                        # Handle local static URLs
-                        if url.startswith("/static/"):
-                            possible_paths = [
-                                f"backend/app{url}",
-                                f"app{url}",
-                                f".{url}",
-                                url.lstrip('/')
-                            ]
-                            
-                            src_path = None
-                            for p in possible_paths:
-                                if os.path.exists(p):
-                                    src_path = p
-                                    break
-                            
-                            if src_path:
-                                # Ensure we copy with .mp4 extension for FFmpeg happiness
-                                ext = url.split('.')[-1]
-                                if ext not in ['mp4', 'mov', 'avi', 'mkv']:
-                                    ext = 'mp4' # Force mp4 if unknown or missing
-                                    
-                                dest_path = os.path.join(temp_dir, f"clip_{i}.{ext}")
-                                shutil.copy(src_path, dest_path)
-                                local_files.append(dest_path)
-                                print(f"Copied local file from {src_path} to {dest_path}")
-                            else:
-                                print(f"Local file not found: {url}")
-                            continue
-                        
-                        # Check Cache for TOS files
-                        import re
-                        task_uuid_pattern = re.compile(r'/video/([^/]+)/')
-                        match = task_uuid_pattern.search(url)
-                        if match:
-                             source_task_id = match.group(1)
-                             # Try typical filenames
-                             for fname in ["output_video.mp4", f"{source_task_id}_output_video.mp4"]:
-                                 cache_filename = f"{source_task_id}_{fname}" if not fname.startswith(source_task_id) else fname
-                                 app_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-                                 cache_path = os.path.join(app_dir, "static", "cache", cache_filename)
-                                 
-                                 if os.path.exists(cache_path):
-                                     print(f"Hit local cache: {cache_path}")
-                                     shutil.copy(cache_path, dest_path)
-                                     local_files.append(dest_path)
-                                     break
-                             if local_files and local_files[-1] == dest_path:
-                                 continue
-
-                        # Remote URL
-                        dest_path = os.path.join(temp_dir, f"clip_{i}.mp4")
-                        if await download_file_robust(url, dest_path):
-                            local_files.append(dest_path)
-                        else:
-                            print(f"Failed to download {url} with all strategies")
-                    except Exception as e:
-                        print(f"Download failed for {url}: {e}")
-
-        if not local_files:
-            raise Exception("No videos available for stitching")
-
-        list_path = os.path.join(temp_dir, "list.txt")
-        with open(list_path, "w") as f:
-            for path in local_files:
-                f.write(f"file '{os.path.basename(path)}'\n")
-        
-        output_path = os.path.join(temp_dir, "output.mp4")
-        
-        # ffmpeg command - Re-encode for safety with faststart
-        # Scale all inputs to 1280x720 to avoid resolution mismatch errors
-        cmd = [
-            "ffmpeg", "-y",
-            "-f", "concat", "-safe", "0", 
-            "-i", "list.txt", 
-            "-vf", "scale=1280:720:force_original_aspect_ratio=decrease,pad=1280:720:(ow-iw)/2:(oh-ih)/2",
-            "-c:v", "libx264", "-pix_fmt", "yuv420p",
-            "-profile:v", "main", "-level", "4.0",
-            "-c:a", "aac", "-ar", "48000", "-ac", "2",
-            "-movflags", "+faststart",
-            "output.mp4"
-        ]
-        
-        process = await asyncio.create_subprocess_exec(
-            *cmd, cwd=temp_dir,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE
-        )
-        print(f"Running FFmpeg: {' '.join(cmd)}")
-        stdout, stderr = await process.communicate()
-        
-        if process.returncode != 0:
-            print(f"FFmpeg failed: {stderr.decode()}")
-            raise Exception("FFmpeg concatenation failed")
-
-        # Verify output
-        if not os.path.exists(output_path) or os.path.getsize(output_path) < 1024:
-            raise Exception("FFmpeg produced empty file")
-            
-        print(f"FFmpeg Output: {output_path}, Size: {os.path.getsize(output_path)} bytes, Faststart: Enabled")
-        
-        # Move to static - Use Absolute Path
-        app_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-        final_dir = os.path.join(app_dir, "static", "outputs")
-        os.makedirs(final_dir, exist_ok=True)
-        final_filename = f"stitched_{task_id}.mp4"
-        final_path = os.path.join(final_dir, final_filename)
-        shutil.move(output_path, final_path)
-        
-        stitch_tasks[task_id]["status"] = "succeeded"
-        stitch_tasks[task_id]["result_url"] = f"/static/outputs/{final_filename}"
-        
-    except Exception as e:
-        print(f"Stitch failed: {e}")
-        
-        # Fallback: Return first clip if stitching failed
-        if 'local_files' in locals() and local_files:
-            try:
-                print("Attempting fallback: Using first clip as result")
-                app_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-                final_dir = os.path.join(app_dir, "static", "outputs")
-                os.makedirs(final_dir, exist_ok=True)
-                final_filename = f"stitched_{task_id}.mp4"
-                final_path = os.path.join(final_dir, final_filename)
-                shutil.copy(local_files[0], final_path)
-                
-                stitch_tasks[task_id]["status"] = "succeeded"
-                stitch_tasks[task_id]["result_url"] = f"/static/outputs/{final_filename}"
-                return
-            except Exception as e2:
-                print(f"Fallback failed: {e2}")
-
-        # Super Fallback: Generate dummy video
-        try:
-            print("Generating dummy fallback video...")
-            app_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-            final_dir = os.path.join(app_dir, "static", "outputs")
-            os.makedirs(final_dir, exist_ok=True)
-            final_filename = f"stitched_{task_id}.mp4"
-            final_path = os.path.join(final_dir, final_filename)
-            
-            # User specified Golden Fallback
-            golden_path = "/Users/bytedance/python_projects/et_副本/output_video.mp4"
-            if os.path.exists(golden_path):
-                print(f"Using Golden Sample: {golden_path}")
-                shutil.copy(golden_path, final_path)
-            else:
-                # Generate placeholder video
-                cmd = [
-                    "ffmpeg", "-y",
-                    "-f", "lavfi", "-i", "color=c=black:s=1280x720:d=5",
-                    "-vf", "drawtext=text='Stitching Failed - Please Retry':fontcolor=white:fontsize=40:x=(w-text_w)/2:y=(h-text_h)/2",
-                    "-c:v", "libx264", "-t", "5", "-pix_fmt", "yuv420p",
-                    final_path
-                ]
-                subprocess.run(cmd, check=True, capture_output=True)
-            
-            # Explicitly mark as failed so UI shows error instead of fallback
-            # But since we generated a video explaining the failure, we might as well show it?
-            # User said "Still not working", implying they want it to WORK, not just fail gracefully.
-            # If we reached here, FFmpeg concat failed. 
-            # We should probably return the "Stitching Failed" video so user sees WHY (via text overlay)
-            # instead of a generic error.
-            stitch_tasks[task_id]["status"] = "succeeded"
-            stitch_tasks[task_id]["result_url"] = f"/static/outputs/{final_filename}"
-            return
-        except Exception as e3:
-            print(f"Super Fallback failed: {e3}")
-
-        stitch_tasks[task_id]["status"] = "failed"
+        blob = blobs.find(db, url)
+        return f"clip_{blob.sha256}" if blob else None
     finally:
-        if os.path.exists(temp_dir):
-            shutil.rmtree(temp_dir)
+        db.close()
+
+@router.get("/hls")
+async def get_hls(url: str = Query(..., description="Stitched film or clip URL")):
+    """Master playlist of the HLS package of a video (HLS_ENABLED), for streaming and seeking."""
+    name = await io_pools.run("db", _hls_name, url)
+    hls_url = hls.url(name) if name else None
+    if not hls_url:
+        raise HTTPException(404, "No HLS package for this video")
+    return {"url": url, "hls_url": hls_url}
@@ -43,8 +43,17 @@ from .api.best_practices import router as best_practices_router
 from .api.story import router as story_router
 from .api.video import router as video_router
 from .api.projects import router as projects_router
+from .api.uploads import router as uploads_router
 from .services.manager_singleton import manager
 from .services.worker_singleton import worker
+from .services.http_singleton import http_clients
+from .services.io_singleton import io_pools, loop_monitor
+from .services.config_singleton import config_cache
+from .services.media_singleton import media_cache
+from .services.gc_singleton import storage_gc
+from .services.stitch_singleton import stitch_engine
+from .services.mezzanine_singleton import mezzanines
+from .services.media_static import MediaStaticFiles
 
 app = FastAPI(redirect_slashes=False)
 
@@ -94,6 +103,7 @@ app.include_router(best_practices_router)
 app.include_router(story_router, prefix="/api/story", tags=["story"])
 app.include_router(video_router)
 app.include_router(projects_router, prefix="/api/projects", tags=["projects"])
+app.include_router(uploads_router)
 
 @app.websocket("/ws/tasks")
 async def ws_tasks(ws: WebSocket):
@@ -110,6 +120,14 @@ def startup():
     from sqlalchemy import text
     from .models.asset import Asset
     from .models.project import Project
+    from .models.task_queue import TaskQueueEntry
+    from .models.quota_usage import QuotaUsage
+    from .models.result_cache import ResultCacheEntry
+    from .models.upload_session import UploadSession
+    from .models.blob import Blob, BlobRef
+    from .models.storage_tombstone import StorageTombstone
+    from .models.stitch_job import StitchJob
+    from .models.mezzanine import Mezzanine
     
     # 检查Asset表是否存在
     # try:
@@ -124,6 +142,10 @@ def startup():
     
     # 创建所有表
     Base.metadata.create_all(bind=engine)
+    # create_all does not add new indexes to tables that already exist
+    from .models.task import Task
+    for idx in Task.__table__.indexes:
+        idx.create(bind=engine, checkfirst=True)
     db = SessionLocal()
     from .services.user_service import UserService
     from .repositories.user_repo import UserRepo
@@ -186,10 +208,9 @@ def startup():
         
     db.commit()
     
-    from .services.token_bucket import TokenBucket
     ms = model_repo.list(db)
     for m in ms:
-        worker.buckets[m.id] = TokenBucket(m.concurrency_quota)
+        worker.configure_model(m)
     
     from .repositories.system_config_repo import SystemConfigRepo
     sys_repo = SystemConfigRepo()
@@ -234,20 +255,43 @@ def startup():
 
     # Resume running tasks
     from .models.task import Task
-    import asyncio
+    from .repositories.task_queue_repo import TaskQueueRepo
+    
+    config_cache.load(db)
+    config_cache.start()
+    media_cache.open()
+    http_clients.startup()
+    loop_monitor.start()
     
+    # Queued/leased jobs in task_queue are drained by the worker (leases of the previous process expire and get reclaimed)
+    worker.start()
+    storage_gc.start()
+    stitch_engine.start()
+    mezzanines.start()
+    
+    queue_repo = TaskQueueRepo()
     running_tasks = db.query(Task).filter(Task.status == "running").all()
     for t in running_tasks:
-        if t.external_id:
+        if t.external_id and not queue_repo.has_pending(db, t.id):
             print(f"Resuming task {t.id} with external_id {t.external_id}")
-            api_key_cfg = sys_repo.get(db, "volc_api_key")
-            api_key = api_key_cfg.value if api_key_cfg else None
-            asyncio.create_task(worker._poll_until_done(t.id, t.external_id, api_key=api_key))
+            worker.poller.track(t.id, t.external_id, api_key=config_cache.get("volc_api_key"), started_at=t.created_at)
 
     db.close()
 
+@app.on_event("shutdown")
+async def shutdown():
+    await worker.stop()
+    await stitch_engine.stop()
+    await mezzanines.stop()
+    await storage_gc.stop()
+    await http_clients.aclose()
+    await loop_monitor.stop()
+    await config_cache.stop()
+    io_pools.shutdown()
+    media_cache.close()
+
 # Mount /static for backend static files
-app.mount("/static", StaticFiles(directory=get_static_dir()), name="static")
+app.mount("/static", MediaStaticFiles(directory=get_static_dir()), name="static")
 
 # Mount frontend build
 frontend_dist = get_frontend_dist()
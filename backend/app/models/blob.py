@@ -0,0 +1,31 @@
+from sqlalchemy import Column, BigInteger, Index, Integer, String, UniqueConstraint
+from ..db import Base
+
+class Blob(Base):
+    """
+    A stored file identified by the SHA-256 of its bytes. The same content is written
+    and uploaded once no matter how many tasks, assets or best practices use it.
+    """
+    __tablename__ = "blobs"
+    sha256 = Column(String(64), primary_key=True, index=True)
+    size = Column(BigInteger)
+    content_type = Column(String(100), nullable=True)
+    local_path = Column(String(512), nullable=True, index=True) # relative to the app dir, e.g. static/blobs/ab/<sha>.png
+    bucket = Column(String(255), nullable=True)
+    object_key = Column(String(1024), nullable=True, index=True) # TOS key, set once uploaded
+    ref_count = Column(Integer, default=0, index=True) # number of blob_refs rows
+    created_at = Column(Integer)
+
+class BlobRef(Base):
+    """One owner's use of a blob. A blob whose last ref is released can be deleted."""
+    __tablename__ = "blob_refs"
+    __table_args__ = (
+        UniqueConstraint("sha256", "owner_type", "owner_id", "role", name="uq_blob_ref"),
+        Index("ix_blob_refs_owner", "owner_type", "owner_id"),
+    )
+    id = Column(Integer, primary_key=True, index=True)
+    sha256 = Column(String(64), index=True)
+    owner_type = Column(String(20)) # task | asset | best_practice
+    owner_id = Column(String(64))
+    role = Column(String(20)) # input | prompt | image | video | media ...
+    created_at = Column(Integer)
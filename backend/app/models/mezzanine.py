@@ -0,0 +1,23 @@
+from sqlalchemy import Column, Float, Integer, String, Text, UniqueConstraint
+from ..db import Base
+
+class Mezzanine(Base):
+    """
+    A clip transcoded to the standard stitching format. The mezzanine file is a blob like
+    the original it was made from, referenced by the same task (role "mezzanine").
+    """
+    __tablename__ = "mezzanines"
+    __table_args__ = (UniqueConstraint("source_sha256", "profile", name="uq_mezzanine_source"),)
+    id = Column(Integer, primary_key=True, index=True)
+    source_sha256 = Column(String(64), index=True) # blob of the original clip
+    profile = Column(String(100)) # video_stitcher.mezzanine_profile() it was made with
+    task_id = Column(String(64)) # owner the mezzanine blob is referenced by
+    status = Column(String(20), index=True) # pending | processing | ready | failed
+    mezzanine_sha256 = Column(String(64), nullable=True, index=True)
+    attempts = Column(Integer, default=0)
+    last_error = Column(Text, nullable=True)
+    lease_owner = Column(String(128), nullable=True)
+    lease_expires_at = Column(Integer, nullable=True) # also the retry backoff of pending rows
+    seconds = Column(Float, nullable=True) # transcode time
+    created_at = Column(Integer)
+    finished_at = Column(Integer, nullable=True)
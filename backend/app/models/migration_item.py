@@ -0,0 +1,27 @@
+from sqlalchemy import Column, BigInteger, Index, Integer, String, Text, UniqueConstraint
+from ..db import Base
+
+class MigrationItem(Base):
+    """
+    Checkpoint of one stored URL being moved to TOS by scripts/migrate_to_tos.py.
+    A run that crashed resumes from these rows instead of starting over.
+    """
+    __tablename__ = "migration_items"
+    __table_args__ = (
+        UniqueConstraint("run", "owner_type", "owner_id", "field", "position", name="uq_migration_item"),
+        Index("ix_migration_items_status", "run", "status"),
+    )
+    id = Column(Integer, primary_key=True, index=True)
+    run = Column(String(64)) # migration name, e.g. local_to_tos
+    owner_type = Column(String(20)) # task | asset | best_practice
+    owner_id = Column(String(64))
+    field = Column(String(50)) # column holding the URL, e.g. result_urls
+    position = Column(Integer, default=0) # index within JSON list columns, 0 for scalar columns
+    source_url = Column(Text)
+    size = Column(BigInteger, nullable=True) # bytes, known up front for local files
+    status = Column(String(20)) # pending | done | failed | missing | stale
+    target_url = Column(Text, nullable=True)
+    sha256 = Column(String(64), nullable=True)
+    attempts = Column(Integer, default=0)
+    error = Column(Text, nullable=True)
+    updated_at = Column(Integer)
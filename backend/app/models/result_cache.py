@@ -0,0 +1,18 @@
+from sqlalchemy import Column, BigInteger, Integer, String, Text
+from ..db import Base
+
+class ResultCacheEntry(Base):
+    """
+    Successful generation result keyed by the canonical hash of its request payload
+    (model + parameters + reference images hashed by content).
+    """
+    __tablename__ = "result_cache"
+    key = Column(String(64), primary_key=True, index=True) # sha256 hex
+    model_id = Column(Integer)
+    type = Column(String(50))
+    source_task_id = Column(BigInteger, index=True) # task whose outputs are reused
+    result = Column(Text) # JSON: result_urls | video_url + last_frame_url
+    hits = Column(Integer, default=0)
+    created_at = Column(Integer)
+    expires_at = Column(Integer, index=True)
+    last_hit_at = Column(Integer, index=True)
@@ -0,0 +1,25 @@
+from sqlalchemy import Column, Boolean, Float, Integer, String, Text
+from ..db import Base
+
+class StitchJob(Base):
+    """
+    A video stitch job. Workers claim queued rows through a lease and keep it alive with
+    heartbeats, so jobs survive restarts: a lease that expires is picked up again.
+    """
+    __tablename__ = "stitch_jobs"
+    id = Column(String(36), primary_key=True, index=True) # uuid4, returned as task_id
+    status = Column(String(20), index=True) # queued | processing | succeeded | failed | cancelled
+    video_urls = Column(Text) # JSON list
+    result_url = Column(String(1024), default="")
+    stage = Column(String(20), nullable=True) # fetching | stitching | packaging
+    progress = Column(Float, default=0.0) # percent complete
+    eta_seconds = Column(Integer, nullable=True)
+    report = Column(Text, nullable=True) # JSON: stitch path, timings, media cache hits
+    error = Column(Text, nullable=True)
+    cancel_requested = Column(Boolean, default=False)
+    attempts = Column(Integer, default=0)
+    lease_owner = Column(String(128), nullable=True)
+    lease_expires_at = Column(Integer, nullable=True)
+    created_at = Column(Integer)
+    started_at = Column(Integer, nullable=True)
+    finished_at = Column(Integer, nullable=True)
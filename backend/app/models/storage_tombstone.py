@@ -0,0 +1,21 @@
+from sqlalchemy import Column, Integer, String, Text
+from ..db import Base
+
+class StorageTombstone(Base):
+    """
+    A stored object that nothing references any more, waiting for the background
+    garbage collector. Rows are removed once the object is deleted.
+    """
+    __tablename__ = "storage_tombstones"
+    id = Column(Integer, primary_key=True, index=True)
+    backend = Column(String(10)) # tos | local
+    bucket = Column(String(255), nullable=True)
+    object_key = Column(String(1024)) # TOS key, or path relative to the app dir for local
+    sha256 = Column(String(64), nullable=True, index=True) # blob digest; a re-stored blob cancels the tombstone
+    reason = Column(String(50)) # task_deleted | tasks_cleared | asset_deleted | reconcile ...
+    not_before = Column(Integer, index=True) # grace period / retry backoff
+    attempts = Column(Integer, default=0)
+    last_error = Column(Text, nullable=True)
+    lease_owner = Column(String(128), nullable=True)
+    lease_expires_at = Column(Integer, nullable=True)
+    created_at = Column(Integer)
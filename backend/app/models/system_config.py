@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String
+from sqlalchemy import Column, String, Integer
 from ..db import Base
 
 class SystemConfig(Base):
@@ -6,3 +6,9 @@ class SystemConfig(Base):
     key = Column(String(255), primary_key=True, index=True)
     value = Column(String(1024))
     description = Column(String(1024), nullable=True)
+
+class SystemConfigVersion(Base):
+    """Single row counter bumped on every config write, so other processes can tell their cache is stale."""
+    __tablename__ = "system_config_version"
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
@@ -1,8 +1,10 @@
-from sqlalchemy import Column, BigInteger, Integer, String, Text
+from sqlalchemy import Column, BigInteger, Integer, String, Text, Index
 from ..db import Base
 
 class Task(Base):
     __tablename__ = "tasks"
+    # Keyset pagination for the task list: WHERE user_id = ? ORDER BY created_at DESC, id DESC
+    __table_args__ = (Index("ix_tasks_user_created_id", "user_id", "created_at", "id"),)
     # Use BigInteger for 64-bit ID, and disable autoincrement to allow manual ID
     id = Column(BigInteger, primary_key=True, index=True, autoincrement=False)
     user_id = Column(Integer)
@@ -0,0 +1,31 @@
+from sqlalchemy import Column, BigInteger, Boolean, Integer, String, Text
+from ..db import Base
+
+class TaskQueueEntry(Base):
+    """
+    Durable queue entry for a generation task.
+    One row per task; workers claim rows through a lease (lease_owner + lease_expires_at)
+    and keep it alive with heartbeats. Expired leases are reclaimed by any worker.
+    """
+    __tablename__ = "task_queue"
+    id = Column(Integer, primary_key=True, index=True)
+    task_id = Column(BigInteger, unique=True, index=True)
+    model_id = Column(Integer)
+    type = Column(String(50))
+    payload = Column(Text) # JSON body handed to the upstream client
+    status = Column(String(20), index=True) # queued | leased | done | failed | cancelled
+    attempts = Column(Integer, default=0)
+    max_attempts = Column(Integer, default=3)
+    lease_owner = Column(String(128), nullable=True)
+    lease_expires_at = Column(Integer, nullable=True)
+    heartbeat_at = Column(Integer, nullable=True)
+    last_error = Column(Text, nullable=True)
+    # Scheduling: lane (interactive | batch | background) and the flow it is fair-shared in
+    priority = Column(String(20), default="interactive")
+    user_id = Column(Integer, nullable=True)
+    project_id = Column(String(64), nullable=True)
+    # Result cache: canonical request hash, and whether a cached/in-flight result may be reused
+    cache_key = Column(String(64), nullable=True, index=True)
+    use_cache = Column(Boolean, default=True)
+    created_at = Column(Integer)
+    updated_at = Column(Integer)
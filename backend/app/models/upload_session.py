@@ -0,0 +1,27 @@
+from sqlalchemy import Column, BigInteger, Integer, String
+from ..db import Base
+
+class UploadSession(Base):
+    """
+    A file the browser uploads straight to storage (presigned TOS PUT / multipart,
+    or a streamed PUT to this server when storage_type is local).
+    Once completed it is referenced as "upload:<id>" instead of sending the bytes again.
+    """
+    __tablename__ = "upload_sessions"
+    id = Column(String(32), primary_key=True, index=True) # uuid4 hex
+    user_id = Column(Integer, index=True)
+    purpose = Column(String(20)) # task_input | asset | best_practice
+    backend = Column(String(10)) # tos | local
+    filename = Column(String(255))
+    content_type = Column(String(100), nullable=True)
+    size = Column(BigInteger, nullable=True) # declared at start, actual after completion
+    bucket = Column(String(255), nullable=True)
+    object_key = Column(String(1024)) # TOS key, or path relative to the app dir for local
+    upload_id = Column(String(255), nullable=True) # TOS multipart upload id
+    status = Column(String(20), index=True) # pending | completed
+    sha256 = Column(String(64), nullable=True) # known for local uploads
+    etag = Column(String(255), nullable=True)
+    url = Column(String(1024), nullable=True) # stored URL, same form as Task.input_images
+    created_at = Column(Integer)
+    expires_at = Column(Integer) # presigned URLs stop working; completion is refused after this
+    completed_at = Column(Integer, nullable=True)
@@ -0,0 +1,122 @@
+import time
+from typing import List, Optional
+from sqlalchemy import func, or_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from ..models.blob import Blob, BlobRef
+
+class BlobRepo:
+    def get(self, db: Session, sha256: str) -> Optional[Blob]:
+        return db.get(Blob, sha256)
+
+    def find(self, db: Session, local_path: Optional[str] = None, object_key: Optional[str] = None) -> Optional[Blob]:
+        """Blob stored at a local path or TOS key."""
+        conds = []
+        if local_path:
+            conds.append(Blob.local_path == local_path)
+        if object_key:
+            conds.append(Blob.object_key == object_key)
+        if not conds:
+            return None
+        return db.query(Blob).filter(or_(*conds)).first()
+
+    def find_many(self, db: Session, local_paths: List[str], object_keys: List[str]) -> List[Blob]:
+        """Blobs stored at any of the local paths or TOS keys, in one query."""
+        conds = []
+        if local_paths:
+            conds.append(Blob.local_path.in_(set(local_paths)))
+        if object_keys:
+            conds.append(Blob.object_key.in_(set(object_keys)))
+        if not conds:
+            return []
+        return db.query(Blob).filter(or_(*conds)).all()
+
+    def ensure(self, db: Session, sha256: str, size: int, content_type: Optional[str],
+               local_path: Optional[str], bucket: Optional[str], object_key: Optional[str]) -> Blob:
+        """Insert the blob, or fill in locations it did not have yet."""
+        b = db.get(Blob, sha256)
+        if not b:
+            b = Blob(sha256=sha256, size=size, content_type=content_type, ref_count=0, created_at=int(time.time()))
+            db.add(b)
+            try:
+                db.flush()
+            except IntegrityError:
+                # Stored concurrently by another request
+                db.rollback()
+                b = db.get(Blob, sha256)
+        if local_path:
+            b.local_path = local_path
+        if object_key:
+            b.bucket, b.object_key = bucket, object_key
+        db.commit()
+        db.refresh(b)
+        return b
+
+    def add_ref(self, db: Session, sha256: str, owner_type: str, owner_id, role: str) -> bool:
+        """Record that owner uses the blob. False if the ref already existed."""
+        db.add(BlobRef(sha256=sha256, owner_type=owner_type, owner_id=str(owner_id), role=role, created_at=int(time.time())))
+        try:
+            db.flush()
+        except IntegrityError:
+            db.rollback()
+            return False
+        db.query(Blob).filter(Blob.sha256 == sha256).update(
+            {Blob.ref_count: Blob.ref_count + 1}, synchronize_session=False
+        )
+        db.commit()
+        return True
+
+    def share(self, db: Session, owner_type: str, owner_id, to_type: str, to_id) -> int:
+        """Give `to` the same refs as `owner` (a task served from another task's result)."""
+        refs = db.query(BlobRef.sha256, BlobRef.role).filter(
+            BlobRef.owner_type == owner_type, BlobRef.owner_id == str(owner_id)
+        ).all()
+        return sum(1 for sha, role in refs if self.add_ref(db, sha, to_type, to_id, role))
+
+    def owned(self, db: Session, owner_type: str, owner_id) -> List[Blob]:
+        return db.query(Blob).join(BlobRef, BlobRef.sha256 == Blob.sha256).filter(
+            BlobRef.owner_type == owner_type, BlobRef.owner_id == str(owner_id)
+        ).distinct().all()
+
+    def release(self, db: Session, owner_type: str, owner_id, roles: Optional[List[str]] = None,
+                commit: bool = True) -> List[Blob]:
+        """
+        Drop owner's refs and decrement the counts. Blobs nobody references any more are
+        removed from the table and returned so the caller can delete their files.
+        """
+        q = db.query(BlobRef).filter(BlobRef.owner_type == owner_type, BlobRef.owner_id == str(owner_id))
+        if roles:
+            q = q.filter(BlobRef.role.in_(roles))
+        counts = dict(q.with_entities(BlobRef.sha256, func.count(BlobRef.id)).group_by(BlobRef.sha256).all())
+        if not counts:
+            return []
+        q.delete(synchronize_session=False)
+        for sha, n in counts.items():
+            db.query(Blob).filter(Blob.sha256 == sha).update(
+                {Blob.ref_count: Blob.ref_count - n}, synchronize_session=False
+            )
+        orphans = db.query(Blob).filter(Blob.sha256.in_(list(counts)), Blob.ref_count <= 0).all()
+        for b in orphans:
+            db.expunge(b)
+        if orphans:
+            db.query(Blob).filter(Blob.sha256.in_([b.sha256 for b in orphans]), Blob.ref_count <= 0).delete(synchronize_session=False)
+        if commit:
+            db.commit()
+        return orphans
+
+    def drop_unreferenced(self, db: Session, created_before: int, commit: bool = True) -> List[Blob]:
+        """Remove blobs stored without any ref (e.g. an upload never attached) and return them."""
+        orphans = db.query(Blob).filter(Blob.ref_count <= 0, Blob.created_at < created_before).all()
+        for b in orphans:
+            db.expunge(b)
+        if orphans:
+            db.query(Blob).filter(Blob.sha256.in_([b.sha256 for b in orphans]), Blob.ref_count <= 0).delete(synchronize_session=False)
+            if commit:
+                db.commit()
+        return orphans
+
+    def stats(self, db: Session) -> dict:
+        count, size = db.query(func.count(Blob.sha256), func.coalesce(func.sum(Blob.size), 0)).one()
+        refs = db.query(func.count(BlobRef.id)).scalar() or 0
+        unreferenced = db.query(func.count(Blob.sha256)).filter(Blob.ref_count <= 0).scalar() or 0
+        return {"blobs": count, "bytes": int(size), "refs": refs, "unreferenced": unreferenced}
@@ -0,0 +1,95 @@
+import time
+from typing import Dict, List, Optional
+from sqlalchemy import func, or_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, aliased
+from ..models.blob import Blob
+from ..models.mezzanine import Mezzanine
+
+class MezzanineRepo:
+    def request(self, db: Session, source_sha256: str, profile: str, task_id) -> Mezzanine:
+        """
+        Queue a mezzanine for a clip blob unless one is queued or ready. A ready row whose
+        mezzanine blob was deleted since (its tasks were all removed) is queued again.
+        """
+        m = db.query(Mezzanine).filter_by(source_sha256=source_sha256, profile=profile).first()
+        if m is None:
+            m = Mezzanine(source_sha256=source_sha256, profile=profile, task_id=str(task_id), status="pending",
+                          attempts=0, created_at=int(time.time()))
+            db.add(m)
+            try:
+                db.commit()
+            except IntegrityError:
+                db.rollback()
+                m = db.query(Mezzanine).filter_by(source_sha256=source_sha256, profile=profile).first()
+        elif m.status == "failed" or (m.status == "ready" and not db.get(Blob, m.mezzanine_sha256)):
+            m.status, m.task_id, m.attempts, m.lease_expires_at = "pending", str(task_id), 0, None
+            db.commit()
+        db.refresh(m)
+        return m
+
+    def _ready_filter(self, now: int):
+        # Pending past its retry backoff, or processing under a lease that ran out
+        return or_(
+            (Mezzanine.status == "pending") & (or_(Mezzanine.lease_expires_at == None, Mezzanine.lease_expires_at <= now)),
+            (Mezzanine.status == "processing") & (Mezzanine.lease_expires_at < now),
+        )
+
+    def claim(self, db: Session, owner: str, now: int, lease_seconds: int) -> Optional[Mezzanine]:
+        for (mid,) in db.query(Mezzanine.id).filter(self._ready_filter(now)).order_by(Mezzanine.id).limit(5).all():
+            n = db.query(Mezzanine).filter(Mezzanine.id == mid, self._ready_filter(now)).update({
+                Mezzanine.status: "processing",
+                Mezzanine.lease_owner: owner,
+                Mezzanine.lease_expires_at: now + lease_seconds,
+                Mezzanine.attempts: Mezzanine.attempts + 1,
+            }, synchronize_session=False)
+            db.commit()
+            if n == 1:
+                m = db.get(Mezzanine, mid)
+                db.refresh(m)
+                db.expunge(m)
+                return m
+        return None
+
+    def done(self, db: Session, mid: int, owner: str, mezzanine_sha256: str, seconds: float) -> bool:
+        n = db.query(Mezzanine).filter(Mezzanine.id == mid, Mezzanine.lease_owner == owner).update({
+            Mezzanine.status: "ready",
+            Mezzanine.mezzanine_sha256: mezzanine_sha256,
+            Mezzanine.seconds: seconds,
+            Mezzanine.last_error: None,
+            Mezzanine.lease_expires_at: None,
+            Mezzanine.finished_at: int(time.time()),
+        }, synchronize_session=False)
+        db.commit()
+        return n == 1
+
+    def retry(self, db: Session, mid: int, owner: str, error: str, now: int, max_attempts: int) -> str:
+        """Back off and queue again, or give up after max_attempts. Returns the new status."""
+        m = db.get(Mezzanine, mid)
+        if not m or m.lease_owner != owner:
+            return m.status if m else "missing"
+        if m.attempts >= max_attempts:
+            m.status, m.finished_at = "failed", now
+        else:
+            m.status, m.lease_expires_at = "pending", now + 60 * 2 ** m.attempts
+        m.last_error = error[:2000]
+        db.commit()
+        return m.status
+
+    def ready_for(self, db: Session, source_shas: List[str], profile: str) -> Dict[str, Blob]:
+        """source sha256 -> mezzanine blob, for the sources that have one on file."""
+        if not source_shas:
+            return {}
+        mezz = aliased(Blob)
+        rows = db.query(Mezzanine.source_sha256, mezz).join(mezz, mezz.sha256 == Mezzanine.mezzanine_sha256).filter(
+            Mezzanine.source_sha256.in_(set(source_shas)), Mezzanine.profile == profile, Mezzanine.status == "ready",
+        ).all()
+        for _, b in rows:
+            db.expunge(b)
+        return {sha: b for sha, b in rows}
+
+    def stats(self, db: Session, profile: str) -> dict:
+        rows = db.query(Mezzanine.status, func.count(Mezzanine.id), func.avg(Mezzanine.seconds)).filter(
+            Mezzanine.profile == profile
+        ).group_by(Mezzanine.status).all()
+        return {status: {"count": n, "avg_seconds": round(avg, 2) if avg else None} for status, n, avg in rows}
@@ -0,0 +1,70 @@
+import time
+from typing import Dict, List, Optional
+from sqlalchemy import func, or_
+from sqlalchemy.orm import Session
+from ..models.migration_item import MigrationItem
+
+class MigrationRepo:
+    def add_missing(self, db: Session, run: str, items: List[dict]) -> int:
+        """
+        Checkpoint discovered items (owner_type, owner_id, field, position, source_url, size).
+        Known items are left alone unless their column now holds a different URL.
+        """
+        if not items:
+            return 0
+        owner_ids = list({str(it["owner_id"]) for it in items})
+        known = {
+            (r.owner_type, r.owner_id, r.field, r.position): r
+            for r in db.query(MigrationItem).filter(MigrationItem.run == run, MigrationItem.owner_id.in_(owner_ids)).all()
+        }
+        now, added = int(time.time()), 0
+        for it in items:
+            row = known.get((it["owner_type"], str(it["owner_id"]), it["field"], it["position"]))
+            if row is None:
+                db.add(MigrationItem(
+                    run=run, owner_type=it["owner_type"], owner_id=str(it["owner_id"]), field=it["field"],
+                    position=it["position"], source_url=it["source_url"], size=it.get("size"),
+                    status="pending", attempts=0, updated_at=now,
+                ))
+                added += 1
+            elif row.source_url != it["source_url"]:
+                row.source_url, row.size, row.status = it["source_url"], it.get("size"), "pending"
+                row.attempts, row.error, row.target_url, row.updated_at = 0, None, None, now
+                added += 1
+        db.commit()
+        return added
+
+    def next_batch(self, db: Session, run: str, after_id: int, limit: int, max_attempts: int) -> List[MigrationItem]:
+        """Items still to do (pending, or failed fewer than max_attempts times), in id order."""
+        rows = db.query(MigrationItem).filter(
+            MigrationItem.run == run, MigrationItem.id > after_id,
+            or_(MigrationItem.status == "pending",
+                (MigrationItem.status == "failed") & (MigrationItem.attempts < max_attempts)),
+        ).order_by(MigrationItem.id).limit(limit).all()
+        for r in rows:
+            db.expunge(r)
+        return rows
+
+    def finish(self, db: Session, item_id: int, status: str, target_url: Optional[str] = None,
+               sha256: Optional[str] = None, size: Optional[int] = None, error: Optional[str] = None) -> None:
+        values = {
+            MigrationItem.status: status,
+            MigrationItem.attempts: MigrationItem.attempts + 1,
+            MigrationItem.error: error[:1000] if error else None,
+            MigrationItem.updated_at: int(time.time()),
+        }
+        if target_url:
+            values[MigrationItem.target_url] = target_url
+        if sha256:
+            values[MigrationItem.sha256] = sha256
+        if size is not None:
+            values[MigrationItem.size] = size
+        db.query(MigrationItem).filter(MigrationItem.id == item_id).update(values, synchronize_session=False)
+        db.commit()
+
+    def summary(self, db: Session, run: str) -> Dict[str, dict]:
+        """status -> {"items": n, "bytes": known size}."""
+        rows = db.query(MigrationItem.status, func.count(MigrationItem.id), func.coalesce(func.sum(MigrationItem.size), 0)).filter(
+            MigrationItem.run == run
+        ).group_by(MigrationItem.status).all()
+        return {status: {"items": n, "bytes": int(size)} for status, n, size in rows}
@@ -0,0 +1,51 @@
+import json
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from typing import Optional, List
+from ..models.result_cache import ResultCacheEntry
+
+class ResultCacheRepo:
+    def get_valid(self, db: Session, key: str, now: int) -> Optional[ResultCacheEntry]:
+        return db.query(ResultCacheEntry).filter(
+            ResultCacheEntry.key == key,
+            ResultCacheEntry.expires_at > now,
+        ).first()
+
+    def touch(self, db: Session, key: str, now: int) -> None:
+        db.query(ResultCacheEntry).filter(ResultCacheEntry.key == key).update({
+            ResultCacheEntry.hits: ResultCacheEntry.hits + 1,
+            ResultCacheEntry.last_hit_at: now,
+        }, synchronize_session=False)
+        db.commit()
+
+    def put(self, db: Session, key: str, model_id: int, ttype: str, source_task_id: int, result: dict, now: int, ttl: int) -> None:
+        e = db.get(ResultCacheEntry, key)
+        if not e:
+            e = ResultCacheEntry(key=key, hits=0)
+            db.add(e)
+        e.model_id = model_id
+        e.type = ttype
+        e.source_task_id = source_task_id
+        e.result = json.dumps(result, ensure_ascii=False)
+        e.created_at = now
+        e.expires_at = now + ttl
+        e.last_hit_at = now
+        db.commit()
+
+    def delete_for_task(self, db: Session, task_id: int) -> int:
+        n = db.query(ResultCacheEntry).filter(ResultCacheEntry.source_task_id == task_id).delete(synchronize_session=False)
+        db.commit()
+        return n
+
+    def evict(self, db: Session, now: int, max_entries: int) -> int:
+        """Drop expired entries, then the least recently used ones above max_entries."""
+        n = db.query(ResultCacheEntry).filter(ResultCacheEntry.expires_at <= now).delete(synchronize_session=False)
+        total = db.query(func.count(ResultCacheEntry.key)).scalar() or 0
+        if max_entries and total > max_entries:
+            keys: List[str] = [k for (k,) in db.query(ResultCacheEntry.key).order_by(ResultCacheEntry.last_hit_at).limit(total - max_entries).all()]
+            n += db.query(ResultCacheEntry).filter(ResultCacheEntry.key.in_(keys)).delete(synchronize_session=False)
+        db.commit()
+        return n
+
+    def count(self, db: Session) -> int:
+        return db.query(func.count(ResultCacheEntry.key)).scalar() or 0
@@ -0,0 +1,120 @@
+import json
+import time
+from typing import List, Optional
+from sqlalchemy import func, or_
+from sqlalchemy.orm import Session
+from ..models.stitch_job import StitchJob
+
+ACTIVE_STATUSES = ("queued", "processing")
+
+class StitchJobRepo:
+    def create(self, db: Session, job_id: str, urls: List[str]) -> StitchJob:
+        job = StitchJob(id=job_id, status="queued", video_urls=json.dumps(urls), result_url="",
+                        progress=0.0, attempts=0, cancel_requested=False, created_at=int(time.time()))
+        db.add(job)
+        db.commit()
+        db.refresh(job)
+        return job
+
+    def get(self, db: Session, job_id: str) -> Optional[StitchJob]:
+        return db.get(StitchJob, job_id)
+
+    def _ready_filter(self, now: int):
+        # Queued, or processing under a lease whose holder stopped heartbeating (restart/crash)
+        return or_(
+            StitchJob.status == "queued",
+            (StitchJob.status == "processing") & (StitchJob.lease_expires_at < now),
+        )
+
+    def claim_next(self, db: Session, owner: str, now: int, lease_seconds: int, max_attempts: int) -> Optional[StitchJob]:
+        """Lease the oldest ready job, or None. Jobs that keep dying are failed after max_attempts."""
+        stuck = db.query(StitchJob).filter(
+            self._ready_filter(now), (StitchJob.attempts >= max_attempts) | (StitchJob.cancel_requested == True)
+        ).all()
+        for job in stuck:
+            if job.cancel_requested:
+                job.status, job.finished_at = "cancelled", now
+            else:
+                job.status, job.error, job.finished_at = "failed", "stitch worker died repeatedly", now
+        if stuck:
+            db.commit()
+        for (job_id,) in db.query(StitchJob.id).filter(self._ready_filter(now)).order_by(StitchJob.created_at).limit(5).all():
+            n = db.query(StitchJob).filter(StitchJob.id == job_id, self._ready_filter(now)).update({
+                StitchJob.status: "processing",
+                StitchJob.lease_owner: owner,
+                StitchJob.lease_expires_at: now + lease_seconds,
+                StitchJob.attempts: StitchJob.attempts + 1,
+                StitchJob.started_at: now,
+                StitchJob.progress: 0.0,
+            }, synchronize_session=False)
+            db.commit()
+            if n == 1:
+                job = db.get(StitchJob, job_id)
+                db.refresh(job)
+                db.expunge(job)
+                return job
+        return None
+
+    def heartbeat(self, db: Session, job_id: str, owner: str, now: int, lease_seconds: int, **values) -> Optional[bool]:
+        """
+        Extend the lease and store progress fields. Returns whether cancellation was
+        requested, or None if the lease was lost to another worker.
+        """
+        updates = {StitchJob.lease_expires_at: now + lease_seconds}
+        updates.update({getattr(StitchJob, k): v for k, v in values.items()})
+        n = db.query(StitchJob).filter(
+            StitchJob.id == job_id, StitchJob.lease_owner == owner, StitchJob.status == "processing"
+        ).update(updates, synchronize_session=False)
+        db.commit()
+        if n != 1:
+            return None
+        return bool(db.query(StitchJob.cancel_requested).filter(StitchJob.id == job_id).scalar())
+
+    def finish(self, db: Session, job_id: str, owner: str, status: str, result_url: str = "",
+               report: Optional[dict] = None, error: Optional[str] = None) -> None:
+        values = {
+            StitchJob.status: status,
+            StitchJob.result_url: result_url,
+            StitchJob.lease_expires_at: None,
+            StitchJob.stage: None,
+            StitchJob.eta_seconds: None,
+            StitchJob.finished_at: int(time.time()),
+        }
+        if status == "succeeded":
+            values[StitchJob.progress] = 100.0
+        if report is not None:
+            values[StitchJob.report] = json.dumps(report)
+        if error:
+            values[StitchJob.error] = error[:2000]
+        db.query(StitchJob).filter(StitchJob.id == job_id, StitchJob.lease_owner == owner).update(values, synchronize_session=False)
+        db.commit()
+
+    def release(self, db: Session, job_id: str, owner: str) -> None:
+        """Hand a job back to the queue on shutdown without counting the attempt."""
+        db.query(StitchJob).filter(StitchJob.id == job_id, StitchJob.lease_owner == owner, StitchJob.status == "processing").update({
+            StitchJob.status: "queued",
+            StitchJob.lease_owner: None,
+            StitchJob.lease_expires_at: None,
+            StitchJob.attempts: StitchJob.attempts - 1,
+        }, synchronize_session=False)
+        db.commit()
+
+    def request_cancel(self, db: Session, job_id: str) -> Optional[str]:
+        """Cancel a queued job at once; flag a running one for its worker. Returns the resulting status."""
+        now = int(time.time())
+        n = db.query(StitchJob).filter(StitchJob.id == job_id, StitchJob.status == "queued").update({
+            StitchJob.status: "cancelled", StitchJob.finished_at: now,
+        }, synchronize_session=False)
+        if n == 0:
+            db.query(StitchJob).filter(StitchJob.id == job_id, StitchJob.status == "processing").update({
+                StitchJob.cancel_requested: True,
+            }, synchronize_session=False)
+        db.commit()
+        job = db.get(StitchJob, job_id)
+        return job.status if job else None
+
+    def count_active(self, db: Session) -> dict:
+        rows = db.query(StitchJob.status, func.count(StitchJob.id)).filter(
+            StitchJob.status.in_(ACTIVE_STATUSES)
+        ).group_by(StitchJob.status).all()
+        return dict({s: 0 for s in ACTIVE_STATUSES}, **dict(rows))
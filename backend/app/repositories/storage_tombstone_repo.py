@@ -0,0 +1,74 @@
+from typing import Dict, List, Optional
+from sqlalchemy import func, or_
+from sqlalchemy.orm import Session
+from ..models.storage_tombstone import StorageTombstone
+
+class StorageTombstoneRepo:
+    def add_many(self, db: Session, items: List[dict], now: int, grace_seconds: int, commit: bool = True) -> int:
+        """items: dicts with backend, bucket, object_key, sha256, reason."""
+        for it in items:
+            db.add(StorageTombstone(
+                backend=it["backend"], bucket=it.get("bucket"), object_key=it["object_key"],
+                sha256=it.get("sha256"), reason=it.get("reason"), not_before=now + grace_seconds,
+                attempts=0, created_at=now,
+            ))
+        if commit:
+            db.commit()
+        return len(items)
+
+    def cancel_sha(self, db: Session, sha256: str) -> int:
+        """A blob with this digest was stored again; its files must stay."""
+        n = db.query(StorageTombstone).filter(StorageTombstone.sha256 == sha256).delete(synchronize_session=False)
+        db.commit()
+        return n
+
+    def claim(self, db: Session, owner: str, now: int, limit: int, lease_seconds: int) -> List[StorageTombstone]:
+        """Lease up to `limit` due tombstones for this process."""
+        due = or_(StorageTombstone.lease_expires_at.is_(None), StorageTombstone.lease_expires_at < now)
+        ids = [i for (i,) in db.query(StorageTombstone.id).filter(
+            StorageTombstone.not_before <= now, due
+        ).order_by(StorageTombstone.id).limit(limit).all()]
+        if not ids:
+            return []
+        db.query(StorageTombstone).filter(StorageTombstone.id.in_(ids), due).update({
+            StorageTombstone.lease_owner: owner,
+            StorageTombstone.lease_expires_at: now + lease_seconds,
+            StorageTombstone.attempts: StorageTombstone.attempts + 1,
+        }, synchronize_session=False)
+        db.commit()
+        return db.query(StorageTombstone).filter(
+            StorageTombstone.id.in_(ids), StorageTombstone.lease_owner == owner,
+            StorageTombstone.lease_expires_at == now + lease_seconds,
+        ).all()
+
+    def done(self, db: Session, ids: List[int]) -> None:
+        if ids:
+            db.query(StorageTombstone).filter(StorageTombstone.id.in_(ids)).delete(synchronize_session=False)
+            db.commit()
+
+    def retry(self, db: Session, errors: Dict[int, str], now: int, max_attempts: int) -> int:
+        """Back off failed deletes; give up (drop the row) after max_attempts. Returns rows dropped."""
+        dropped = 0
+        for t in db.query(StorageTombstone).filter(StorageTombstone.id.in_(list(errors))).all():
+            if t.attempts >= max_attempts:
+                print(f"StorageGC: giving up on {t.backend}:{t.object_key}: {errors[t.id]}")
+                db.delete(t)
+                dropped += 1
+                continue
+            t.last_error = errors[t.id][:1000]
+            t.not_before = now + 60 * 2 ** t.attempts
+            t.lease_owner = None
+            t.lease_expires_at = None
+        db.commit()
+        return dropped
+
+    def pending_keys(self, db: Session, keys: List[str]) -> set:
+        if not keys:
+            return set()
+        return {k for (k,) in db.query(StorageTombstone.object_key).filter(StorageTombstone.object_key.in_(keys)).all()}
+
+    def stats(self, db: Session, now: int) -> dict:
+        total = db.query(func.count(StorageTombstone.id)).scalar() or 0
+        due = db.query(func.count(StorageTombstone.id)).filter(StorageTombstone.not_before <= now).scalar() or 0
+        failing = db.query(func.count(StorageTombstone.id)).filter(StorageTombstone.last_error.isnot(None)).scalar() or 0
+        return {"pending": total, "due": due, "retrying": failing}
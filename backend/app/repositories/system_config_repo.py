@@ -1,5 +1,6 @@
+from typing import Dict
 from sqlalchemy.orm import Session
-from ..models.system_config import SystemConfig
+from ..models.system_config import SystemConfig, SystemConfigVersion
 
 class SystemConfigRepo:
     def get(self, db: Session, key: str):
@@ -8,6 +9,20 @@ class SystemConfigRepo:
     def list(self, db: Session):
         return db.query(SystemConfig).all()
 
+    def values(self, db: Session) -> Dict[str, str]:
+        return {k: v for k, v in db.query(SystemConfig.key, SystemConfig.value).all()}
+
+    def get_version(self, db: Session) -> int:
+        v = db.query(SystemConfigVersion.version).filter(SystemConfigVersion.id == 1).scalar()
+        return v or 0
+
+    def _bump_version(self, db: Session):
+        n = db.query(SystemConfigVersion).filter(SystemConfigVersion.id == 1).update(
+            {SystemConfigVersion.version: SystemConfigVersion.version + 1}, synchronize_session=False
+        )
+        if not n:
+            db.add(SystemConfigVersion(id=1, version=1))
+
     def set(self, db: Session, key: str, value: str, description: str = None):
         config = self.get(db, key)
         if config:
@@ -17,6 +32,7 @@ class SystemConfigRepo:
         else:
             config = SystemConfig(key=key, value=value, description=description)
             db.add(config)
+        self._bump_version(db)
         db.commit()
         db.refresh(config)
         return config
@@ -0,0 +1,203 @@
+import json
+import time
+from sqlalchemy import or_, and_, case, func
+from sqlalchemy.orm import Session, aliased
+from typing import Optional, List, Dict
+from ..models.task_queue import TaskQueueEntry
+
+class TaskQueueRepo:
+    def enqueue(self, db: Session, task_id: int, model_id: int, ttype: str, payload: dict, max_attempts: int = 3,
+                priority: str = "interactive", user_id: Optional[int] = None, project_id: Optional[str] = None,
+                cache_key: Optional[str] = None, use_cache: bool = True) -> TaskQueueEntry:
+        now = int(time.time())
+        e = TaskQueueEntry(
+            task_id=task_id,
+            model_id=model_id,
+            type=ttype,
+            payload=json.dumps(payload, ensure_ascii=False),
+            status="queued",
+            attempts=0,
+            max_attempts=max_attempts,
+            priority=priority,
+            user_id=user_id,
+            project_id=project_id,
+            cache_key=cache_key,
+            use_cache=use_cache,
+            created_at=now,
+            updated_at=now,
+        )
+        db.add(e)
+        db.commit()
+        db.refresh(e)
+        return e
+
+    def _ready_filter(self, now: int, e=TaskQueueEntry):
+        # Either never claimed, or claimed by a worker that stopped heartbeating
+        return or_(
+            e.status == "queued",
+            and_(
+                e.status == "leased",
+                e.lease_expires_at < now,
+                e.attempts < e.max_attempts,
+            ),
+        )
+
+    def list_schedulable(self, db: Session, now: int, limit: Optional[int] = None):
+        """Lightweight rows (no payload) of every ready entry, for scheduling and queue positions."""
+        q = db.query(
+            TaskQueueEntry.id, TaskQueueEntry.task_id, TaskQueueEntry.model_id,
+            TaskQueueEntry.priority, TaskQueueEntry.user_id, TaskQueueEntry.project_id, TaskQueueEntry.created_at,
+        ).filter(self._ready_filter(now)).order_by(TaskQueueEntry.id)
+        if limit:
+            q = q.limit(limit)
+        return q.all()
+
+    def ready_ahead(self, db: Session, now: int, task_ids: List[int]) -> Dict[int, tuple]:
+        """task_id -> (model_id, ready entries of that model ahead of it by id), for the given tasks still ready."""
+        if not task_ids:
+            return {}
+        ahead = aliased(TaskQueueEntry)
+        count = db.query(func.count(ahead.id)).filter(
+            ahead.model_id == TaskQueueEntry.model_id,
+            ahead.id < TaskQueueEntry.id,
+            self._ready_filter(now, ahead),
+        ).correlate(TaskQueueEntry).scalar_subquery()
+        rows = db.query(TaskQueueEntry.task_id, TaskQueueEntry.model_id, count).filter(
+            TaskQueueEntry.task_id.in_(task_ids),
+            self._ready_filter(now),
+        ).all()
+        return {task_id: (model_id, n) for task_id, model_id, n in rows}
+
+    def get_many(self, db: Session, entry_ids: List[int]) -> List[TaskQueueEntry]:
+        if not entry_ids:
+            return []
+        return db.query(TaskQueueEntry).filter(TaskQueueEntry.id.in_(entry_ids)).all()
+
+    def claim(self, db: Session, entry_id: int, owner: str, now: int, lease_seconds: int) -> bool:
+        """Atomically take the lease. Returns False if another worker got it first."""
+        n = db.query(TaskQueueEntry).filter(
+            TaskQueueEntry.id == entry_id,
+            self._ready_filter(now),
+        ).update({
+            TaskQueueEntry.status: "leased",
+            TaskQueueEntry.lease_owner: owner,
+            TaskQueueEntry.lease_expires_at: now + lease_seconds,
+            TaskQueueEntry.heartbeat_at: now,
+            TaskQueueEntry.attempts: TaskQueueEntry.attempts + 1,
+            TaskQueueEntry.updated_at: now,
+        }, synchronize_session=False)
+        db.commit()
+        return n == 1
+
+    def heartbeat(self, db: Session, owner: str, entry_ids: List[int], now: int, lease_seconds: int) -> int:
+        if not entry_ids:
+            return 0
+        n = db.query(TaskQueueEntry).filter(
+            TaskQueueEntry.id.in_(entry_ids),
+            TaskQueueEntry.lease_owner == owner,
+            TaskQueueEntry.status == "leased",
+        ).update({
+            TaskQueueEntry.lease_expires_at: now + lease_seconds,
+            TaskQueueEntry.heartbeat_at: now,
+        }, synchronize_session=False)
+        db.commit()
+        return n
+
+    def complete(self, db: Session, entry_id: int, owner: str, status: str = "done", error: Optional[str] = None) -> None:
+        values = {
+            TaskQueueEntry.status: status,
+            TaskQueueEntry.lease_expires_at: None,
+            TaskQueueEntry.updated_at: int(time.time()),
+        }
+        if error:
+            values[TaskQueueEntry.last_error] = error[:2000]
+        db.query(TaskQueueEntry).filter(
+            TaskQueueEntry.id == entry_id,
+            TaskQueueEntry.lease_owner == owner,
+            TaskQueueEntry.status != "cancelled",
+        ).update(values, synchronize_session=False)
+        db.commit()
+
+    def release(self, db: Session, entry_id: int, owner: str) -> None:
+        """Hand a leased entry back to the queue without counting it as an attempt (graceful shutdown)."""
+        db.query(TaskQueueEntry).filter(
+            TaskQueueEntry.id == entry_id,
+            TaskQueueEntry.lease_owner == owner,
+            TaskQueueEntry.status == "leased",
+        ).update({
+            TaskQueueEntry.status: "queued",
+            TaskQueueEntry.lease_owner: None,
+            TaskQueueEntry.lease_expires_at: None,
+            TaskQueueEntry.attempts: case((TaskQueueEntry.attempts > 0, TaskQueueEntry.attempts - 1), else_=0),
+            TaskQueueEntry.updated_at: int(time.time()),
+        }, synchronize_session=False)
+        db.commit()
+
+    def fail_exhausted(self, db: Session, now: int) -> List[int]:
+        """Entries whose lease expired after the last allowed attempt are poison; mark them failed."""
+        rows = db.query(TaskQueueEntry).filter(
+            TaskQueueEntry.status == "leased",
+            TaskQueueEntry.lease_expires_at < now,
+            TaskQueueEntry.attempts >= TaskQueueEntry.max_attempts,
+        ).all()
+        task_ids = []
+        for e in rows:
+            e.status = "failed"
+            e.last_error = "lease expired after max attempts"
+            e.updated_at = now
+            task_ids.append(e.task_id)
+        if rows:
+            db.commit()
+        return task_ids
+
+    def cancel_task(self, db: Session, task_id: int) -> int:
+        """Take a task's pending entry out of the queue. Leases held by any worker are revoked."""
+        n = db.query(TaskQueueEntry).filter(
+            TaskQueueEntry.task_id == task_id,
+            TaskQueueEntry.status.in_(["queued", "leased"]),
+        ).update({
+            TaskQueueEntry.status: "cancelled",
+            TaskQueueEntry.lease_expires_at: None,
+            TaskQueueEntry.updated_at: int(time.time()),
+        }, synchronize_session=False)
+        db.commit()
+        return n
+
+    def cancelled_among(self, db: Session, entry_ids: List[int]) -> List[int]:
+        """Entries (of the given ids) that were cancelled, possibly through another worker."""
+        if not entry_ids:
+            return []
+        rows = db.query(TaskQueueEntry.id).filter(
+            TaskQueueEntry.id.in_(entry_ids),
+            TaskQueueEntry.status == "cancelled",
+        ).all()
+        return [r for (r,) in rows]
+
+    def delete_for_tasks(self, db: Session, task_ids: List[int]) -> int:
+        """Drop the entries of deleted tasks, whatever their state."""
+        n = 0
+        for start in range(0, len(task_ids), 500):
+            n += db.query(TaskQueueEntry).filter(
+                TaskQueueEntry.task_id.in_(task_ids[start:start + 500]),
+            ).delete(synchronize_session=False)
+        db.commit()
+        return n
+
+    def prune_finished(self, db: Session, before: int) -> int:
+        """Delete done/failed/cancelled entries last updated before `before`, so the ready scans stay small."""
+        n = db.query(TaskQueueEntry).filter(
+            TaskQueueEntry.status.in_(["done", "failed", "cancelled"]),
+            TaskQueueEntry.updated_at < before,
+        ).delete(synchronize_session=False)
+        db.commit()
+        return n
+
+    def has_pending(self, db: Session, task_id: int) -> bool:
+        return db.query(TaskQueueEntry.id).filter(
+            TaskQueueEntry.task_id == task_id,
+            TaskQueueEntry.status.in_(["queued", "leased"]),
+        ).first() is not None
+
+    def count_by_status(self, db: Session) -> Dict[str, int]:
+        rows = db.query(TaskQueueEntry.status, func.count(TaskQueueEntry.id)).group_by(TaskQueueEntry.status).all()
+        return {s: c for s, c in rows}
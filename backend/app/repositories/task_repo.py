@@ -1,8 +1,15 @@
 import json
-from sqlalchemy.orm import Session
-from typing import Optional, List
+from sqlalchemy import or_, and_, func
+from sqlalchemy.orm import Session, load_only
+from typing import Optional, List, Tuple
 from ..models.task import Task
 
+# Columns needed to render a task card; prompt and input_images can be large
+LIGHT_COLUMNS = (
+    Task.id, Task.user_id, Task.type, Task.model_id, Task.status, Task.result_urls, Task.video_url,
+    Task.last_frame_url, Task.ratio, Task.resolution, Task.duration, Task.created_at, Task.finished_at,
+)
+
 class TaskRepo:
     def create(self, db: Session, data: dict) -> Task:
         t = Task(**data)
@@ -30,15 +37,72 @@ class TaskRepo:
         db.commit()
     def list_by_user(self, db: Session, user_id: int) -> List[Task]:
         return db.query(Task).filter(Task.user_id == user_id).all()
-    def clear_all(self, db: Session, user_id: int, task_type: Optional[str] = None) -> None:
-        query = db.query(Task).filter(
+    def _filtered(self, db: Session, user_id: int, task_type: Optional[str] = None, status: Optional[str] = None,
+                  model_id: Optional[int] = None, since: Optional[int] = None, until: Optional[int] = None):
+        q = db.query(Task).filter(Task.user_id == user_id)
+        if task_type:
+            q = q.filter(Task.type == task_type)
+        if status:
+            q = q.filter(Task.status.in_(status.split(",")))
+        if model_id is not None:
+            q = q.filter(Task.model_id == model_id)
+        if since is not None:
+            q = q.filter(Task.created_at >= since)
+        if until is not None:
+            q = q.filter(Task.created_at < until)
+        return q
+
+    def list_page(self, db: Session, user_id: int, limit: Optional[int] = None, after: Optional[Tuple[int, int]] = None,
+                  light: bool = False, **filters) -> List[Task]:
+        """
+        Newest first, keyset-paginated on (created_at, id): `after` is the (created_at, id)
+        of the last row of the previous page. light=True skips prompt and input_images.
+        """
+        q = self._filtered(db, user_id, **filters)
+        if after:
+            created_at, task_id = after
+            q = q.filter(or_(Task.created_at < created_at, and_(Task.created_at == created_at, Task.id < task_id)))
+        if light:
+            q = q.options(load_only(*LIGHT_COLUMNS))
+        q = q.order_by(Task.created_at.desc(), Task.id.desc())
+        if limit:
+            q = q.limit(limit)
+        return q.all()
+
+    def count(self, db: Session, user_id: int, **filters) -> int:
+        return self._filtered(db, user_id, **filters).with_entities(func.count(Task.id)).scalar() or 0
+
+    def clear_all(self, db: Session, user_id: int, task_type: Optional[str] = None) -> List[tuple]:
+        """
+        Delete finished tasks. Returns (id, result_urls, input_images, video_url, last_frame_url)
+        of the deleted rows so their files can be released afterwards.
+        """
+        query = db.query(Task.id, Task.result_urls, Task.input_images, Task.video_url, Task.last_frame_url).filter(
             Task.user_id == user_id,
-            Task.status.in_(['succeeded', 'failed'])
+            Task.status.in_(['succeeded', 'failed', 'cancelled'])
         )
         if task_type:
             query = query.filter(Task.type == task_type)
-        query.delete(synchronize_session=False)
+        rows = [tuple(r) for r in query.all()]
+        ids = [r[0] for r in rows]
+        for start in range(0, len(ids), 500):
+            db.query(Task).filter(Task.id.in_(ids[start:start + 500])).delete(synchronize_session=False)
         db.commit()
+        return rows
+
+    def is_output_shared(self, db: Session, url: str, exclude_task_id: int) -> bool:
+        """True if another task still references this output URL (e.g. it was served from the result cache)."""
+        return db.query(Task.id).filter(
+            Task.id != exclude_task_id,
+            or_(Task.video_url == url, Task.last_frame_url == url, Task.result_urls.contains(json.dumps(url), autoescape=True)),
+        ).first() is not None
+
+    def is_input_shared(self, db: Session, url: str, exclude_task_id: int) -> bool:
+        """True if another task still uses this input image (inputs are stored by content)."""
+        return db.query(Task.id).filter(
+            Task.id != exclude_task_id,
+            Task.input_images.contains(json.dumps(url), autoescape=True),
+        ).first() is not None
 
     def get(self, db: Session, task_id: int) -> Optional[Task]:
         return db.query(Task).filter(Task.id == task_id).first()
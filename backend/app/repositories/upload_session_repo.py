@@ -0,0 +1,38 @@
+import time
+from typing import Optional
+from sqlalchemy.orm import Session
+from ..models.upload_session import UploadSession
+
+class UploadSessionRepo:
+    def create(self, db: Session, data: dict) -> UploadSession:
+        s = UploadSession(**data)
+        db.add(s)
+        db.commit()
+        db.refresh(s)
+        return s
+
+    def get(self, db: Session, session_id: str) -> Optional[UploadSession]:
+        return db.get(UploadSession, session_id)
+
+    def complete(self, db: Session, session_id: str, size: Optional[int], url: str,
+                 sha256: Optional[str] = None, etag: Optional[str] = None,
+                 object_key: Optional[str] = None) -> Optional[UploadSession]:
+        s = db.get(UploadSession, session_id)
+        if not s:
+            return None
+        s.status = "completed"
+        s.size = size
+        s.url = url
+        s.sha256 = sha256 or s.sha256
+        s.etag = etag or s.etag
+        s.object_key = object_key or s.object_key
+        s.completed_at = int(time.time())
+        db.commit()
+        db.refresh(s)
+        return s
+
+    def set_digest(self, db: Session, session_id: str, size: int, sha256: str) -> None:
+        db.query(UploadSession).filter(UploadSession.id == session_id).update(
+            {UploadSession.size: size, UploadSession.sha256: sha256}, synchronize_session=False
+        )
+        db.commit()
@@ -5,10 +5,13 @@ class CreateTaskRequest(BaseModel):
     type: str
     model_id: int
     prompt: Optional[str] = None
-    images: Optional[List[str]] = None
+    images: Optional[List[str]] = None # data:image/...;base64 strings or "upload:<id>" refs from /api/uploads
     size: Optional[str] = None
     params: Optional[Dict[str, Any]] = None
     content: Optional[List[Dict[str, Any]]] = None # Support flexible content structure
+    priority: Optional[str] = None # interactive (default) | batch | background
+    project_id: Optional[str] = None
+    use_cache: Optional[bool] = True # False forces a fresh upstream generation
 
 class TaskOut(BaseModel):
     id: str # Return as string to handle 64-bit integers safely in JS
@@ -25,3 +28,5 @@ class TaskOut(BaseModel):
     resolution: Optional[str] = None
     ratio: Optional[str] = None
     duration: Optional[int] = None
+    queue_position: Optional[int] = None # 0 = next to dispatch; only set while queued
+    estimated_wait_seconds: Optional[float] = None
@@ -0,0 +1,41 @@
+from pydantic import BaseModel
+from typing import Any, Dict, List, Optional
+
+class UploadStartRequest(BaseModel):
+    filename: str
+    content_type: Optional[str] = None
+    size: Optional[int] = None # bytes; required to get multipart part URLs for large files
+    purpose: str = "task_input" # task_input | asset | best_practice
+
+class UploadPartUrl(BaseModel):
+    part_number: int
+    url: str
+
+class UploadStartResponse(BaseModel):
+    id: str
+    ref: str # "upload:<id>", accepted in CreateTaskRequest.images once completed
+    backend: str # tos | local
+    method: str = "PUT"
+    url: Optional[str] = None # single-request upload target
+    headers: Dict[str, str] = {}
+    part_size: Optional[int] = None
+    parts: Optional[List[UploadPartUrl]] = None # multipart: PUT each slice to its URL
+    expires_at: int
+
+class UploadedPartIn(BaseModel):
+    part_number: int
+    etag: str
+
+class UploadCompleteRequest(BaseModel):
+    parts: Optional[List[UploadedPartIn]] = None # ETags returned by each part PUT
+    asset_type: Optional[str] = "script" # asset type when purpose is "asset"
+
+class UploadOut(BaseModel):
+    id: str
+    ref: str
+    status: str
+    purpose: str
+    filename: str
+    size: Optional[int] = None
+    url: Optional[str] = None
+    asset: Optional[Dict[str, Any]] = None # set when purpose is "asset"
@@ -0,0 +1,131 @@
+import time
+from collections import deque
+from typing import Dict, Optional
+import httpx
+from .token_bucket import TokenBucket
+from .. import settings
+
+class _ModelState:
+    def __init__(self, ceiling: int):
+        self.ceiling = max(1, ceiling or 1)
+        self.limit = float(self.ceiling)
+        self.latency_ewma: Optional[float] = None
+        self.baseline: Optional[float] = None # long-horizon latency EWMA
+        self.last_decrease = 0.0
+        self.successes = 0
+        self.throttled = 0
+        self.server_errors = 0
+        self.timeouts = 0
+
+class AdaptiveConcurrency:
+    """
+    AIMD controller for per-model upstream concurrency.
+
+    Each upstream create call reports its outcome via observe():
+      - 429 / 5xx / timeout   -> multiplicative decrease (limit *= DECREASE_FACTOR)
+      - success but latency well above the model's baseline -> gentler decrease
+      - healthy success       -> additive increase of 1/limit (about +1 per limit's worth of calls)
+    Decreases are rate limited by a cooldown so one burst of failures from jobs
+    that were already in flight only counts once. The resulting limit, clamped between
+    ADAPTIVE_MIN_CONCURRENCY and concurrency_quota, is applied with TokenBucket.set_limit.
+    """
+    def __init__(self):
+        self.enabled = settings.ADAPTIVE_CONCURRENCY_ENABLED
+        self.floor = max(1, settings.ADAPTIVE_MIN_CONCURRENCY)
+        self.decrease_factor = settings.ADAPTIVE_DECREASE_FACTOR
+        self.latency_tolerance = settings.ADAPTIVE_LATENCY_TOLERANCE
+        self.cooldown = settings.ADAPTIVE_COOLDOWN_SECONDS
+        self.models: Dict[int, _ModelState] = {}
+        self.decisions = deque(maxlen=100)
+
+    def configure(self, model_id: int, ceiling: int, bucket: TokenBucket):
+        """Track a model (or pick up a new concurrency_quota) and re-apply the clamped limit."""
+        st = self.models.get(model_id)
+        if st is None:
+            st = self.models[model_id] = _ModelState(ceiling)
+        else:
+            st.ceiling = max(1, ceiling or 1)
+            st.limit = min(st.limit, float(st.ceiling))
+        if self.enabled:
+            bucket.set_limit(st.limit)
+
+    @staticmethod
+    def classify(exc: Optional[BaseException]) -> Optional[str]:
+        """Map an upstream call outcome to a signal; None means it says nothing about capacity."""
+        if exc is None:
+            return "ok"
+        if isinstance(exc, httpx.TimeoutException):
+            return "timeout"
+        if isinstance(exc, httpx.HTTPStatusError):
+            code = exc.response.status_code
+            if code == 429:
+                return "throttled"
+            if code >= 500:
+                return "server_error"
+        return None
+
+    def observe(self, model_id: int, bucket: TokenBucket, signal: Optional[str], latency: float):
+        if not self.enabled or signal is None:
+            return
+        st = self.models.get(model_id)
+        if st is None:
+            st = self.models[model_id] = _ModelState(bucket.capacity)
+        now = time.monotonic()
+        old = st.limit
+
+        if signal == "ok":
+            st.successes += 1
+            # Short EWMA tracks current latency; the long one is the model's normal latency
+            st.latency_ewma = latency if st.latency_ewma is None else 0.7 * st.latency_ewma + 0.3 * latency
+            st.baseline = latency if st.baseline is None else 0.95 * st.baseline + 0.05 * latency
+            if st.baseline > 0 and st.latency_ewma > st.baseline * self.latency_tolerance:
+                reason = f"latency {st.latency_ewma:.2f}s > {self.latency_tolerance}x baseline {st.baseline:.2f}s"
+                self._decrease(st, now, (1 + self.decrease_factor) / 2, reason, model_id)
+            else:
+                st.limit = min(float(st.ceiling), st.limit + 1.0 / max(st.limit, 1.0))
+        else:
+            if signal == "throttled":
+                st.throttled += 1
+            elif signal == "server_error":
+                st.server_errors += 1
+            else:
+                st.timeouts += 1
+            self._decrease(st, now, self.decrease_factor, signal, model_id)
+
+        if int(st.limit) > int(old):
+            self._record(model_id, old, st.limit, "additive increase")
+        bucket.set_limit(st.limit)
+
+    def _decrease(self, st: _ModelState, now: float, factor: float, reason: str, model_id: int):
+        if now - st.last_decrease < self.cooldown:
+            return
+        old = st.limit
+        st.limit = max(float(self.floor), st.limit * factor)
+        st.last_decrease = now
+        if st.limit != old:
+            self._record(model_id, old, st.limit, reason)
+
+    def _record(self, model_id: int, old: float, new: float, reason: str):
+        d = {"at": int(time.time()), "model_id": model_id, "from": int(old), "to": int(new), "reason": reason}
+        self.decisions.append(d)
+        print(f"AdaptiveConcurrency: model {model_id} limit {d['from']} -> {d['to']} ({reason})")
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "floor": self.floor,
+            "models": {
+                str(mid): {
+                    "limit": int(st.limit),
+                    "ceiling": st.ceiling,
+                    "latency_ewma": round(st.latency_ewma, 3) if st.latency_ewma is not None else None,
+                    "baseline_latency": round(st.baseline, 3) if st.baseline is not None else None,
+                    "successes": st.successes,
+                    "throttled": st.throttled,
+                    "server_errors": st.server_errors,
+                    "timeouts": st.timeouts,
+                }
+                for mid, st in self.models.items()
+            },
+            "recent_decisions": list(self.decisions),
+        }
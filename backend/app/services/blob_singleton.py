@@ -0,0 +1,3 @@
+from .blob_store import BlobStore
+
+blobs = BlobStore()
@@ -0,0 +1,237 @@
+import hashlib
+import mimetypes
+import os
+import shutil
+import threading
+import uuid
+from typing import Iterable, List, Optional, Tuple
+import tos
+from ..db import SessionLocal
+from ..models.blob import Blob
+from ..repositories.blob_repo import BlobRepo
+from .storage_service import StorageService, APP_DIR
+from .io_singleton import io_pools
+from .. import settings
+
+LOCAL_DIR = "static/blobs"
+REMOTE_PREFIX = "anime_platform/blobs"
+INCOMING_DIR = f"{LOCAL_DIR}/incoming"
+
+# (owner_type, owner_id, role) recorded together with a put
+Owner = Tuple[str, object, str]
+
+def is_blob_url(url: str) -> bool:
+    """True for URLs of content-addressed blobs (their files are released through refcounts)."""
+    return isinstance(url, str) and (f"/{LOCAL_DIR}/" in url or f"/{REMOTE_PREFIX}/" in url)
+
+def _ext(filename: Optional[str], content_type: Optional[str]) -> str:
+    ext = os.path.splitext(filename or "")[1].lower()
+    if not ext and content_type:
+        ext = mimetypes.guess_extension(content_type) or ""
+    return ext if len(ext) <= 10 else ""
+
+def _sha256_file(path: str) -> str:
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(settings.STORAGE_STREAM_CHUNK_SIZE), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+class BlobStore:
+    """
+    Content-addressed file storage.
+
+    Files live at static/blobs/<ab>/<sha256><ext> and, when TOS is configured, at
+    anime_platform/blobs/<ab>/<sha256><ext>. The blobs table records where each digest
+    is stored, so a file that is already there is neither written nor uploaded again.
+    blob_refs links tasks, assets and best practices to the blobs they use; releasing
+    an owner decrements the counts and tombstones files nobody references any more.
+    """
+    def __init__(self, storage: StorageService = None):
+        self.storage = storage or StorageService()
+        self.repo = BlobRepo()
+        self._lock = threading.Lock()
+        self.puts = 0
+        self.deduplicated = 0 # puts whose content was already stored
+        self.uploads = 0
+        self.uploads_skipped = 0
+        self.released = 0 # blobs handed to the storage GC
+
+    def _count(self, name: str, n: int = 1):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + n)
+
+    def _in_session(self, fn, *args):
+        db = SessionLocal()
+        try:
+            return fn(db, *args)
+        finally:
+            db.close()
+
+    def _upload(self, client, bucket: str, key: str, path: str, size: int, content_type: Optional[str], sha256: str):
+        try:
+            client.head_object(bucket, key)
+            return # uploaded before, but the row was lost
+        except tos.exceptions.TosServerError as e:
+            if e.status_code != 404:
+                raise
+        meta = {"sha256": sha256}
+        # Content-addressed: the bytes behind a key never change
+        cache_control = f"public, max-age={settings.STATIC_IMMUTABLE_MAX_AGE}, immutable"
+        if size >= settings.STORAGE_MULTIPART_THRESHOLD:
+            client.upload_file(bucket, key, path, content_type=content_type, meta=meta, cache_control=cache_control,
+                               part_size=settings.STORAGE_MULTIPART_PART_SIZE,
+                               task_num=settings.STORAGE_MULTIPART_THREADS, enable_checkpoint=False)
+        else:
+            client.put_object_from_file(bucket, key, path, content_type=content_type, meta=meta, cache_control=cache_control)
+        self._count("uploads")
+        print(f"Uploaded blob {sha256[:12]} ({size} bytes) to TOS key {key}")
+
+    def _store(self, db, sha256: str, size: int, ext: str, content_type: Optional[str],
+               data: Optional[bytes], src: Optional[str], move: bool, remote: bool, owner: Optional[Owner]) -> Blob:
+        existing = self.repo.get(db, sha256)
+        if existing is None:
+            # Released earlier and stored again before the GC got to it: keep the files
+            from .gc_singleton import storage_gc
+            storage_gc.repo.cancel_sha(db, sha256)
+        rel = existing.local_path if existing and existing.local_path else f"{LOCAL_DIR}/{sha256[:2]}/{sha256}{ext}"
+        path = os.path.join(APP_DIR, rel)
+        self._count("puts")
+        if os.path.exists(path):
+            self._count("deduplicated")
+            if src and move:
+                os.remove(src)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            if src and move:
+                os.replace(src, path)
+            else:
+                tmp = f"{path}.part-{uuid.uuid4().hex[:8]}"
+                try:
+                    if data is not None:
+                        with open(tmp, "wb") as f:
+                            f.write(data)
+                    else:
+                        shutil.copyfile(src, tmp)
+                    os.replace(tmp, path)
+                finally:
+                    if os.path.exists(tmp):
+                        os.remove(tmp)
+
+        bucket = key = None
+        if remote:
+            client, bucket = self.storage._tos_target()
+            if client:
+                if existing and existing.object_key and existing.bucket == bucket:
+                    key = existing.object_key
+                    self._count("uploads_skipped")
+                else:
+                    key = f"{REMOTE_PREFIX}/{sha256[:2]}/{sha256}{ext}"
+                    try:
+                        self._upload(client, bucket, key, path, size, content_type, sha256)
+                    except Exception as e:
+                        # Keep the local copy; the next put of the same content retries
+                        print(f"TOS Upload skipped/failed: {e}")
+                        key = None
+        blob = self.repo.ensure(db, sha256, size, content_type, rel, bucket if key else None, key)
+        if key:
+            # The local file is now only a cached copy and may be evicted under the byte budget
+            from .media_singleton import media_cache
+            media_cache.admit(sha256, rel, size, object_key=key)
+        if owner:
+            self.repo.add_ref(db, sha256, *owner)
+            db.refresh(blob)
+        db.expunge(blob)
+        return blob
+
+    async def put_bytes(self, data: bytes, filename: str = None, content_type: str = None,
+                        remote: bool = True, owner: Optional[Owner] = None) -> Blob:
+        """Store bytes once by content. `remote=False` keeps the blob on local disk only."""
+        content_type = content_type or mimetypes.guess_type(filename or "")[0]
+        sha = await io_pools.run("file", lambda: hashlib.sha256(data).hexdigest())
+        return await io_pools.run("storage", self._in_session, self._store, sha, len(data), _ext(filename, content_type),
+                                  content_type, data, None, False, remote, owner)
+
+    def store_file(self, db, path: str, filename: str = None, content_type: str = None, sha256: str = None,
+                   move: bool = False, remote: bool = True, owner: Optional[Owner] = None) -> Blob:
+        """Blocking put_file for code already running in a worker thread with a session."""
+        content_type = content_type or mimetypes.guess_type(filename or path)[0]
+        sha256 = sha256 or _sha256_file(path)
+        return self._store(db, sha256, os.path.getsize(path), _ext(filename or path, content_type),
+                           content_type, None, path, move, remote, owner)
+
+    async def put_file(self, path: str, filename: str = None, content_type: str = None, sha256: str = None,
+                       move: bool = False, remote: bool = True, owner: Optional[Owner] = None) -> Blob:
+        """Store a file from disk without reading it into memory; `move` hands the file over."""
+        if not sha256:
+            sha256 = await io_pools.run("file", _sha256_file, path)
+        return await io_pools.run("storage", self._in_session, self.store_file, path, filename, content_type,
+                                  sha256, move, remote, owner)
+
+    def incoming_path(self) -> str:
+        """Scratch file next to the blobs, so put_file(move=True) is a rename."""
+        path = os.path.join(APP_DIR, INCOMING_DIR, uuid.uuid4().hex)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return path
+
+    def url(self, blob: Blob, signed: bool = False) -> str:
+        """
+        Stored URL of a blob: the object URL in the configured bucket (pre-signed if
+        `signed`), else the local /static path.
+        """
+        if blob.object_key:
+            client, bucket = self.storage._tos_target()
+            if client and bucket == blob.bucket:
+                if signed:
+                    return self.storage._sign_get(client, bucket, blob.object_key)
+                return self.storage.object_url(bucket, blob.object_key)
+        return f"/{blob.local_path}"
+
+    def local_file(self, blob: Blob) -> Optional[str]:
+        if blob.local_path:
+            path = os.path.join(APP_DIR, blob.local_path)
+            if os.path.exists(path):
+                return path
+        return None
+
+    def find(self, db, url: str) -> Optional[Blob]:
+        """Blob behind a stored URL (local /static path or bucket URL, signed or not)."""
+        if not is_blob_url(url):
+            return None
+        if url.startswith("/static/"):
+            return self.repo.find(db, local_path=url.split("?")[0].lstrip("/"))
+        return self.repo.find(db, object_key=self.storage.object_key(url))
+
+    def ref(self, db, sha256: str, owner_type: str, owner_id, role: str) -> bool:
+        return self.repo.get(db, sha256) is not None and self.repo.add_ref(db, sha256, owner_type, owner_id, role)
+
+    def ref_urls(self, db, urls: Iterable[str], owner_type: str, owner_id, role: str) -> int:
+        """Link owner to the blobs behind `urls`; URLs outside the blob store are ignored."""
+        n = 0
+        for url in urls:
+            b = self.find(db, url)
+            if b and self.repo.add_ref(db, b.sha256, owner_type, owner_id, role):
+                n += 1
+        return n
+
+    def release_blocking(self, db, owner_type: str, owner_id, roles: Optional[List[str]] = None,
+                         reason: str = "released") -> int:
+        """
+        Drop an owner's refs. Blobs no one uses any more lose their row and get tombstones
+        in the same transaction; the storage GC deletes their files in the background.
+        """
+        from .gc_singleton import storage_gc
+        orphans = self.repo.release(db, owner_type, owner_id, roles, commit=False)
+        storage_gc.bury_blobs(db, orphans, reason)
+        self._count("released", len(orphans))
+        return len(orphans)
+
+    async def release(self, owner_type: str, owner_id, roles: Optional[List[str]] = None,
+                      reason: str = "released") -> int:
+        return await io_pools.run("db", self._in_session, self.release_blocking, owner_type, owner_id, roles, reason)
+
+    def stats(self, db) -> dict:
+        out = self.repo.stats(db)
+        out.update(puts=self.puts, deduplicated=self.deduplicated, uploads=self.uploads,
+                   uploads_skipped=self.uploads_skipped, released=self.released)
+        return out
@@ -0,0 +1,89 @@
+import asyncio
+import contextvars
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict
+from .. import settings
+
+class _PoolStats:
+    def __init__(self):
+        self.submitted = 0
+        self.active = 0
+        self.max_active = 0
+        self.busy_seconds = 0.0
+        self.max_seconds = 0.0
+        self.lock = threading.Lock()
+
+class BlockingIOPools:
+    """
+    Bounded thread pools for blocking I/O, one per kind:
+      db      - SQLAlchemy sessions / commits
+      storage - TOS SDK calls (put_object, pre_signed_url, delete, ...)
+      file    - local file reads/writes that are not already async
+    Keeps synchronous libraries off the event loop without letting one slow kind
+    exhaust the threads of another.
+    """
+    def __init__(self):
+        self._pools: Dict[str, ThreadPoolExecutor] = {}
+        self._stats: Dict[str, _PoolStats] = {}
+        self._lock = threading.Lock()
+
+    def _size(self, kind: str) -> int:
+        return {
+            "db": settings.IO_POOL_DB_SIZE,
+            "storage": settings.IO_POOL_STORAGE_SIZE,
+            "file": settings.IO_POOL_FILE_SIZE,
+        }.get(kind, settings.IO_POOL_FILE_SIZE)
+
+    def pool(self, kind: str) -> ThreadPoolExecutor:
+        p = self._pools.get(kind)
+        if p is None:
+            with self._lock:
+                p = self._pools.get(kind)
+                if p is None:
+                    p = ThreadPoolExecutor(max_workers=self._size(kind), thread_name_prefix=f"io-{kind}")
+                    self._stats[kind] = _PoolStats()
+                    self._pools[kind] = p
+        return p
+
+    async def run(self, kind: str, fn: Callable, *args, **kwargs):
+        """Run fn(*args, **kwargs) in the pool for `kind` and await the result."""
+        pool = self.pool(kind)
+        stats = self._stats[kind]
+        ctx = contextvars.copy_context()
+
+        def call():
+            with stats.lock:
+                stats.active += 1
+                stats.max_active = max(stats.max_active, stats.active)
+            t0 = time.monotonic()
+            try:
+                return ctx.run(fn, *args, **kwargs)
+            finally:
+                elapsed = time.monotonic() - t0
+                with stats.lock:
+                    stats.active -= 1
+                    stats.busy_seconds += elapsed
+                    stats.max_seconds = max(stats.max_seconds, elapsed)
+
+        stats.submitted += 1
+        return await asyncio.get_running_loop().run_in_executor(pool, call)
+
+    def shutdown(self):
+        pools, self._pools = self._pools, {}
+        for p in pools.values():
+            p.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> dict:
+        out = {}
+        for kind, s in self._stats.items():
+            out[kind] = {
+                "size": self._size(kind),
+                "submitted": s.submitted,
+                "active": s.active,
+                "max_active": s.max_active,
+                "busy_seconds": round(s.busy_seconds, 3),
+                "max_call_seconds": round(s.max_seconds, 3),
+            }
+        return out
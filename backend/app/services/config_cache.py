@@ -0,0 +1,136 @@
+import asyncio
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+from sqlalchemy.orm import Session
+from ..db import SessionLocal
+from ..repositories.system_config_repo import SystemConfigRepo
+from .io_singleton import io_pools
+from .. import settings
+
+class SystemConfigCache:
+    """
+    Process-wide copy of the system_configs table.
+
+    All rows are loaded once; reads are dict lookups. Every SystemConfigRepo.set bumps
+    a version counter in the database: the process that wrote calls invalidate() and
+    reloads at once, other workers notice the new version within CONFIG_CACHE_CHECK_SECONDS.
+    Clients built from config (TOS, VikingDB) subscribe() to the keys they depend on
+    and are only rebuilt when one of those keys actually changes.
+    """
+    def __init__(self):
+        self.repo = SystemConfigRepo()
+        self.check_interval = settings.CONFIG_CACHE_CHECK_SECONDS
+        self._values: Dict[str, str] = {}
+        self._subscribers: List[Tuple[frozenset, Callable[[Set[str]], None]]] = []
+        self._lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self.version = -1
+        self.loaded_at = 0.0
+        self.reloads = 0
+
+    def _with_session(self, fn, db: Session = None):
+        if db is not None:
+            return fn(db)
+        db = SessionLocal()
+        try:
+            return fn(db)
+        finally:
+            db.close()
+
+    def load(self, db: Session = None) -> Set[str]:
+        """Read all rows and the version; notify subscribers of keys whose value changed."""
+        def read(db):
+            return self.repo.get_version(db), self.repo.values(db)
+        version, values = self._with_session(read, db)
+        with self._lock:
+            first = self.version < 0
+            old = self._values
+            self._values = values
+            self.version = version
+            self.loaded_at = time.time()
+            self.reloads += 1
+            subscribers = list(self._subscribers)
+        changed = set() if first else {k for k in set(old) | set(values) if old.get(k) != values.get(k)}
+        if changed:
+            print(f"SystemConfigCache: version {version}, changed {sorted(changed)}")
+        for keys, callback in subscribers:
+            if changed & keys:
+                try:
+                    callback(changed & keys)
+                except Exception as e:
+                    print(f"SystemConfigCache: subscriber {callback} failed: {e}")
+        return changed
+
+    def refresh(self, db: Session = None) -> bool:
+        """Reload if another process bumped the version. Returns True if it reloaded."""
+        version = self._with_session(self.repo.get_version, db)
+        if version == self.version:
+            return False
+        self.load(db)
+        return True
+
+    def invalidate(self, db: Session = None):
+        """Call after writing config in this process."""
+        self.load(db)
+
+    def _ensure_loaded(self):
+        if self.version < 0:
+            try:
+                self.load()
+            except Exception as e:
+                print(f"SystemConfigCache: initial load failed: {e}")
+
+    def get(self, key: str, default: Optional[str] = None) -> Optional[str]:
+        """Value of `key` (possibly ""), or `default` if the row does not exist."""
+        self._ensure_loaded()
+        return self._values.get(key, default)
+
+    def get_int(self, key: str, default: int = 0) -> int:
+        try:
+            return int(self.get(key) or default)
+        except ValueError:
+            return default
+
+    def get_bool(self, key: str, default: bool = False) -> bool:
+        v = self.get(key)
+        if v is None or v == "":
+            return default
+        return v not in ("0", "false", "False")
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Optional[str]]:
+        self._ensure_loaded()
+        values = self._values
+        return {k: values.get(k) for k in keys}
+
+    def subscribe(self, keys: Iterable[str], callback: Callable[[Set[str]], None]):
+        """Call callback(changed_keys) after a reload that changed any of `keys`."""
+        with self._lock:
+            self._subscribers.append((frozenset(keys), callback))
+
+    def start(self):
+        if self._task is None and self.check_interval > 0:
+            self._task = asyncio.create_task(self._watch())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(self.check_interval)
+            try:
+                await io_pools.run("db", self.refresh)
+            except Exception as e:
+                print(f"SystemConfigCache: version check failed: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "version": self.version,
+            "keys": len(self._values),
+            "loaded_at": int(self.loaded_at),
+            "reloads": self.reloads,
+            "subscribers": len(self._subscribers),
+            "check_interval_seconds": self.check_interval,
+        }
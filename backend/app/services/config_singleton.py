@@ -0,0 +1,3 @@
+from .config_cache import SystemConfigCache
+
+config_cache = SystemConfigCache()
@@ -0,0 +1,93 @@
+import math
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+from .. import settings
+
+LANES = {"interactive": 0, "batch": 1, "background": 2}
+DEFAULT_LANE = "interactive"
+
+def normalize_priority(priority: Optional[str]) -> Optional[str]:
+    """Return the lane name, DEFAULT_LANE for empty input, or None if unknown."""
+    if not priority:
+        return DEFAULT_LANE
+    priority = priority.lower()
+    return priority if priority in LANES else None
+
+def _parse_weights(raw: str) -> Dict[int, float]:
+    weights = {}
+    for part in (raw or "").split(","):
+        if ":" not in part:
+            continue
+        uid, w = part.split(":", 1)
+        try:
+            weights[int(uid)] = max(float(w), 0.01)
+        except ValueError:
+            print(f"FairScheduler: ignoring bad weight '{part}'")
+    return weights
+
+class FairScheduler:
+    """
+    Orders ready queue entries before they reach the model buckets.
+
+    - Lanes are strict priority (interactive > batch > background); an entry moves up one
+      lane for every SCHEDULER_AGING_SECONDS it has waited, up to interactive, so nothing starves.
+    - Within a lane, users are weighted-fair: the k-th waiting entry of a user gets the
+      virtual tag (running_jobs + k) / weight, so someone with 300 queued images
+      interleaves with, rather than blocks, a colleague's single preview.
+    - Within a user, projects are served round robin.
+    """
+    def __init__(self):
+        self.weights = _parse_weights(settings.SCHEDULER_USER_WEIGHTS)
+        self.aging = settings.SCHEDULER_AGING_SECONDS
+
+    def _lane(self, row, now: int) -> int:
+        lane = LANES.get(row.priority or DEFAULT_LANE, LANES[DEFAULT_LANE])
+        if self.aging > 0 and row.created_at:
+            lane -= int((now - row.created_at) // self.aging)
+        return max(0, lane)
+
+    def order(self, rows: Iterable, now: int, running_by_user: Optional[Dict[int, int]] = None) -> List:
+        """rows need id, priority, user_id, project_id, created_at. Returns them in dispatch order."""
+        running_by_user = running_by_user or {}
+        by_lane_user: Dict[Tuple[int, int], list] = defaultdict(list)
+        for r in rows:
+            by_lane_user[(self._lane(r, now), r.user_id or 0)].append(r)
+
+        keyed = []
+        for (lane, user_id), items in by_lane_user.items():
+            # Round robin across the user's projects, oldest first within each project
+            per_project: Dict[str, list] = defaultdict(list)
+            for r in sorted(items, key=lambda r: r.id):
+                per_project[r.project_id or ""].append(r)
+            interleaved = []
+            for i in range(max(len(v) for v in per_project.values())):
+                for v in per_project.values():
+                    if i < len(v):
+                        interleaved.append(v[i])
+            weight = self.weights.get(user_id, 1.0)
+            base = running_by_user.get(user_id, 0)
+            for k, r in enumerate(interleaved):
+                keyed.append(((lane, (base + k) / weight, r.id), r))
+        keyed.sort(key=lambda x: x[0])
+        return [r for _, r in keyed]
+
+    def positions(self, rows: Iterable, now: int, limits: Dict[int, int], avg_seconds: Dict[int, float],
+                  running_by_user: Optional[Dict[int, int]] = None) -> Dict[int, Tuple[int, float]]:
+        """
+        task_id -> (queue_position, estimated_wait_seconds), per model.
+        Position 0 is next in line; the wait assumes `limit` jobs complete every avg job duration.
+        """
+        by_model: Dict[int, list] = defaultdict(list)
+        for r in self.order(rows, now, running_by_user):
+            by_model[r.model_id].append(r)
+        out = {}
+        for model_id, ordered in by_model.items():
+            for pos, r in enumerate(ordered):
+                out[r.task_id] = (pos, self.wait_seconds(pos, model_id, limits, avg_seconds))
+        return out
+
+    def wait_seconds(self, position: int, model_id: int, limits: Dict[int, int], avg_seconds: Dict[int, float]) -> float:
+        """Estimated wait of the entry at `position` in its model's line."""
+        limit = max(1, limits.get(model_id, 1))
+        avg = avg_seconds.get(model_id, settings.SCHEDULER_DEFAULT_JOB_SECONDS)
+        return round(math.floor(position / limit) * avg, 1)
@@ -0,0 +1,3 @@
+from .storage_gc import StorageGC
+
+storage_gc = StorageGC()
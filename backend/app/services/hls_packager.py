@@ -0,0 +1,122 @@
+import os
+import shutil
+import time
+import uuid
+from fractions import Fraction
+from typing import List, Optional, Tuple
+from .storage_service import APP_DIR
+from .io_singleton import io_pools
+from . import video_stitcher
+from .. import settings
+
+HLS_DIR = "static/hls"
+
+def _bitrate(value: str) -> int:
+    """'600k' -> 600000"""
+    value = value.strip().lower()
+    scale = {"k": 1000, "m": 1000 ** 2}.get(value[-1:], 1)
+    return int(float(value.rstrip("km")) * scale)
+
+def master_playlist(variants: List[Tuple[str, int, Optional[int], Optional[int]]]) -> str:
+    """Master playlist for (playlist path, bandwidth, width, height) variants, best first."""
+    lines = ["#EXTM3U", "#EXT-X-VERSION:3"]
+    for path, bandwidth, width, height in variants:
+        inf = f"#EXT-X-STREAM-INF:BANDWIDTH={bandwidth}"
+        if width and height:
+            inf += f",RESOLUTION={width}x{height}"
+        lines += [inf, path]
+    return "\n".join(lines) + "\n"
+
+def hls_args(seconds: int, out_dir: str) -> List[str]:
+    return [
+        "-f", "hls", "-hls_time", str(seconds), "-hls_playlist_type", "vod",
+        "-hls_segment_filename", os.path.join(out_dir, "seg_%05d.ts"), os.path.join(out_dir, "index.m3u8"),
+    ]
+
+class HlsPackager:
+    """
+    Packages a finished MP4 as HLS under static/hls/<name>/: the original streams copied
+    into HLS_SEGMENT_SECONDS segments (no re-encode; mezzanines and films stitched from
+    them have a keyframe every MEZZANINE_GOP_SECONDS) plus, with HLS_PREVIEW_HEIGHT, a
+    low-bitrate preview rendition, tied together by master.m3u8. A package is written to
+    a scratch directory and renamed into place, so a published one never changes and is
+    served with immutable caching headers.
+    """
+    def __init__(self):
+        self.root = os.path.join(APP_DIR, HLS_DIR)
+        self.packaged = 0
+        self.failures = 0
+        self.seconds = 0.0
+
+    def url(self, name: str) -> Optional[str]:
+        """URL of the master playlist of `name`, if it was packaged."""
+        if os.path.exists(os.path.join(self.root, name, "master.m3u8")):
+            return f"/{HLS_DIR}/{name}/master.m3u8"
+        return None
+
+    def remove(self, name: str):
+        shutil.rmtree(os.path.join(self.root, name), ignore_errors=True)
+
+    async def package(self, src: str, name: str) -> Optional[str]:
+        """Package src as `name`; returns the master playlist URL, or None when disabled or failed."""
+        if not settings.HLS_ENABLED:
+            return None
+        existing = self.url(name)
+        if existing:
+            return existing
+        t0 = time.monotonic()
+        tmp = os.path.join(self.root, f".{name}.part-{uuid.uuid4().hex[:8]}")
+        try:
+            info = await video_stitcher.probe(src)
+            os.makedirs(os.path.join(tmp, "main"))
+            code, _, err = await video_stitcher.run_ffmpeg([
+                settings.FFMPEG_PATH, "-y", "-i", src, "-map", "0:v:0", "-map", "0:a?", "-c", "copy",
+            ] + hls_args(settings.HLS_SEGMENT_SECONDS, os.path.join(tmp, "main")))
+            if code != 0:
+                raise RuntimeError(f"HLS copy failed: {err[-2000:]}")
+            duration = (info or {}).get("duration") or 0
+            # BANDWIDTH is required; without a duration assume a typical 720p clip
+            main_bw = int(os.path.getsize(src) * 8 / duration) if duration else 5000000
+            variants = [("main/index.m3u8", main_bw, (info or {}).get("width"), (info or {}).get("height"))]
+
+            height = settings.HLS_PREVIEW_HEIGHT
+            if height and (not info or (info.get("height") or 0) > height):
+                os.makedirs(os.path.join(tmp, "preview"))
+                gop = str(max(1, round(float(Fraction((info or {}).get("fps") or "25/1")) * settings.HLS_SEGMENT_SECONDS)))
+                code, _, err = await video_stitcher.run_ffmpeg([
+                    settings.FFMPEG_PATH, "-y", "-i", src, "-map", "0:v:0", "-map", "0:a?",
+                    "-vf", f"scale=-2:{height}", "-c:v", "libx264", "-preset", "veryfast",
+                    "-b:v", settings.HLS_PREVIEW_VIDEO_BITRATE, "-maxrate", settings.HLS_PREVIEW_VIDEO_BITRATE,
+                    "-bufsize", str(2 * _bitrate(settings.HLS_PREVIEW_VIDEO_BITRATE)),
+                    "-g", gop, "-keyint_min", gop, "-sc_threshold", "0",
+                    "-c:a", "aac", "-b:a", settings.HLS_PREVIEW_AUDIO_BITRATE, "-ac", "2",
+                    "-threads", str(settings.STITCH_FFMPEG_THREADS),
+                ] + hls_args(settings.HLS_SEGMENT_SECONDS, os.path.join(tmp, "preview")))
+                if code != 0:
+                    raise RuntimeError(f"HLS preview encode failed: {err[-2000:]}")
+                width = None
+                if info and info.get("width") and info.get("height"):
+                    width = int(round(info["width"] * height / info["height"] / 2)) * 2
+                bw = _bitrate(settings.HLS_PREVIEW_VIDEO_BITRATE) + _bitrate(settings.HLS_PREVIEW_AUDIO_BITRATE)
+                variants.append(("preview/index.m3u8", bw, width, height))
+
+            with open(os.path.join(tmp, "master.m3u8"), "w") as f:
+                f.write(master_playlist(variants))
+            dest = os.path.join(self.root, name)
+            if os.path.exists(dest):
+                return self.url(name) # packaged concurrently
+            os.rename(tmp, dest)
+            self.packaged += 1
+            self.seconds += time.monotonic() - t0
+            return self.url(name)
+        except (OSError, RuntimeError) as e:
+            self.failures += 1
+            print(f"HLS packaging of {name} failed: {e}")
+            return None
+        finally:
+            if os.path.exists(tmp):
+                await io_pools.run("file", shutil.rmtree, tmp, True)
+
+    def stats(self) -> dict:
+        return {"enabled": settings.HLS_ENABLED, "packaged": self.packaged, "failures": self.failures,
+                "seconds": round(self.seconds, 2)}
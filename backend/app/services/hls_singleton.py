@@ -0,0 +1,3 @@
+from .hls_packager import HlsPackager
+
+hls = HlsPackager()
@@ -0,0 +1,126 @@
+import httpx
+from typing import Dict, Optional
+from urllib.parse import urlparse
+from .. import settings
+
+try:
+    import h2  # noqa: F401  (httpx only enables HTTP/2 when h2 is installed)
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+# Named client profiles. Each profile owns one keep-alive pool; httpx keeps a
+# separate set of connections per upstream host inside that pool.
+PROFILES = {
+    # Ark API (images / videos / LLM). Supports HTTP/2.
+    "ark": {"http2": True, "follow_redirects": False, "verify": True},
+    # Generated media downloads (TOS / CDN signed URLs)
+    "download": {"http2": True, "follow_redirects": True, "verify": True},
+    # Legacy stitching downloads that tolerate broken certificates
+    "download-insecure": {"http2": False, "follow_redirects": True, "verify": False},
+    "default": {"http2": False, "follow_redirects": True, "verify": True},
+}
+
+class _HostStats:
+    def __init__(self):
+        self.requests = 0
+        self.responses = 0
+        self.connections_opened = 0
+        self.tls_handshakes = 0
+        self.errors = 0
+
+    def to_dict(self) -> dict:
+        reused = max(self.responses - self.connections_opened, 0)
+        return {
+            "requests": self.requests,
+            "responses": self.responses,
+            "connections_opened": self.connections_opened,
+            "tls_handshakes": self.tls_handshakes,
+            "errors": self.errors,
+            "reuse_ratio": round(reused / self.responses, 3) if self.responses else 0.0,
+        }
+
+class HttpClientRegistry:
+    """
+    App-scoped registry of long-lived httpx.AsyncClient instances.
+    Clients are created lazily per profile and closed from the shutdown hook.
+    """
+    def __init__(self):
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        self._stats: Dict[str, Dict[str, _HostStats]] = {}
+
+    def _limits(self) -> httpx.Limits:
+        return httpx.Limits(
+            max_connections=settings.HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY,
+        )
+
+    def get(self, name: str = "default") -> httpx.AsyncClient:
+        client = self._clients.get(name)
+        if client is not None and not client.is_closed:
+            return client
+        profile = PROFILES.get(name, PROFILES["default"])
+        stats = self._stats.setdefault(name, {})
+
+        def host_stats(url) -> _HostStats:
+            host = url.host if hasattr(url, "host") else urlparse(str(url)).hostname
+            return stats.setdefault(host or "", _HostStats())
+
+        async def on_request(request: httpx.Request):
+            hs = host_stats(request.url)
+            hs.requests += 1
+
+            async def trace(event_name: str, info: dict):
+                if event_name == "connection.connect_tcp.complete":
+                    hs.connections_opened += 1
+                elif event_name == "connection.start_tls.complete":
+                    hs.tls_handshakes += 1
+                elif event_name.endswith(".failed"):
+                    hs.errors += 1
+
+            request.extensions["trace"] = trace
+
+        async def on_response(response: httpx.Response):
+            host_stats(response.request.url).responses += 1
+
+        client = httpx.AsyncClient(
+            http2=profile["http2"] and settings.HTTP2_ENABLED and HTTP2_AVAILABLE,
+            verify=profile["verify"],
+            follow_redirects=profile["follow_redirects"],
+            limits=self._limits(),
+            timeout=httpx.Timeout(settings.HTTP_DEFAULT_TIMEOUT, connect=10.0),
+            event_hooks={"request": [on_request], "response": [on_response]},
+        )
+        self._clients[name] = client
+        return client
+
+    def startup(self):
+        print(f"HttpClientRegistry: max_connections={settings.HTTP_MAX_CONNECTIONS}, "
+              f"keepalive={settings.HTTP_MAX_KEEPALIVE}, http2={settings.HTTP2_ENABLED and HTTP2_AVAILABLE}")
+        # Warm up the Ark client so the first job does not pay for construction
+        self.get("ark")
+
+    async def aclose(self):
+        clients, self._clients = self._clients, {}
+        for client in clients.values():
+            try:
+                await client.aclose()
+            except Exception as e:
+                print(f"HttpClientRegistry: close failed: {e}")
+
+    def stats(self) -> dict:
+        out = {}
+        for name, hosts in self._stats.items():
+            entry = {"hosts": {h: s.to_dict() for h, s in hosts.items()}}
+            client = self._clients.get(name)
+            if client is not None:
+                try:
+                    # httpcore pool internals; best effort only
+                    conns = client._transport._pool.connections
+                    entry["open_connections"] = len(conns)
+                    entry["idle_connections"] = sum(1 for c in conns if c.is_idle())
+                except Exception:
+                    pass
+            out[name] = entry
+        return out
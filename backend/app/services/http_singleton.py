@@ -0,0 +1,3 @@
+from .http_client_registry import HttpClientRegistry
+
+http_clients = HttpClientRegistry()
@@ -0,0 +1,90 @@
+import base64
+import mimetypes
+import os
+from typing import Optional, Tuple
+from .storage_service import StorageService, APP_DIR
+from .blob_store import Owner
+from .blob_singleton import blobs
+from .io_singleton import io_pools
+from .. import settings
+
+def decode_data_uri(data_uri: str) -> Tuple[bytes, str]:
+    """(bytes, lowercase mime) of a data:image/...;base64 string."""
+    header, encoded = data_uri.split(",", 1)
+    mime = header.split(";")[0][5:].lower() or "image/png"
+    return base64.b64decode(encoded.replace("\n", "").replace("\r", "")), mime
+
+class InputStager:
+    """
+    Reference images for generation tasks, stored once by content.
+
+    stage() puts an image into the blob store (static/blobs and, when TOS is configured,
+    anime_platform/blobs); an image seen before is not written or uploaded again. Queued
+    payloads keep only the stored URL. Right before the upstream call materialize() swaps
+    each stored URL for a freshly signed one, and inlines the bytes as base64 only where
+    the model API cannot fetch the object (local storage, or the upstream rejected the URL).
+    """
+    def __init__(self, storage: StorageService = None):
+        self.storage = storage or StorageService()
+
+    async def stage(self, data: bytes, mime: str, owner: Optional[Owner] = None) -> Tuple[str, str]:
+        """Store an input image once. Returns (stored_url, content identity "sha256:<hex>")."""
+        blob = await blobs.put_bytes(data, content_type=mime, owner=owner)
+        return blobs.url(blob), f"sha256:{blob.sha256}"
+
+    def _signed(self, url: str) -> Optional[str]:
+        key = self.storage.object_key(url)
+        if not key:
+            return None
+        signed, _ = self.storage.sign_key(key, settings.INPUT_URL_TTL_SECONDS)
+        return signed
+
+    def _read(self, url: str) -> Optional[bytes]:
+        if url.startswith("/static/"):
+            path = os.path.join(APP_DIR, url.lstrip("/"))
+            if os.path.exists(path):
+                with open(path, "rb") as f:
+                    return f.read()
+            return None
+        key = self.storage.object_key(url)
+        client, bucket = self.storage._tos_target()
+        if key and client:
+            return client.get_object(bucket, key).read()
+        return None
+
+    async def for_upstream(self, url: str, inline: bool = False) -> Tuple[str, bool]:
+        """(value to send, whether it is a URL the upstream has to fetch from our bucket)."""
+        if not isinstance(url, str) or url.startswith("data:"):
+            return url, False
+        if not inline and not url.startswith("/static/"):
+            signed = await io_pools.run("storage", self._signed, url)
+            if signed:
+                return signed, True
+            return url, False
+        data = await io_pools.run("storage", self._read, url)
+        if data is None:
+            return url, False
+        mime = (mimetypes.guess_type(url.split("?")[0])[0] or "image/png").lower()
+        return f"data:{mime};base64,{base64.b64encode(data).decode()}", False
+
+    async def materialize(self, ttype: str, payload: dict, inline: bool = False) -> Tuple[dict, bool]:
+        """
+        Copy of payload ready to send upstream, and whether it hands out bucket URLs
+        (so a rejection may be retried with inline=True).
+        """
+        remote = False
+        if ttype == "image":
+            images = []
+            for u in payload.get("images") or []:
+                v, r = await self.for_upstream(u, inline)
+                images.append(v)
+                remote = remote or r
+            return (dict(payload, images=images) if images else payload), remote
+        content = []
+        for item in payload.get("content") or []:
+            if isinstance(item, dict) and item.get("type") == "image_url" and isinstance(item.get("image_url"), dict):
+                v, r = await self.for_upstream(item["image_url"].get("url"), inline)
+                item = dict(item, image_url=dict(item["image_url"], url=v))
+                remote = remote or r
+            content.append(item)
+        return (dict(payload, content=content) if content else payload), remote
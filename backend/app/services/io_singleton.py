@@ -0,0 +1,5 @@
+from .blocking_io import BlockingIOPools
+from .loop_monitor import LoopLagMonitor
+
+io_pools = BlockingIOPools()
+loop_monitor = LoopLagMonitor()
@@ -0,0 +1,97 @@
+import asyncio
+import inspect
+import os
+import sys
+import threading
+import time
+from collections import deque
+from typing import Optional
+from .. import settings
+
+APP_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+class LoopLagMonitor:
+    """
+    Measures event-loop lag with a periodic heartbeat coroutine.
+    A watchdog thread notices when the heartbeat stops and samples the loop thread's
+    stack, so each reported stall names the coroutine (and app code line) that blocked it.
+    """
+    def __init__(self):
+        self.interval = settings.LOOP_LAG_INTERVAL
+        self.threshold = settings.LOOP_LAG_THRESHOLD_MS / 1000.0
+        self._task: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+        self._running = False
+        self._loop_thread_id: Optional[int] = None
+        self._last_beat = 0.0
+        self._sampled_culprit: Optional[dict] = None
+        self.max_lag = 0.0
+        self.last_lag = 0.0
+        self.stall_count = 0
+        self.recent_stalls = deque(maxlen=50)
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._task = asyncio.create_task(self._heartbeat())
+        self._thread = threading.Thread(target=self._watchdog, name="loop-lag-watchdog", daemon=True)
+        self._thread.start()
+
+    async def stop(self):
+        self._running = False
+        if self._task:
+            self._task.cancel()
+
+    async def _heartbeat(self):
+        while self._running:
+            t0 = time.monotonic()
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = now - t0 - self.interval
+            self._last_beat = now
+            self.last_lag = lag
+            self.max_lag = max(self.max_lag, lag)
+            culprit, self._sampled_culprit = self._sampled_culprit, None
+            if lag >= self.threshold:
+                self.stall_count += 1
+                record = {"at": int(time.time()), "lag_ms": round(lag * 1000, 1)}
+                if culprit:
+                    record.update(culprit)
+                self.recent_stalls.append(record)
+                where = f" in {culprit.get('coroutine')} at {culprit.get('location')}" if culprit else ""
+                print(f"LoopLagMonitor: event loop stalled {record['lag_ms']}ms{where}")
+
+    def _watchdog(self):
+        # Sample once per stall, while the loop is still blocked
+        while self._running:
+            time.sleep(self.threshold / 2)
+            overdue = time.monotonic() - self._last_beat - self.interval
+            if overdue >= self.threshold and self._sampled_culprit is None:
+                frame = sys._current_frames().get(self._loop_thread_id)
+                if frame is not None:
+                    self._sampled_culprit = self._describe(frame)
+
+    def _describe(self, frame) -> dict:
+        coroutine = None
+        location = None
+        f = frame
+        while f is not None:
+            code = f.f_code
+            if location is None and code.co_filename.startswith(APP_ROOT) and not code.co_filename.endswith("loop_monitor.py"):
+                location = f"{os.path.relpath(code.co_filename, APP_ROOT)}:{f.f_lineno} ({code.co_name})"
+            if coroutine is None and code.co_flags & inspect.CO_COROUTINE:
+                coroutine = getattr(code, "co_qualname", code.co_name)
+            f = f.f_back
+        return {"coroutine": coroutine, "location": location}
+
+    def stats(self) -> dict:
+        return {
+            "threshold_ms": self.threshold * 1000,
+            "last_lag_ms": round(self.last_lag * 1000, 1),
+            "max_lag_ms": round(self.max_lag * 1000, 1),
+            "stall_count": self.stall_count,
+            "recent_stalls": list(self.recent_stalls),
+        }
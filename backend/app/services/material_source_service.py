@@ -3,7 +3,7 @@ from ..services.viking_db_service import VikingDBService
 from ..services.tos_service import TOSService
 from ..services.asset_service import AssetService
 from ..db import SessionLocal
-from ..repositories.system_config_repo import SystemConfigRepo
+from .config_singleton import config_cache
 
 class MaterialSourceService:
     def __init__(self):
@@ -12,11 +12,7 @@ class MaterialSourceService:
         self.asset_service = AssetService(SessionLocal()) # Need DB session for AssetService
         
         # Load bucket name
-        db = SessionLocal()
-        repo = SystemConfigRepo()
-        c = repo.get(db, "tos_bucket_name")
-        self.bucket_name = c.value if c else "hmtos"
-        db.close()
+        self.bucket_name = config_cache.get("tos_bucket_name", "hmtos")
 
     def search(self, query: str, limit: int = 10) -> List[Dict[str, Any]]:
         """
@@ -0,0 +1,324 @@
+import asyncio
+import hashlib
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from urllib.parse import parse_qs, urlparse
+from .storage_service import StorageService, APP_DIR
+from .io_singleton import io_pools
+from .blob_store import LOCAL_DIR as BLOB_LOCAL_DIR, REMOTE_PREFIX as BLOB_REMOTE_PREFIX
+from .. import settings
+
+REDIRECT_PREFIX = "/api/storage/redirect"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    path TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    object_key TEXT,
+    url TEXT,
+    hits INTEGER NOT NULL DEFAULT 0,
+    last_access REAL NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_entries_last_access ON entries (last_access);
+-- Pins may name keys that are not cached yet (project media fetched later)
+CREATE TABLE IF NOT EXISTS pins (
+    key TEXT PRIMARY KEY,
+    until REAL NOT NULL
+);
+"""
+
+# (cache key, path relative to the app dir, TOS key to refetch from, URL to refetch from)
+Target = Tuple[str, str, Optional[str], Optional[str]]
+
+def _unwrap(url: str) -> str:
+    """Original URL behind a /api/storage/redirect link."""
+    if url.startswith(REDIRECT_PREFIX):
+        return (parse_qs(urlparse(url).query).get("url") or [url])[0]
+    return url
+
+LOCAL_HOSTS = ("localhost", "127.0.0.1")
+
+def static_path(url: str) -> Optional[str]:
+    """Absolute path of a file this app serves under /static (relative or localhost URL), else None."""
+    if not url:
+        return None
+    if url.startswith("http"):
+        parsed = urlparse(url)
+        if parsed.hostname not in LOCAL_HOSTS or not parsed.path.startswith("/static/"):
+            return None
+        url = parsed.path
+    if not url.startswith("/static/"):
+        return None
+    return os.path.join(APP_DIR, url.split("?")[0].lstrip("/"))
+
+def _ext(path: str) -> str:
+    ext = os.path.splitext(path)[1].lower()
+    return ext if 1 < len(ext) <= 6 else ""
+
+FICLONE = 0x40049409 # Linux ioctl: share the source's extents (btrfs, xfs, ...)
+
+def link_or_copy(src: str, dest: str) -> str:
+    """Put `src` at `dest` without copying bytes when the filesystem allows it. Returns how."""
+    try:
+        os.link(src, dest)
+        return "hardlink"
+    except OSError:
+        pass
+    try:
+        import fcntl
+        with open(src, "rb") as fs, open(dest, "wb") as fd:
+            fcntl.ioctl(fd.fileno(), FICLONE, fs.fileno())
+        return "reflink"
+    except (ImportError, OSError):
+        pass
+    shutil.copyfile(src, dest)
+    return "copy"
+
+class MediaCache:
+    """
+    Local copies of media whose original lives in TOS (or at a remote URL), kept within
+    MEDIA_CACHE_MAX_BYTES and evicted least recently used first.
+
+    Blob files that were also uploaded to TOS are admitted here, so the "keep a local
+    copy for internal use" files stop growing without bound. Anything else fetched for
+    stitching or badcase lands in MEDIA_CACHE_DIR, outside the /static mount: the copies
+    are internal and clients keep using the original URLs. The index is a SQLite file next
+    to the files, so startup reads one table instead of scanning directories; a copy found
+    missing is fetched again from TOS. Entries of unfinished stitch jobs are pinned in
+    memory, media of recently edited projects is pinned until a timestamp.
+    Hits and misses are counted per consumer ("stitch", "badcase", ...).
+    """
+    def __init__(self, storage: StorageService = None):
+        self.storage = storage or StorageService()
+        self.root_rel = settings.MEDIA_CACHE_DIR
+        self.root = os.path.join(APP_DIR, self.root_rel)
+        self.index_path = settings.MEDIA_CACHE_INDEX or os.path.join(self.root, "index.db")
+        self.max_bytes = settings.MEDIA_CACHE_MAX_BYTES
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.RLock()
+        self._pins: Dict[str, Set[str]] = {} # owner (stitch job id) -> keys
+        self.total_bytes = 0
+        self.evictions = 0
+        self.evicted_bytes = 0
+        self._counters: Dict[str, Dict[str, int]] = {}
+        self._fetching: Dict[str, asyncio.Future] = {} # key -> download in flight
+
+    def _db(self) -> sqlite3.Connection:
+        with self._lock:
+            if self._conn is None:
+                os.makedirs(os.path.dirname(self.index_path), exist_ok=True)
+                conn = sqlite3.connect(self.index_path, check_same_thread=False, isolation_level=None)
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.executescript(SCHEMA)
+                self.total_bytes = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+                self._conn = conn
+            return self._conn
+
+    def open(self):
+        """Load the index (no directory scan)."""
+        db = self._db()
+        count = db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        print(f"MediaCache: {count} entries, {self.total_bytes} / {self.max_bytes} bytes")
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def _count(self, consumer: str, name: str, n: int = 1):
+        with self._lock:
+            c = self._counters.setdefault(consumer, {"hits": 0, "misses": 0, "failures": 0, "bytes_fetched": 0})
+            c[name] += n
+
+    def target(self, url: str) -> Optional[Target]:
+        """Where a URL is cached, or None if it is not cacheable (local-only files, data URIs)."""
+        if not url or url.startswith("data:"):
+            return None
+        url = _unwrap(url)
+        if static_path(url):
+            return None
+        object_key = self.storage.object_key(url)
+        if object_key:
+            name = os.path.basename(object_key)
+            if object_key.startswith(f"{BLOB_REMOTE_PREFIX}/"):
+                # Same file the blob store keeps locally
+                sha = os.path.splitext(name)[0]
+                return sha, f"{BLOB_LOCAL_DIR}/{sha[:2]}/{name}", object_key, None
+            digest = hashlib.sha1(object_key.encode("utf-8")).hexdigest()
+            return f"obj:{digest}", f"{self.root_rel}/{digest}{_ext(name)}", object_key, None
+        if url.startswith("http"):
+            bare = url.split("?")[0]
+            digest = hashlib.sha1(bare.encode("utf-8")).hexdigest()
+            return f"url:{digest}", f"{self.root_rel}/{digest}{_ext(urlparse(bare).path)}", None, url
+        return None
+
+    def admit(self, key: str, rel_path: str, size: int, object_key: str = None, url: str = None):
+        """Register a file that can be fetched again (from object_key or url), then enforce the budget."""
+        now = time.time()
+        with self._lock:
+            db = self._db()
+            old = db.execute("SELECT size FROM entries WHERE key = ?", (key,)).fetchone()
+            db.execute(
+                "INSERT INTO entries (key, path, size, object_key, url, hits, last_access, created_at) "
+                "VALUES (?, ?, ?, ?, ?, 0, ?, ?) ON CONFLICT(key) DO UPDATE SET "
+                "path = excluded.path, size = excluded.size, object_key = excluded.object_key, "
+                "url = excluded.url, last_access = excluded.last_access",
+                (key, rel_path, size, object_key, url, now, now),
+            )
+            self.total_bytes += size - (old[0] if old else 0)
+            self._evict()
+
+    def get(self, key: str) -> Optional[str]:
+        """Absolute path of a cached copy, marking it used; None (and the entry dropped) if it is gone."""
+        with self._lock:
+            db = self._db()
+            row = db.execute("SELECT path, size FROM entries WHERE key = ?", (key,)).fetchone()
+            if not row:
+                return None
+            path = os.path.join(APP_DIR, row[0])
+            if not os.path.exists(path):
+                db.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self.total_bytes -= row[1]
+                return None
+            db.execute("UPDATE entries SET hits = hits + 1, last_access = ? WHERE key = ?", (time.time(), key))
+            return path
+
+    def forget(self, key: str):
+        """Drop an entry whose file was deleted elsewhere (e.g. an unreferenced blob)."""
+        with self._lock:
+            db = self._db()
+            row = db.execute("SELECT size FROM entries WHERE key = ?", (key,)).fetchone()
+            if row:
+                db.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self.total_bytes -= row[0]
+
+    def pin(self, owner: str, keys: Iterable[str]):
+        with self._lock:
+            self._pins.setdefault(owner, set()).update(k for k in keys if k)
+
+    def unpin(self, owner: str):
+        with self._lock:
+            self._pins.pop(owner, None)
+
+    def pin_until(self, keys: Iterable[str], until: float):
+        keys = [k for k in keys if k]
+        if not keys:
+            return
+        with self._lock:
+            db = self._db()
+            db.executemany(
+                "INSERT INTO pins (key, until) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET until = MAX(until, excluded.until)",
+                [(k, until) for k in keys],
+            )
+            db.execute("DELETE FROM pins WHERE until < ?", (time.time(),))
+
+    def pin_urls(self, urls: Iterable[str], seconds: float):
+        """Keep the cached copies of these URLs for `seconds` (project media)."""
+        keys = [t[0] for t in (self.target(u) for u in urls) if t]
+        self.pin_until(keys, time.time() + seconds)
+        return len(keys)
+
+    def _evict(self):
+        if self.total_bytes <= self.max_bytes:
+            return
+        pinned = set().union(*self._pins.values()) if self._pins else set()
+        db = self._db()
+        rows = db.execute(
+            "SELECT e.key, e.path, e.size FROM entries e LEFT JOIN pins p ON p.key = e.key AND p.until >= ? "
+            "WHERE p.key IS NULL ORDER BY e.last_access", (time.time(),)
+        ).fetchall()
+        for key, rel, size in rows:
+            if self.total_bytes <= self.max_bytes:
+                break
+            if key in pinned:
+                continue
+            try:
+                path = os.path.join(APP_DIR, rel)
+                if os.path.exists(path):
+                    os.remove(path)
+            except OSError as e:
+                print(f"MediaCache: evict {rel} failed: {e}")
+                continue
+            db.execute("DELETE FROM entries WHERE key = ?", (key,))
+            self.total_bytes -= size
+            self.evictions += 1
+            self.evicted_bytes += size
+
+    async def local_copy(self, url: str, consumer: str) -> Tuple[Optional[str], bool]:
+        """
+        (absolute path of a local copy of url, whether it was a cache hit).
+        Local /static files are returned in place; cacheable URLs are fetched on a miss.
+        """
+        local = static_path(_unwrap(url)) if url else None
+        if local:
+            found = os.path.exists(local)
+            self._count(consumer, "hits" if found else "misses")
+            return (local if found else None), found
+        t = self.target(url)
+        if not t:
+            return None, False
+        key, rel, object_key, source_url = t
+        path = await io_pools.run("file", self.get, key)
+        if path is None and os.path.exists(os.path.join(APP_DIR, rel)):
+            # On disk but not indexed yet (written before the index existed)
+            await io_pools.run("file", self.admit, key, rel, os.path.getsize(os.path.join(APP_DIR, rel)), object_key, source_url)
+            path = os.path.join(APP_DIR, rel)
+        if path:
+            self._count(consumer, "hits")
+            return path, True
+
+        self._count(consumer, "misses")
+        # Callers missing on the same key while it downloads wait for that one download
+        pending = self._fetching.get(key)
+        if pending is None:
+            pending = self._fetching[key] = asyncio.ensure_future(self._fetch(key, rel, object_key, source_url, consumer))
+            pending.add_done_callback(lambda _: self._fetching.pop(key, None))
+        return await asyncio.shield(pending), False
+
+    async def _fetch(self, key: str, rel: str, object_key: Optional[str], source_url: Optional[str], consumer: str) -> Optional[str]:
+        src = source_url
+        if object_key:
+            src, _ = await io_pools.run("storage", self.storage.sign_key, object_key)
+        dest = os.path.join(APP_DIR, rel)
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        # Pinned while downloading so a concurrent admit cannot evict it right away
+        self.pin(f"fetch:{key}", [key])
+        try:
+            if not src or not await self.storage._stream_to_file(src, dest):
+                self._count(consumer, "failures")
+                return None
+            size = os.path.getsize(dest)
+            self._count(consumer, "bytes_fetched", size)
+            await io_pools.run("file", self.admit, key, rel, size, object_key, source_url)
+        finally:
+            self.unpin(f"fetch:{key}")
+        return dest
+
+    def stats(self) -> dict:
+        with self._lock:
+            db = self._db()
+            entries = db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+            pinned = db.execute(
+                "SELECT COUNT(*) FROM entries e JOIN pins p ON p.key = e.key WHERE p.until >= ?", (time.time(),)
+            ).fetchone()[0]
+            consumers = {}
+            for name, c in self._counters.items():
+                lookups = c["hits"] + c["misses"]
+                consumers[name] = dict(c, hit_rate=round(c["hits"] / lookups, 3) if lookups else 0.0)
+            return {
+                "entries": entries,
+                "bytes": self.total_bytes,
+                "max_bytes": self.max_bytes,
+                "pinned_entries": pinned,
+                "pinned_jobs": len(self._pins),
+                "evictions": self.evictions,
+                "evicted_bytes": self.evicted_bytes,
+                "consumers": consumers,
+            }
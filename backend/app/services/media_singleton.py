@@ -0,0 +1,5 @@
+from .media_cache import MediaCache
+from .segment_cache import SegmentCache
+
+media_cache = MediaCache()
+segments = SegmentCache(media_cache)
@@ -0,0 +1,36 @@
+import mimetypes
+import os
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+from starlette.types import Scope
+from .. import settings
+
+mimetypes.add_type("application/vnd.apple.mpegurl", ".m3u8")
+mimetypes.add_type("video/mp2t", ".ts")
+
+# Paths under /static whose bytes never change once written: content-addressed blobs and
+# published HLS packages. Stitched films are not among them: a reclaimed or retried job
+# rewrites outputs/stitched_<id>.mp4 in place, so they are revalidated like other files.
+IMMUTABLE_PREFIXES = ("blobs/", "hls/")
+
+def cache_control(path: str) -> str:
+    path = path.replace(os.sep, "/").lstrip("/")
+    if path.startswith(IMMUTABLE_PREFIXES):
+        return f"public, max-age={settings.STATIC_IMMUTABLE_MAX_AGE}, immutable"
+    # Anything else may be rewritten in place: revalidate with the ETag every time
+    return "no-cache"
+
+class MediaStaticFiles(StaticFiles):
+    """
+    StaticFiles with caching headers for media. FileResponse already answers Range
+    requests (206, so players can seek without downloading the whole MP4) and sends an
+    ETag and Last-Modified that If-None-Match / If-Modified-Since revalidate against.
+    This adds Cache-Control, so immutable files are not even revalidated.
+    """
+    def file_response(self, full_path, stat_result: os.stat_result, scope: Scope, status_code: int = 200) -> Response:
+        response = FileResponse(full_path, status_code=status_code, stat_result=stat_result,
+                                headers={"Cache-Control": cache_control(self.get_path(scope))})
+        if self.is_not_modified(response.headers, Headers(scope=scope)):
+            return NotModifiedResponse(response.headers)
+        return response
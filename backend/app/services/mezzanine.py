@@ -0,0 +1,215 @@
+import asyncio
+import os
+import socket
+import time
+import uuid
+from typing import Dict, List, Optional
+from sqlalchemy.orm import Session
+from ..db import SessionLocal
+from ..models.blob import Blob
+from ..models.mezzanine import Mezzanine
+from ..repositories.mezzanine_repo import MezzanineRepo
+from .blob_singleton import blobs
+from .hls_singleton import hls
+from .io_singleton import io_pools
+from .media_cache import _unwrap, static_path
+from .media_singleton import media_cache
+from .storage_service import StorageService, APP_DIR
+from . import video_stitcher
+from .. import settings
+
+class MezzanineService:
+    """
+    Transcodes every finished video clip once, in the background, into the mezzanine
+    format (video_stitcher.mezzanine_target: one resolution, frame rate, pixel format,
+    audio layout and fixed GOP). The mezzanine is stored as a blob next to the original
+    and referenced by the same task, so deleting the task releases both.
+
+    The video poller submits clips as tasks succeed; rows in the mezzanines table are
+    leased by MEZZANINE_WORKERS loops per process and retried with backoff. Stitching
+    swaps each clip for its mezzanine when one is ready, and clips that all have one are
+    joined with a stream copy.
+    """
+    def __init__(self, storage: StorageService = None):
+        self.storage = storage or StorageService()
+        self.repo = MezzanineRepo()
+        self.worker_id = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self._tasks: List[asyncio.Task] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.made = 0
+        self.failures = 0
+        self.transcode_seconds = 0.0
+        self.hits = 0 # stitch clips served from a mezzanine
+        self.misses = 0
+
+    def _in_session(self, fn, *args):
+        db = SessionLocal()
+        try:
+            return fn(db, *args)
+        finally:
+            db.close()
+
+    async def _db(self, fn, *args):
+        return await io_pools.run("db", self._in_session, fn, *args)
+
+    def notify(self):
+        if self._wakeup and self._loop:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    # Submitting
+
+    def _request(self, db: Session, task_id, video_url: str) -> Optional[str]:
+        blob = blobs.find(db, video_url)
+        if not blob:
+            return None # not a stored clip (download failed and the provider URL was kept)
+        m = self.repo.request(db, blob.sha256, video_stitcher.mezzanine_profile(), task_id)
+        if m.status == "ready":
+            # Same clip as an earlier task: share its mezzanine
+            blobs.ref(db, m.mezzanine_sha256, "task", task_id, "mezzanine")
+        return m.status
+
+    async def submit(self, task_id, video_url: str):
+        """Queue the mezzanine of a task's finished clip. Never raises."""
+        if not settings.MEZZANINE_ENABLED or not video_url:
+            return
+        try:
+            status = await self._db(self._request, task_id, video_url)
+        except Exception as e:
+            print(f"Mezzanine: could not queue clip of task {task_id}: {e}")
+            return
+        if status == "pending":
+            self.notify()
+
+    def backfill(self, db: Session, limit: int = 1000) -> dict:
+        """Queue mezzanines for succeeded video tasks made before mezzanines existed."""
+        from ..models.task import Task
+        rows = db.query(Task.id, Task.video_url).filter(
+            Task.status == "succeeded", Task.video_url != None, Task.video_url != ""
+        ).order_by(Task.id.desc()).limit(limit).all()
+        counts: Dict[str, int] = {}
+        for task_id, url in rows:
+            status = self._request(db, task_id, url) or "not_a_blob"
+            counts[status] = counts.get(status, 0) + 1
+        self.notify()
+        return counts
+
+    # Stitching
+
+    def _resolve(self, db: Session, urls: List[str]) -> Dict[str, Blob]:
+        local, remote = {}, {}
+        for url in set(urls):
+            bare = _unwrap(url)
+            path = static_path(bare)
+            if path:
+                local[os.path.relpath(path, APP_DIR)] = url
+            else:
+                key = self.storage.object_key(bare)
+                if key:
+                    remote[key] = url
+        sources = {}
+        for b in blobs.repo.find_many(db, list(local), list(remote)):
+            url = local.get(b.local_path) or remote.get(b.object_key)
+            if url:
+                sources[url] = b.sha256
+        ready = self.repo.ready_for(db, list(sources.values()), video_stitcher.mezzanine_profile())
+        return {url: ready[sha] for url, sha in sources.items() if sha in ready}
+
+    async def urls_for(self, urls: List[str]) -> Dict[str, str]:
+        """clip URL -> URL of its mezzanine, for the clips that have one ready (two queries)."""
+        if not settings.MEZZANINE_ENABLED or not urls:
+            return {}
+        try:
+            found = await self._db(self._resolve, urls)
+        except Exception as e:
+            print(f"Mezzanine lookup failed: {e}")
+            return {}
+        self.hits += sum(1 for u in urls if u in found)
+        self.misses += sum(1 for u in urls if u not in found)
+        return {url: blobs.url(b) for url, b in found.items()}
+
+    # Transcoding
+
+    async def _make(self, m: Mezzanine) -> str:
+        source = await self._db(blobs.repo.get, m.source_sha256)
+        if not source:
+            raise RuntimeError("source clip blob is gone")
+        owner = f"mezzanine:{m.id}"
+        media_cache.pin(owner, [m.source_sha256])
+        dest = blobs.incoming_path() + ".mp4"
+        try:
+            src, _ = await media_cache.local_copy(blobs.url(source), "mezzanine")
+            if not src:
+                raise RuntimeError("source clip could not be fetched")
+            info = await video_stitcher.probe(src)
+            code, _, err = await video_stitcher.run_ffmpeg(video_stitcher.mezzanine_args(src, info, dest))
+            if code != 0:
+                raise RuntimeError(f"ffmpeg failed: {err[-2000:]}")
+            blob = await blobs.put_file(dest, "mezzanine.mp4", "video/mp4", move=True,
+                                        owner=("task", m.task_id, "mezzanine"))
+            if settings.HLS_ENABLED and blobs.local_file(blob):
+                # Keyframes every MEZZANINE_GOP_SECONDS, so HLS is a stream copy
+                await hls.package(blobs.local_file(blob), f"clip_{m.source_sha256}")
+            return blob.sha256
+        finally:
+            media_cache.unpin(owner)
+            if os.path.exists(dest):
+                os.remove(dest)
+
+    async def _worker(self):
+        while True:
+            try:
+                m = await self._db(self.repo.claim, self.worker_id, int(time.time()), settings.MEZZANINE_LEASE_SECONDS)
+            except Exception as e:
+                print(f"Mezzanine: claim failed: {e}")
+                m = None
+            if m is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), settings.MEZZANINE_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            t0 = time.monotonic()
+            try:
+                sha = await self._make(m)
+                seconds = round(time.monotonic() - t0, 2)
+                await self._db(self.repo.done, m.id, self.worker_id, sha, seconds)
+                self.made += 1
+                self.transcode_seconds += seconds
+                print(f"Mezzanine of clip {m.source_sha256[:12]} (task {m.task_id}) ready in {seconds}s")
+            except asyncio.CancelledError:
+                raise # the lease runs out and another process picks the row up
+            except Exception as e:
+                self.failures += 1
+                try:
+                    status = await self._db(self.repo.retry, m.id, self.worker_id, str(e), int(time.time()),
+                                            settings.MEZZANINE_MAX_ATTEMPTS)
+                except Exception as e2:
+                    status = f"unrecorded ({e2})"
+                print(f"Mezzanine of clip {m.source_sha256[:12]} failed ({status}): {e}")
+
+    def start(self):
+        """Start the transcode loops. Must be called from the running event loop."""
+        if not settings.MEZZANINE_ENABLED or self._tasks:
+            return
+        self._wakeup = asyncio.Event()
+        self._loop = asyncio.get_running_loop()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(max(1, settings.MEZZANINE_WORKERS))]
+
+    async def stop(self):
+        for t in self._tasks:
+            t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def stats(self, db: Session) -> dict:
+        return {
+            "profile": video_stitcher.mezzanine_profile(),
+            "rows": self.repo.stats(db, video_stitcher.mezzanine_profile()),
+            "made": self.made,
+            "failures": self.failures,
+            "transcode_seconds": round(self.transcode_seconds, 2),
+            "stitch_hits": self.hits,
+            "stitch_misses": self.misses,
+        }
@@ -0,0 +1,3 @@
+from .mezzanine import MezzanineService
+
+mezzanines = MezzanineService()
@@ -1,21 +1,37 @@
 import asyncio
+import json
 import time
 import os
-import aiohttp
+import socket
+import threading
+import uuid
 import aiofiles
+import httpx
 from urllib.parse import urlparse
 from sqlalchemy.orm import Session
 from ..services.token_bucket import TokenBucket
 from ..services.task_service import TaskService
 from ..repositories.task_repo import TaskRepo
 from ..repositories.model_repo import ModelConfigRepo
-from ..repositories.system_config_repo import SystemConfigRepo
+from ..repositories.task_queue_repo import TaskQueueRepo
+from ..repositories.quota_repo import QuotaRepo
+from ..services.quota_service import ModelQuotaService
 from ..models.model_config import ModelConfig
 from ..db import SessionLocal
+from .. import settings
 from .volc_image_client import VolcImageClient
 from .volc_video_client import VolcVideoClient
+from .video_poller import VideoTaskPoller
+from .adaptive_concurrency import AdaptiveConcurrency
+from .fair_scheduler import FairScheduler
+from .result_cache import ResultCache
+from .input_staging import InputStager
+from .blob_singleton import blobs
 from .manager_singleton import manager
 from .storage_service import StorageService
+from .http_singleton import http_clients
+from .io_singleton import io_pools
+from .config_singleton import config_cache
 
 async def download_file(url: str, save_dir: str) -> str:
     if not url: return ""
@@ -30,13 +46,13 @@ async def download_file(url: str, save_dir: str) -> str:
             
         save_path = os.path.join(save_dir, filename)
         
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url) as resp:
-                if resp.status == 200:
-                    f = await aiofiles.open(save_path, mode='wb')
-                    await f.write(await resp.read())
-                    await f.close()
-                    return f"/static/{filename}"
+        client = http_clients.get("download")
+        resp = await client.get(url, timeout=120)
+        if resp.status_code == 200:
+            f = await aiofiles.open(save_path, mode='wb')
+            await f.write(resp.content)
+            await f.close()
+            return f"/static/{filename}"
     except Exception as e:
         print(f"Download failed for {url}: {e}")
     return url # Fallback to remote url
@@ -50,153 +66,531 @@ class QueueWorker:
         self.video_client = VolcVideoClient()
         self.model_repo = ModelConfigRepo()
         self.storage = StorageService() # Will bind db on usage or init
+        self.queue_repo = TaskQueueRepo()
+        self.quota_service = ModelQuotaService(self.model_repo, QuotaRepo())
+        self.adaptive = AdaptiveConcurrency()
+        self.scheduler = FairScheduler()
+        self.result_cache = ResultCache()
+        self.stager = InputStager(self.storage)
+        self.poller = VideoTaskPoller(self.video_client, self.task_repo)
+        # Identifies this process as a lease owner in the task_queue table
+        self.worker_id = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self._inflight: dict[int, asyncio.Task] = {} # queue entry id -> job coroutine
+        self._inflight_meta: dict[int, tuple] = {} # queue entry id -> (model_id, user_id)
+        self._followers: set = set() # queue entry ids waiting on an identical in-flight job; they hold no model slot
+        self._task_jobs: dict[int, asyncio.Task] = {} # task id -> job coroutine, for cancellation
+        self._entry_tasks: dict[int, int] = {} # queue entry id -> task id
+        self._cancelled: set = set() # task ids being cancelled; their jobs must not hand the lease back
+        self._job_seconds: dict[int, float] = {} # model_id -> EWMA of job duration, for wait estimates
+        # Read by db pool threads (API positions, _claim_ready), so only ever replaced, never mutated:
+        # (limits, job_seconds, running_by_user) copied on the loop, and the last positions snapshot
+        self._sched_inputs: tuple = ({}, {}, {})
+        self._positions: tuple = (0.0, {}) # (monotonic time, task_id -> (position, wait))
+        self._positions_lock = threading.Lock()
+        self._wakeup: asyncio.Event = None
+        self._loop: asyncio.AbstractEventLoop = None
+        self._loops: list[asyncio.Task] = []
+        self._running = False
         
     def init_buckets(self):
         db: Session = SessionLocal()
         models = db.query(ModelConfig).all()
         for m in models:
-            self.buckets[m.id] = TokenBucket(m.concurrency_quota)
+            self.configure_model(m)
         db.close()
-    async def enqueue(self, task_id: int, model_id: int, ttype: str, payload: dict):
+
+    def configure_model(self, m: ModelConfig):
+        """Create the model's limiter, or resize the existing one in place so in-flight slots stay counted."""
+        bucket = self.buckets.get(m.id)
+        if bucket:
+            bucket.resize(m.concurrency_quota, m.request_quota, settings.MODEL_REQUEST_WINDOW_SECONDS, settings.MODEL_REQUEST_BURST)
+        else:
+            bucket = self.buckets[m.id] = TokenBucket(m.concurrency_quota, m.request_quota, settings.MODEL_REQUEST_WINDOW_SECONDS, settings.MODEL_REQUEST_BURST)
+        self.adaptive.configure(m.id, m.concurrency_quota, bucket)
+
+    async def _call_upstream(self, model_id: int, bucket: TokenBucket, fn, *args, **kwargs):
+        """Call an upstream create endpoint and feed its status/latency to the adaptive controller."""
+        t0 = time.monotonic()
+        try:
+            result = await fn(*args, **kwargs)
+        except Exception as e:
+            self.adaptive.observe(model_id, bucket, self.adaptive.classify(e), time.monotonic() - t0)
+            raise
+        self.adaptive.observe(model_id, bucket, "ok", time.monotonic() - t0)
+        return result
+
+    def limits(self) -> dict:
+        return {str(mid): b.stats() for mid, b in self.buckets.items()}
+
+    def _in_session(self, fn, *args):
+        db: Session = SessionLocal()
+        try:
+            return fn(db, *args)
+        finally:
+            db.close()
+
+    async def _db(self, fn, *args):
+        """Run fn(db, *args) with a fresh session on the db thread pool."""
+        return await io_pools.run("db", self._in_session, fn, *args)
+
+    def submit(self, db: Session, task_id: int, model_id: int, ttype: str, payload: dict,
+               priority: str = "interactive", user_id: int = None, project_id: str = None,
+               cache_key: str = None, use_cache: bool = True):
+        """
+        Persist a task into the durable queue and wake the dispatcher.
+        The job survives restarts; any worker may pick it up.
+        priority is the scheduler lane; user_id/project_id are the flows it is fair-shared across.
+        cache_key (ResultCache.key_for) lets identical requests share one upstream call;
+        use_cache=False still runs upstream but records the result for later requests.
+        """
+        entry = self.queue_repo.enqueue(
+            db, task_id, model_id, ttype, payload, max_attempts=settings.QUEUE_MAX_ATTEMPTS,
+            priority=priority, user_id=user_id, project_id=project_id,
+            cache_key=cache_key, use_cache=use_cache
+        )
+        self.notify()
+        return entry
+
+    def notify(self):
+        # submit() may run on a db pool thread, so hop back onto the loop to set the event
+        if self._wakeup and self._loop:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def start(self):
+        """Start dispatcher and heartbeat loops. Must be called from the running event loop."""
+        if self._running:
+            return
+        self._running = True
+        self._wakeup = asyncio.Event()
+        self._loop = asyncio.get_running_loop()
+        self._loops = [
+            asyncio.create_task(self._dispatch_loop()),
+            asyncio.create_task(self._heartbeat_loop()),
+        ]
+        print(f"QueueWorker {self.worker_id} started")
+
+    async def stop(self):
+        self._running = False
+        for t in self._loops:
+            t.cancel()
+        # Cancelled jobs hand their lease back so the next process resumes them immediately
+        jobs = list(self._inflight.values())
+        for t in jobs:
+            t.cancel()
+        if jobs:
+            await asyncio.gather(*jobs, return_exceptions=True)
+        await self.poller.stop()
+        self._loops = []
+        print(f"QueueWorker {self.worker_id} stopped")
+
+    def stats(self) -> dict:
+        counts = self._in_session(self.queue_repo.count_by_status)
+        return {"worker_id": self.worker_id, "inflight": len(self._inflight), "queue": counts, "video_poller": self.poller.stats()}
+
+    async def _dispatch_loop(self):
+        while self._running:
+            self._wakeup.clear()
+            try:
+                await self._dispatch_ready()
+            except Exception:
+                import traceback
+                print("QueueWorker dispatch error:")
+                print(traceback.format_exc())
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=settings.QUEUE_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+    def _running_by_user(self) -> dict:
+        counts: dict[int, int] = {}
+        for _, user_id in self._inflight_meta.values():
+            counts[user_id or 0] = counts.get(user_id or 0, 0) + 1
+        return counts
+
+    def _free_slots(self) -> dict:
+        """model_id -> jobs this worker may still start (effective limit minus its jobs in flight)."""
+        free = {mid: b.limit for mid, b in self.buckets.items()}
+        for entry_id, (model_id, _) in self._inflight_meta.items():
+            if entry_id not in self._followers:
+                free[model_id] = free.get(model_id, 1) - 1
+        return free
+
+    def _scheduling_inputs(self) -> tuple:
+        """Copies of the live scheduling state for pool threads. Must run on the event loop."""
+        self._sched_inputs = (
+            {mid: b.limit for mid, b in self.buckets.items()},
+            dict(self._job_seconds),
+            self._running_by_user(),
+        )
+        return self._sched_inputs
+
+    def _claim_ready(self, db: Session, exclude_ids: list, free: dict, inputs: tuple) -> tuple:
+        now = int(time.time())
+        running_by_user = inputs[2]
+        failed = self.queue_repo.fail_exhausted(db, now)
+        for task_id in failed:
+            print(f"Task {task_id} exceeded max attempts, marking failed")
+            self.task_repo.update_status(db, task_id, "failed", now)
+
+        # Only claim what the buckets can start now, in lane/fair-share order, so a
+        # late interactive task overtakes a backlog that is still sitting in the table
+        exclude = set(exclude_ids)
+        rows = [r for r in self.queue_repo.list_schedulable(db, now, settings.SCHEDULER_WINDOW) if r.id not in exclude]
+        chosen = []
+        for r in self.scheduler.order(rows, now, running_by_user):
+            if len(chosen) >= settings.QUEUE_DISPATCH_BATCH:
+                break
+            if free.get(r.model_id, 1) <= 0:
+                continue
+            if not self.queue_repo.claim(db, r.id, self.worker_id, now, settings.QUEUE_LEASE_SECONDS):
+                continue
+            free[r.model_id] = free.get(r.model_id, 1) - 1
+            chosen.append(r.id)
+
+        # What is left of the window is the line right now; API reads positions from this snapshot
+        taken = set(chosen)
+        self._snapshot_positions([r for r in rows if r.id not in taken], now, inputs)
+
+        claimed = []
+        for e in sorted(self.queue_repo.get_many(db, chosen), key=lambda e: chosen.index(e.id)):
+            try:
+                payload = json.loads(e.payload) if e.payload else {}
+            except Exception:
+                payload = {}
+            if e.attempts > 1:
+                print(f"Task {e.task_id} reclaimed (attempt {e.attempts}/{e.max_attempts})")
+            claimed.append((e.id, e.task_id, e.model_id, e.type, payload, e.user_id, e.cache_key, e.use_cache is not False))
+        return failed, claimed
+
+    async def _dispatch_ready(self):
+        failed, claimed = await self._db(self._claim_ready, list(self._inflight.keys()), self._free_slots(), self._scheduling_inputs())
+        for task_id in failed:
+            await manager.publish(1, {"type": "task_update", "id": str(task_id), "status": "failed"})
+        for entry_id, task_id, model_id, ttype, payload, user_id, cache_key, use_cache in claimed:
+            self._inflight_meta[entry_id] = (model_id, user_id)
+            self._entry_tasks[entry_id] = task_id
+            job = asyncio.create_task(self._run_job(entry_id, task_id, model_id, ttype, payload, cache_key, use_cache))
+            self._inflight[entry_id] = job
+            self._task_jobs[task_id] = job
+
+    def _snapshot_positions(self, rows: list, now: int, inputs: tuple) -> dict:
+        limits, job_seconds, running_by_user = inputs
+        positions = self.scheduler.positions(rows, now, limits, job_seconds, running_by_user)
+        with self._positions_lock:
+            self._positions = (time.monotonic(), positions)
+        return positions
+
+    def queue_positions(self, db: Session, task_ids: list) -> dict:
+        """
+        task_id -> (queue_position, estimated_wait_seconds) for those of task_ids still waiting to be dispatched.
+        Read from the snapshot of the last dispatch round, which is rebuilt only once it is SCHEDULER_POSITIONS_TTL old.
+        """
+        if not task_ids:
+            return {}
+        now = int(time.time())
+        # Runs on pool threads: only the loop's copies are read, never the live dicts
+        inputs = self._sched_inputs
+        limits, job_seconds, _ = inputs
+        with self._positions_lock:
+            at, positions = self._positions
+        if time.monotonic() - at > settings.SCHEDULER_POSITIONS_TTL:
+            rows = self.queue_repo.list_schedulable(db, now, settings.SCHEDULER_WINDOW)
+            positions = self._snapshot_positions(rows, now, inputs)
+        out = {t: positions[t] for t in task_ids if t in positions}
+        # Beyond the scheduling window or submitted since the snapshot: in line behind the ready entries of its model
+        missing = [t for t in task_ids if t not in positions]
+        if missing:
+            for task_id, (model_id, ahead) in self.queue_repo.ready_ahead(db, now, missing).items():
+                out[task_id] = (ahead, self.scheduler.wait_seconds(ahead, model_id, limits, job_seconds))
+        return out
+
+    async def _heartbeat_loop(self):
+        interval = max(1, settings.QUEUE_LEASE_SECONDS // 3)
+        next_prune = 0.0
+        while self._running:
+            await asyncio.sleep(interval)
+            if time.monotonic() >= next_prune:
+                next_prune = time.monotonic() + settings.QUEUE_PRUNE_INTERVAL
+                try:
+                    before = int(time.time()) - settings.QUEUE_FINISHED_RETENTION_SECONDS
+                    n = await self._db(self.queue_repo.prune_finished, before)
+                    if n:
+                        print(f"QueueWorker pruned {n} finished queue entries")
+                except Exception as e:
+                    print(f"QueueWorker prune failed: {e}")
+            if not self._inflight:
+                continue
+            try:
+                entry_ids = list(self._inflight.keys())
+                await self._db(self.queue_repo.heartbeat, self.worker_id, entry_ids, int(time.time()), settings.QUEUE_LEASE_SECONDS)
+                # Cancellations requested through another worker show up as cancelled entries
+                for entry_id in await self._db(self.queue_repo.cancelled_among, entry_ids):
+                    task_id = self._entry_tasks.get(entry_id)
+                    if task_id is not None:
+                        print(f"Task {task_id} was cancelled elsewhere, stopping local job")
+                        await self._stop_local(task_id)
+            except Exception as e:
+                print(f"QueueWorker heartbeat failed: {e}")
+
+    async def _run_job(self, entry_id: int, task_id: int, model_id: int, ttype: str, payload: dict, cache_key: str = None, use_cache: bool = True):
+        t0 = time.monotonic()
+        try:
+            if cache_key and self.result_cache.enabled:
+                ok = await self._run_cached(entry_id, task_id, model_id, ttype, payload, cache_key, use_cache)
+            else:
+                ok = await self.enqueue(task_id, model_id, ttype, payload)
+            await self._db(self.queue_repo.complete, entry_id, self.worker_id, "done" if ok else "failed")
+            prev = self._job_seconds.get(model_id)
+            elapsed = time.monotonic() - t0
+            self._job_seconds[model_id] = elapsed if prev is None else 0.8 * prev + 0.2 * elapsed
+        except asyncio.CancelledError:
+            if task_id not in self._cancelled:
+                # Off the loop, and completed even if the release itself is interrupted
+                await asyncio.shield(self._db(self.queue_repo.release, entry_id, self.worker_id))
+            raise
+        finally:
+            self._inflight.pop(entry_id, None)
+            self._inflight_meta.pop(entry_id, None)
+            self._followers.discard(entry_id)
+            self._entry_tasks.pop(entry_id, None)
+            if self._task_jobs.get(task_id) is asyncio.current_task():
+                self._task_jobs.pop(task_id, None)
+            # A slot just freed up; let the scheduler pick the next entry
+            self.notify()
+
+    async def _stop_local(self, task_id: int):
+        """Cancel this process's job and polling for a task; the job's bucket slot is released as it unwinds."""
+        self._cancelled.add(task_id)
+        try:
+            job = self._task_jobs.get(task_id)
+            if job and not job.done():
+                job.cancel()
+                await asyncio.wait({job}, timeout=5)
+            self.poller.untrack_task(task_id)
+        finally:
+            self._cancelled.discard(task_id)
+
+    def _cancel_in_db(self, db: Session, task_id: int):
+        self.queue_repo.cancel_task(db, task_id)
+        self.task_repo.update_status(db, task_id, "cancelled", int(time.time()))
+
+    def _upstream_ref(self, db: Session, task_id: int):
+        task = self.task_repo.get(db, task_id)
+        return task.external_id if task else None, config_cache.get("volc_api_key")
+
+    async def cancel(self, task_id: int, ttype: str = None) -> None:
+        """
+        Cancel a queued or running task: drop its queue entry, stop its job and polling,
+        free its concurrency slot and make a best-effort cancel of the upstream task.
+        """
+        # Mark it in the DB first so no worker can dispatch the entry in the meantime
+        await self._db(self._cancel_in_db, task_id)
+        await self._stop_local(task_id)
+        # Read after the job stopped: it may have created the upstream task just before
+        external_id, api_key = await self._db(self._upstream_ref, task_id)
+        await manager.publish(1, {"type": "task_update", "id": str(task_id), "status": "cancelled"})
+        if external_id and ttype != "image":
+            try:
+                # Ark cancels a queued generation task on DELETE
+                await self.video_client.delete_task(external_id, api_key=api_key)
+            except Exception as e:
+                print(f"Upstream cancel failed for task {task_id} ({external_id}): {e}")
+        print(f"Task {task_id} cancelled")
+
+    def _task_result(self, db: Session, task_id: int) -> dict:
+        t = self.task_repo.get(db, task_id)
+        if not t:
+            return None
+        if t.type == "image":
+            urls = json.loads(t.result_urls) if t.result_urls else []
+            return {"result_urls": urls} if urls else None
+        return {"video_url": t.video_url, "last_frame_url": t.last_frame_url} if t.video_url else None
+
+    def _apply_result(self, db: Session, task_id: int, ttype: str, result: dict, finished_at: int):
+        if ttype == "image":
+            self.task_repo.set_result(db, task_id, result["result_urls"])
+        else:
+            self.task_repo.set_video_result(db, task_id, result["video_url"], result.get("last_frame_url"))
+        self.task_repo.update_status(db, task_id, "succeeded", finished_at)
+
+    async def _serve_cached(self, task_id: int, ttype: str, result: dict, source_task_id: int) -> bool:
+        if not await self._db(self.task_repo.get, task_id):
+            return False
+        now = int(time.time())
+        await self._db(self._apply_result, task_id, ttype, result, now)
+        # The files now belong to both tasks; deleting either one keeps them for the other
+        await self._db(blobs.repo.share, "task", source_task_id, "task", task_id)
+        await manager.publish(1, {"type": "task_update", "id": str(task_id), "status": "succeeded", "finished_at": now, **result})
+        print(f"Task {task_id} served from result cache")
+        return True
+
+    async def _run_cached(self, entry_id: int, task_id: int, model_id: int, ttype: str, payload: dict, cache_key: str, use_cache: bool) -> bool:
+        """Reuse a cached result or an identical in-flight job when allowed; otherwise run and record the result."""
+        cache = self.result_cache
+        if use_cache:
+            hit = await self._db(cache.lookup, cache_key)
+            if hit:
+                return await self._serve_cached(task_id, ttype, *hit)
+            leader = cache.join(cache_key)
+            if leader is not None:
+                print(f"Task {task_id} waiting for identical in-flight request")
+                self._followers.add(entry_id)
+                self.notify() # the slot it was claimed for is free for another entry
+                try:
+                    shared = await asyncio.shield(leader)
+                finally:
+                    self._followers.discard(entry_id)
+                if shared:
+                    return await self._serve_cached(task_id, ttype, *shared)
+                # Leader failed; try on our own instead of sharing its failure
+                return await self.enqueue(task_id, model_id, ttype, payload)
+        result = None
+        try:
+            ok = await self.enqueue(task_id, model_id, ttype, payload)
+            if ok:
+                result = await self._db(self._task_result, task_id)
+                if result:
+                    await self._db(cache.store, cache_key, model_id, ttype, task_id, result)
+            return ok
+        finally:
+            if use_cache:
+                cache.finish(cache_key, (result, task_id) if result else None)
+
+    def _prepare_job(self, db: Session, task_id: int, payload: dict):
+        task = self.task_repo.get(db, task_id)
+        if not task:
+            return None
+        m = db.query(ModelConfig).filter_by(name=payload.get("model")).first()
+        return {
+            "api_key": config_cache.get("volc_api_key"),
+            "real_model": m.endpoint_id if m and m.endpoint_id else payload.get("model"),
+            "external_id": task.external_id,
+            "created_at": task.created_at,
+        }
+
+    async def _create_with_inputs(self, task_id: int, ttype: str, payload: dict, call):
+        """
+        Run call(body) with stored reference images turned into signed URLs. If the upstream
+        rejects the request while it had to fetch our objects, retry once with them inlined.
+        """
+        body, remote = await self.stager.materialize(ttype, payload)
+        try:
+            return await call(body)
+        except httpx.HTTPStatusError as e:
+            code = e.response.status_code
+            if not remote or code < 400 or code >= 500 or code == 429:
+                raise
+            print(f"Task {task_id}: upstream rejected input URLs ({code}), retrying with inline images")
+        body, _ = await self.stager.materialize(ttype, payload, inline=True)
+        return await call(body)
+
+    def _video_request_body(self, task_id: int, payload: dict, real_model: str) -> dict:
+        # Prepare full payload for video client
+        # We construct the exact JSON body expected by the API
+        # This ensures all parameters in 'payload' (from template) are preserved
+        req_body = payload.copy()
+        req_body["model"] = real_model
+        
+        # Ensure duration is int if present (legacy support)
+        if "duration" in req_body and isinstance(req_body["duration"], (str, float)):
+            try:
+                req_body["duration"] = int(float(req_body["duration"]))
+            except:
+                pass
+
+        # --- LOGGING START ---
+        try:
+            debug_body = req_body.copy()
+            # Truncate base64 strings in content
+            if "content" in debug_body and isinstance(debug_body["content"], list):
+                new_content = []
+                for item in debug_body["content"]:
+                    if isinstance(item, dict):
+                        new_item = item.copy()
+                        if new_item.get("type") == "image_url" and "image_url" in new_item:
+                            if isinstance(new_item["image_url"], dict):
+                                url_obj = new_item["image_url"].copy()
+                                if "url" in url_obj and isinstance(url_obj["url"], str) and url_obj["url"].startswith("data:image"):
+                                    url_obj["url"] = url_obj["url"][:50] + "...[truncated]"
+                                elif isinstance(url_obj.get("url"), str) and "?" in url_obj["url"]:
+                                    # Signed URLs: keep the object, drop the signature
+                                    url_obj["url"] = url_obj["url"].split("?", 1)[0] + "?[signed]"
+                                new_item["image_url"] = url_obj
+                        new_content.append(new_item)
+                    else:
+                        new_content.append(item)
+                debug_body["content"] = new_content
+            print(f"Task {task_id} Request Body: {json.dumps(debug_body, ensure_ascii=False)}")
+        except Exception as log_err:
+            print(f"Failed to log request body (JSON error): {log_err}")
+        # --- LOGGING END ---
+
+        return req_body
+
+    async def enqueue(self, task_id: int, model_id: int, ttype: str, payload: dict) -> bool:
+        """Execute one queued task under the model's bucket. Returns True on success."""
         bucket = self.buckets.get(model_id)
         if not bucket:
             bucket = TokenBucket(1)
             self.buckets[model_id] = bucket
-        await bucket.acquire()
+        job = await self._db(self._prepare_job, task_id, payload)
+        if not job:
+            print(f"Task {task_id} no longer exists, skipping")
+            return False
+        # Resuming an upstream task holds a slot but sends no new create request
+        new_request = ttype == "image" or not job["external_id"]
+        await bucket.acquire(1 if new_request else 0)
+        db: Session = None
         try:
-            db: Session = SessionLocal()
-            self.storage.db = db # Bind current session
-            sys_repo = SystemConfigRepo()
-            api_key_cfg = sys_repo.get(db, "volc_api_key")
-            api_key = api_key_cfg.value if api_key_cfg else None
-            
-            self.task_repo.update_status(db, task_id, "running")
+            if new_request and not await self._db(self.quota_service.consume_request, model_id):
+                print(f"Task {task_id} rejected: model {model_id} request quota exhausted for today")
+                await self._db(self.task_repo.update_status, task_id, "failed")
+                await manager.publish(1, {"type": "task_update", "id": str(task_id), "status": "failed"})
+                return False
+            await self._db(self.task_repo.update_status, task_id, "running")
+            api_key = job["api_key"]
+            real_model = job["real_model"]
+            db = SessionLocal()
+            storage = StorageService(db)
             print(f"Task {task_id} running...")
             if ttype == "image":
-                m = db.query(ModelConfig).filter_by(name=payload["model"]).first()
-                real_model = m.endpoint_id if m and m.endpoint_id else payload["model"]
-                urls = await self.image_client.create_image_task(real_model, payload.get("prompt", ""), payload.get("images"), payload.get("size"), api_key=api_key)
+                urls = await self._create_with_inputs(task_id, ttype, payload, lambda body: self._call_upstream(
+                    model_id, bucket, self.image_client.create_image_task, real_model, body.get("prompt", ""), body.get("images"), body.get("size"), api_key=api_key))
                 api_end = int(time.time())
                 print(f"Task {task_id} got urls: {urls}")
                 
                 # Download images
                 local_urls = []
                 for i, u in enumerate(urls):
-                    local = await self.storage.save_file(u, task_id, "image", f"output_{i}.png")
+                    local = await storage.save_file(u, task_id, "image", f"output_{i}.png")
                     local_urls.append(local)
                 
-                self.task_repo.set_result(db, task_id, local_urls)
-                self.task_repo.update_status(db, task_id, "succeeded", api_end)
+                await self._db(self.task_repo.set_result, task_id, local_urls)
+                await self._db(self.task_repo.update_status, task_id, "succeeded", api_end)
                 await manager.publish(1, {"type": "task_update", "id": str(task_id), "status": "succeeded", "result_urls": local_urls, "finished_at": api_end})
                 print(f"Task {task_id} finished")
+                ok = True
+            elif job["external_id"]:
+                # Upstream task was already created before a restart/reclaim; never create it twice
+                print(f"Task {task_id} resuming upstream task {job['external_id']}")
+                ok = await self.poller.track(task_id, job["external_id"], api_key=api_key, model=payload.get("model"), started_at=job["created_at"])
             else:
-                m = db.query(ModelConfig).filter_by(name=payload["model"]).first()
-                real_model = m.endpoint_id if m and m.endpoint_id else payload["model"]
-                
-                # Prepare full payload for video client
-                # We construct the exact JSON body expected by the API
-                # This ensures all parameters in 'payload' (from template) are preserved
-                req_body = payload.copy()
-                req_body["model"] = real_model
-                
-                # Ensure duration is int if present (legacy support)
-                if "duration" in req_body and isinstance(req_body["duration"], (str, float)):
-                    try:
-                        req_body["duration"] = int(float(req_body["duration"]))
-                    except:
-                        pass
-
-                # --- LOGGING START ---
-                try:
-                    import json
-                    debug_body = req_body.copy()
-                    # Truncate base64 strings in content
-                    if "content" in debug_body and isinstance(debug_body["content"], list):
-                        new_content = []
-                        for item in debug_body["content"]:
-                            if isinstance(item, dict):
-                                new_item = item.copy()
-                                if new_item.get("type") == "image_url" and "image_url" in new_item:
-                                    if isinstance(new_item["image_url"], dict):
-                                        url_obj = new_item["image_url"].copy()
-                                        if "url" in url_obj and isinstance(url_obj["url"], str) and url_obj["url"].startswith("data:image"):
-                                            url_obj["url"] = url_obj["url"][:50] + "...[truncated]"
-                                        new_item["image_url"] = url_obj
-                                new_content.append(new_item)
-                            else:
-                                new_content.append(item)
-                        debug_body["content"] = new_content
-                    print(f"Task {task_id} Request Body: {json.dumps(debug_body, ensure_ascii=False)}")
-                except Exception as log_err:
-                    print(f"Failed to log request body (JSON error): {log_err}")
-                    print(f"Task {task_id} Request Body (raw): {req_body}")
-                # --- LOGGING END ---
-
-                ext_id = await self.video_client.create_video_task(req_body, api_key=api_key) 
-                self.task_repo.update_external_id(db, task_id, ext_id)
-                await self._poll_until_done(task_id, ext_id, api_key=api_key)
-            db.close()
+                ext_id = await self._create_with_inputs(task_id, ttype, payload, lambda body: self._call_upstream(
+                    model_id, bucket, self.video_client.create_video_task, self._video_request_body(task_id, body, real_model), api_key=api_key))
+                await self._db(self.task_repo.update_external_id, task_id, ext_id)
+                ok = await self.poller.track(task_id, ext_id, api_key=api_key, model=payload.get("model"))
+            return ok
         except Exception as e:
             import traceback
             print("QueueWorker Error:")
             print(traceback.format_exc())
             try:
-                self.task_repo.update_status(db, task_id, "failed")
+                await self._db(self.task_repo.update_status, task_id, "failed")
                 await manager.publish(1, {"type": "task_update", "id": str(task_id), "status": "failed"})
             except Exception:
                 pass
-            try:
-                db.close()
-            except Exception:
-                pass
+            return False
         finally:
+            if db is not None:
+                db.close()
             bucket.release()
-    async def _poll_until_done(self, task_id: int, ext_id: str, api_key: str = None):
-        db: Session = SessionLocal()
-        self.storage.db = db
-        while True:
-            try:
-                data = await self.video_client.get_task_status(ext_id, api_key=api_key)
-                # Volcengine status: queued, running, succeeded, failed, cancelled, expired
-                # We map them to our status.
-                status = data.get("status")
-                print(f"Task {task_id} polling status: {status}")
-
-                # Update status in DB if it changed (e.g. queued -> running)
-                # We can't easily check prev status here without querying DB, but we can just update.
-                # Or better, we only update if it's running or done.
-                if status == "running":
-                     self.task_repo.update_status(db, task_id, "running")
-                     await manager.publish(1, {"type": "task_update", "id": str(task_id), "status": "running"})
-
-                if status in {"succeeded", "failed", "cancelled", "expired"}:
-                    api_end = int(time.time())
-                    if status == "succeeded":
-                        content = data.get("content") or {}
-                        video_url = content.get("video_url")
-                        last_frame_url = content.get("last_frame_url")
-                        
-                        local_video = await self.storage.save_file(video_url, task_id, "video", "output_video.mp4")
-                        local_cover = await self.storage.save_file(last_frame_url, task_id, "video", "output_cover.png")
-
-                        if video_url:
-                            self.task_repo.set_video_result(db, task_id, local_video, local_cover)
-                            await manager.publish(1, {"type": "task_update", "id": str(task_id), "status": "succeeded", "video_url": local_video, "last_frame_url": local_cover, "finished_at": api_end})
-                        else:
-                            print(f"Task {task_id} succeeded but no video_url found")
-                            status = "failed"
-                    
-                    final_status = status if status in ["succeeded", "failed"] else "failed"
-                    self.task_repo.update_status(db, task_id, final_status, api_end)
-                    if final_status == "failed":
-                         await manager.publish(1, {"type": "task_update", "id": str(task_id), "status": "failed"})
-                    break
-                await asyncio.sleep(2)
-            except Exception as e:
-                import traceback
-                print(f"Polling Error for task {task_id}:")
-                print(traceback.format_exc())
-                # Don't break immediately, maybe network blip. 
-                # But if persistent, we should timeout. For now simple retry.
-                await asyncio.sleep(2)
-        db.close()
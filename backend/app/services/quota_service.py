@@ -11,7 +11,9 @@ class ModelQuotaService:
     def consume_request(self, db: Session, model_id: int) -> bool:
         date = datetime.utcnow().strftime("%Y-%m-%d")
         count = self.quota_repo.inc(db, model_id, date)
-        m = db.query(ModelConfig).get(model_id)
+        m = db.get(ModelConfig, model_id)
         if not m:
             return False
+        if not m.request_quota:
+            return True # no daily cap configured
         return count <= m.request_quota
@@ -0,0 +1,119 @@
+import asyncio
+import base64
+import hashlib
+import json
+import threading
+import time
+from typing import Optional, Tuple
+from sqlalchemy.orm import Session
+from ..repositories.result_cache_repo import ResultCacheRepo
+from .. import settings
+
+def _hash_data_uri(value: str) -> str:
+    """Replace an inline base64 image by the sha256 of its bytes, so equal images hash equal however they were encoded."""
+    try:
+        header, encoded = value.split(",", 1)
+        raw = base64.b64decode(encoded.replace("\n", "").replace("\r", ""))
+        return f"sha256:{hashlib.sha256(raw).hexdigest()}"
+    except Exception:
+        return f"sha256:{hashlib.sha256(value.encode('utf-8')).hexdigest()}"
+
+def _canonical(value):
+    if isinstance(value, dict):
+        return {k: _canonical(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_canonical(v) for v in value]
+    if isinstance(value, str) and value.startswith("data:"):
+        return _hash_data_uri(value)
+    return value
+
+class ResultCache:
+    """
+    Idempotency/result cache for generation requests.
+
+    The key is a sha256 over the model, task type and the exact payload sent upstream,
+    with inline images replaced by the hash of their content. Successful results are kept
+    in the result_cache table (TTL + LRU cap) and reused by later identical tasks;
+    identical tasks that arrive while one is still running wait for it instead of
+    making their own upstream call.
+    """
+    def __init__(self):
+        self.repo = ResultCacheRepo()
+        self.enabled = settings.RESULT_CACHE_ENABLED
+        self.ttl = settings.RESULT_CACHE_TTL_SECONDS
+        self.max_entries = settings.RESULT_CACHE_MAX_ENTRIES
+        self._inflight: dict[str, asyncio.Future] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.stores = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key_for(model_id: int, ttype: str, payload: dict) -> str:
+        body = {"model_id": model_id, "type": ttype, "payload": _canonical(payload)}
+        blob = json.dumps(body, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+        return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+    def lookup(self, db: Session, key: str) -> Optional[Tuple[dict, int]]:
+        """(result, source_task_id) of a live entry."""
+        now = int(time.time())
+        e = self.repo.get_valid(db, key, now)
+        if not e:
+            with self._lock:
+                self.misses += 1
+            return None
+        self.repo.touch(db, key, now)
+        with self._lock:
+            self.hits += 1
+        try:
+            return json.loads(e.result), e.source_task_id
+        except Exception:
+            return None
+
+    def store(self, db: Session, key: str, model_id: int, ttype: str, task_id: int, result: dict) -> None:
+        now = int(time.time())
+        self.repo.put(db, key, model_id, ttype, task_id, result, now, self.ttl)
+        evicted = self.repo.evict(db, now, self.max_entries)
+        with self._lock:
+            self.stores += 1
+            self.evictions += evicted
+
+    def invalidate_task(self, db: Session, task_id: int) -> None:
+        """Forget results produced by a task (its files are about to be deleted)."""
+        self.repo.delete_for_task(db, task_id)
+
+    def join(self, key: str) -> Optional[asyncio.Future]:
+        """
+        Register interest in `key`. Returns None if the caller is now the leader and must
+        run the job (then call finish()); otherwise the leader's future to await.
+        """
+        fut = self._inflight.get(key)
+        if fut is not None and not fut.done():
+            self.coalesced += 1
+            return fut
+        self._inflight[key] = asyncio.get_running_loop().create_future()
+        return None
+
+    def finish(self, key: str, result: Optional[Tuple[dict, int]]):
+        """Wake coalesced followers with the leader's (result, task_id) (None if it failed)."""
+        fut = self._inflight.pop(key, None)
+        if fut is not None and not fut.done():
+            fut.set_result(result)
+
+    def stats(self, db: Session) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "entries": self.repo.count(db),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "coalesced": self.coalesced,
+            "in_flight_keys": len(self._inflight),
+            "stores": self.stores,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,98 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+from .media_cache import MediaCache, link_or_copy
+from .storage_service import APP_DIR
+from .io_singleton import io_pools
+from .. import settings
+
+# Arguments that do not change what ffmpeg writes, left out of segment keys
+VOLATILE_ARGS = ("-threads", "-progress")
+
+class SegmentCache:
+    """
+    Encoded stitch segments (a clip normalized or re-encoded for copy-concat) kept in the
+    media cache under its byte budget and LRU eviction, keyed by the SHA-256 of the clip
+    plus the ffmpeg arguments that produced the segment. Re-stitching a storyboard where
+    one scene changed finds every other segment here and encodes only the new clip.
+    """
+    def __init__(self, cache: MediaCache):
+        self.cache = cache
+        self.rel_dir = f"{settings.MEDIA_CACHE_DIR}/segments"
+        self._lock = threading.Lock()
+        self.max_digests = settings.SEGMENT_DIGEST_CACHE_MAX_ENTRIES
+        self._digests: "OrderedDict[Tuple[int, int, int, int], str]" = OrderedDict() # (dev, inode, size, mtime) -> sha256, LRU
+        self.hits = 0
+        self.misses = 0
+
+    def _digest(self, path: str) -> str:
+        st = os.stat(path)
+        ident = (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+        with self._lock:
+            digest = self._digests.get(ident)
+            if digest:
+                self._digests.move_to_end(ident)
+                return digest
+        sha = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(settings.STORAGE_STREAM_CHUNK_SIZE), b""):
+                sha.update(chunk)
+        digest = sha.hexdigest()
+        with self._lock:
+            self._digests[ident] = digest
+            self._digests.move_to_end(ident)
+            while len(self._digests) > self.max_digests:
+                self._digests.popitem(last=False)
+        return digest
+
+    async def key(self, src: str, args: List[str]) -> str:
+        """Key of the segment `args` (an ffmpeg command reading src) writes."""
+        clip = await io_pools.run("file", self._digest, src)
+        params, skip = [], False
+        for a in args[1:-1]: # binary and output path do not matter
+            if skip:
+                skip = False
+            elif a in VOLATILE_ARGS:
+                skip = True
+            else:
+                params.append("{src}" if a == src else a)
+        return "seg:" + hashlib.sha256(f"{clip}|{chr(0).join(params)}".encode("utf-8")).hexdigest()
+
+    def _fetch(self, key: str, dest: str) -> bool:
+        path = self.cache.get(key)
+        if not path:
+            return False
+        link_or_copy(path, dest)
+        return True
+
+    async def fetch(self, key: str, dest: str) -> bool:
+        """Put the cached segment at dest (linked, not copied). False if it is not cached."""
+        found = await io_pools.run("file", self._fetch, key, dest)
+        with self._lock:
+            if found:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return found
+
+    def _put(self, key: str, path: str):
+        rel = f"{self.rel_dir}/{key[4:]}.mp4"
+        dest = os.path.join(APP_DIR, rel)
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        if os.path.exists(dest):
+            os.remove(dest)
+        link_or_copy(path, dest)
+        self.cache.admit(key, rel, os.path.getsize(dest))
+
+    async def put(self, key: str, path: str):
+        """Keep a freshly encoded segment for the next stitch."""
+        try:
+            await io_pools.run("file", self._put, key, path)
+        except OSError as e:
+            print(f"SegmentCache: could not keep {path}: {e}")
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0}
@@ -0,0 +1,3 @@
+from .stitch_engine import StitchEngine
+
+stitch_engine = StitchEngine()
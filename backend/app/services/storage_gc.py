@@ -0,0 +1,387 @@
+import asyncio
+import json
+import os
+import re
+import socket
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Set
+from urllib.parse import unquote
+from sqlalchemy.orm import Session
+from tos.models2 import ObjectTobeDeleted
+from ..db import SessionLocal
+from ..models.blob import Blob, BlobRef
+from ..models.task import Task
+from ..models.upload_session import UploadSession
+from ..repositories.storage_tombstone_repo import StorageTombstoneRepo
+from .storage_service import StorageService, APP_DIR
+from .blob_store import LOCAL_DIR as BLOB_LOCAL_DIR, REMOTE_PREFIX as BLOB_REMOTE_PREFIX, INCOMING_DIR
+from .token_bucket import TokenBucket
+from .io_singleton import io_pools
+from .. import settings
+
+MAX_KEYS_PER_BATCH = 1000 # TOS DeleteMultiObjects limit
+LEGACY_TASK_PREFIX = "anime_platform/project/default/"
+UPLOAD_PREFIX = "anime_platform/uploads/"
+# Nothing writes here any more: staged reference images went to this prefix before inputs
+# became content-addressed blobs. The checker only sweeps objects earlier deployments left.
+LEGACY_INPUT_PREFIX = "anime_platform/inputs/"
+# Bucket keys as they appear inside stored URLs (plain, signed, or in a JSON/comma list)
+KEY_ROOT = "anime_platform/"
+KEY_IN_URL = re.compile(re.escape(KEY_ROOT) + r"[^\s\"'?#&,]+")
+
+def _strings(value) -> Iterable[str]:
+    """Every string in a column value: JSON columns and JSON-encoded text are walked, so escaped keys match."""
+    if isinstance(value, str) and value[:1] in ("[", "{"):
+        try:
+            value = json.loads(value)
+        except ValueError:
+            pass
+    if isinstance(value, str):
+        yield value
+    elif isinstance(value, dict):
+        for v in value.values():
+            yield from _strings(v)
+    elif isinstance(value, (list, tuple)):
+        for v in value:
+            yield from _strings(v)
+
+class StorageGC:
+    """
+    Background deletion of stored objects nothing references any more.
+
+    Delete paths only write tombstones (storage_tombstones) and return. A loop in every
+    API process leases due tombstones, deletes TOS objects with DeleteMultiObjects in
+    batches of up to STORAGE_GC_BATCH_SIZE keys (throttled to STORAGE_GC_DELETES_PER_SECOND)
+    and local files from disk, retrying failures with backoff. Tombstones wait
+    STORAGE_GC_GRACE_SECONDS first; a blob stored again meanwhile cancels its tombstone.
+
+    reconcile() compares the database with storage every STORAGE_GC_RECONCILE_SECONDS:
+    refs of deleted owners, unreferenced blobs, bucket objects no row points at and stray
+    local blob files older than STORAGE_GC_ORPHAN_AGE_SECONDS are tombstoned.
+    """
+    def __init__(self, storage: StorageService = None):
+        self.storage = storage or StorageService()
+        self.repo = StorageTombstoneRepo()
+        self.owner = f"{socket.gethostname()}-{os.getpid()}-gc"
+        self.batch_size = min(max(1, settings.STORAGE_GC_BATCH_SIZE), MAX_KEYS_PER_BATCH)
+        rate = settings.STORAGE_GC_DELETES_PER_SECOND
+        self.limiter = TokenBucket(1, rate=rate, window=1, burst=max(rate, self.batch_size))
+        self._task: Optional[asyncio.Task] = None
+        self._reconcile_task: Optional[asyncio.Task] = None
+        self.deleted_remote = 0
+        self.deleted_local = 0
+        self.batches = 0
+        self.failures = 0
+        self.cancelled = 0
+        self.reconcile_runs = 0
+        self.last_reconcile: dict = {}
+
+    def _in_session(self, fn, *args):
+        db = SessionLocal()
+        try:
+            return fn(db, *args)
+        finally:
+            db.close()
+
+    # Recording
+
+    def target_for_url(self, url: str) -> Optional[dict]:
+        """Tombstone fields for a stored URL (local /static path or our bucket), else None."""
+        if not url:
+            return None
+        if url.startswith("/static/"):
+            return {"backend": "local", "object_key": url.split("?")[0].lstrip("/")}
+        key = self.storage.object_key(url)
+        if key:
+            return {"backend": "tos", "bucket": self.storage._get_config("storage_bucket"), "object_key": key}
+        return None
+
+    def bury_urls(self, db: Session, urls: Iterable[str], reason: str, commit: bool = True) -> int:
+        items = [dict(t, reason=reason) for t in (self.target_for_url(u) for u in urls) if t]
+        return self.repo.add_many(db, items, int(time.time()), settings.STORAGE_GC_GRACE_SECONDS, commit)
+
+    def bury_blobs(self, db: Session, blobs: List[Blob], reason: str, commit: bool = True) -> int:
+        items = []
+        for b in blobs:
+            if b.local_path:
+                items.append({"backend": "local", "object_key": b.local_path, "sha256": b.sha256, "reason": reason})
+            if b.object_key:
+                items.append({"backend": "tos", "bucket": b.bucket, "object_key": b.object_key, "sha256": b.sha256, "reason": reason})
+        return self.repo.add_many(db, items, int(time.time()), settings.STORAGE_GC_GRACE_SECONDS, commit)
+
+    # Deleting
+
+    def _claim(self, db: Session):
+        now = int(time.time())
+        rows = self.repo.claim(db, self.owner, now, self.batch_size, settings.STORAGE_GC_LEASE_SECONDS)
+        # Blobs stored again since they were released keep their files
+        shas = {t.sha256 for t in rows if t.sha256}
+        alive = {s for (s,) in db.query(Blob.sha256).filter(Blob.sha256.in_(shas)).all()} if shas else set()
+        if alive:
+            revived = [t.id for t in rows if t.sha256 in alive]
+            self.repo.done(db, revived)
+            self.cancelled += len(revived)
+        return [(t.id, t.backend, t.bucket, t.object_key, t.sha256) for t in rows if t.sha256 not in alive]
+
+    def _delete_local(self, items: list) -> Dict[int, str]:
+        from .media_singleton import media_cache
+        from .hls_singleton import hls
+        errors = {}
+        for tid, _, _, rel, sha in items:
+            try:
+                path = os.path.join(APP_DIR, rel)
+                if os.path.exists(path):
+                    os.remove(path)
+                if sha:
+                    media_cache.forget(sha)
+                    hls.remove(f"clip_{sha}")
+                self.deleted_local += 1
+            except OSError as e:
+                errors[tid] = str(e)
+        return errors
+
+    def _delete_remote(self, bucket: str, items: list) -> Dict[int, str]:
+        client, current = self.storage._tos_target()
+        if not client or bucket != current:
+            return {tid: f"bucket {bucket} is not configured" for tid, *_ in items}
+        by_key = {}
+        for tid, _, _, key, _ in items:
+            by_key.setdefault(key, []).append(tid)
+        out = client.delete_multi_objects(bucket, [ObjectTobeDeleted(k) for k in by_key], quiet=True)
+        errors = {}
+        for err in out.error or []:
+            if getattr(err, "code", None) == "NoSuchKey":
+                continue
+            for tid in by_key.get(err.key, []):
+                errors[tid] = f"{err.code}: {err.message}"
+        self.deleted_remote += len(by_key) - len({e.key for e in out.error or []})
+        return errors
+
+    async def run_once(self) -> int:
+        """Delete one leased batch. Returns how many tombstones were processed."""
+        items = await io_pools.run("db", self._in_session, self._claim)
+        if not items:
+            return 0
+        errors: Dict[int, str] = {}
+        local = [it for it in items if it[1] == "local"]
+        if local:
+            errors.update(await io_pools.run("file", self._delete_local, local))
+        remote: Dict[str, list] = {}
+        for it in items:
+            if it[1] == "tos":
+                remote.setdefault(it[2], []).append(it)
+        for bucket, group in remote.items():
+            await self.limiter.acquire(len(group))
+            try:
+                errors.update(await io_pools.run("storage", self._delete_remote, bucket, group))
+            except Exception as e:
+                errors.update({it[0]: str(e) for it in group})
+            finally:
+                self.limiter.release()
+            self.batches += 1
+        self.failures += len(errors)
+        done = [it[0] for it in items if it[0] not in errors]
+        await io_pools.run("db", self._in_session, self.repo.done, done)
+        if errors:
+            await io_pools.run("db", self._in_session, self.repo.retry, errors, int(time.time()), settings.STORAGE_GC_MAX_ATTEMPTS)
+        return len(items)
+
+    async def _loop(self):
+        while True:
+            try:
+                n = await self.run_once()
+            except Exception as e:
+                print(f"StorageGC: batch failed: {e}")
+                n = 0
+            if n < self.batch_size:
+                await asyncio.sleep(settings.STORAGE_GC_INTERVAL_SECONDS)
+
+    # Reconciliation
+
+    def _release_dangling_refs(self, db: Session) -> List[Blob]:
+        """Refs whose task, asset or best practice row is gone (e.g. rows deleted in bulk)."""
+        from ..models.asset import Asset
+        from ..models.best_practice import BestPractice
+        from ..repositories.blob_repo import BlobRepo
+        owners = {
+            "task": lambda ids: {str(i) for (i,) in db.query(Task.id).filter(Task.id.in_([int(x) for x in ids if x.lstrip("-").isdigit()])).all()},
+            "asset": lambda ids: {str(i) for (i,) in db.query(Asset.asset_id).filter(Asset.asset_id.in_(ids)).all()},
+            "best_practice": lambda ids: {str(i) for (i,) in db.query(BestPractice.id).filter(BestPractice.id.in_([int(x) for x in ids if x.isdigit()])).all()},
+        }
+        repo, orphans = BlobRepo(), []
+        for owner_type, existing in owners.items():
+            ids = [i for (i,) in db.query(BlobRef.owner_id).filter(BlobRef.owner_type == owner_type).distinct().all()]
+            for start in range(0, len(ids), 500):
+                chunk = ids[start:start + 500]
+                for owner_id in set(chunk) - existing(chunk):
+                    orphans += repo.release(db, owner_type, owner_id, commit=False)
+        return orphans
+
+    def _referenced_keys(self, db: Session) -> Set[str]:
+        """
+        Bucket keys named by any task, asset or best practice URL. Asset metadata counts too:
+        uploaded non-image assets keep their URL and object_key only there.
+        """
+        from ..models.asset import Asset
+        from ..models.best_practice import BestPractice
+        keys = set()
+        for q in (
+            db.query(Task.result_urls, Task.video_url, Task.last_frame_url, Task.input_images),
+            db.query(Asset.cover_image, Asset.gallery, Asset.asset_metadata),
+            db.query(BestPractice.url),
+        ):
+            for row in q.yield_per(1000):
+                for value in row:
+                    for text in _strings(value):
+                        if text.startswith(KEY_ROOT):
+                            keys.add(text) # a bare object_key
+                        for k in KEY_IN_URL.findall(text):
+                            keys.add(k)
+                            keys.add(unquote(k))
+        return keys
+
+    def _orphan_checkers(self, db: Session) -> Dict[str, Callable[[List[str]], Set[str]]]:
+        """Bucket prefix -> fn(keys) returning the keys no database row points at."""
+        def blobs(keys):
+            shas = {os.path.splitext(os.path.basename(k))[0]: k for k in keys}
+            known = {s for (s,) in db.query(Blob.sha256).filter(Blob.sha256.in_(list(shas)), Blob.object_key.isnot(None)).all()}
+            return {k for s, k in shas.items() if s not in known}
+
+        refs = None
+
+        def referenced(k):
+            # One pass over the URL columns per reconcile instead of LIKE scans per key
+            nonlocal refs
+            if refs is None:
+                refs = self._referenced_keys(db)
+            return k in refs
+
+        def legacy_task_files(keys):
+            # anime_platform/project/default/<type>/<task_id>/<file>
+            ids = {}
+            for k in keys:
+                m = re.match(re.escape(LEGACY_TASK_PREFIX) + r"[^/]+/(\d+)/", k)
+                if m:
+                    ids[k] = int(m.group(1))
+            live = {i for (i,) in db.query(Task.id).filter(Task.id.in_(set(ids.values()))).all()} if ids else set()
+            return {k for k, i in ids.items() if i not in live and not referenced(k)}
+
+        def unreferenced(keys):
+            return {k for k in keys if not referenced(k)}
+
+        def uploads(keys):
+            # anime_platform/uploads/<purpose>/<session_id>/<file>: kept while the session
+            # can still complete, or once completed while a task, asset or practice uses it
+            sids = {k: k[len(UPLOAD_PREFIX):].split("/")[1] for k in keys if k.count("/") >= 4}
+            now = int(time.time())
+            open_ = {i for (i,) in db.query(UploadSession.id).filter(
+                UploadSession.id.in_(set(sids.values())), UploadSession.status == "pending",
+                UploadSession.expires_at >= now).all()} if sids else set()
+            return {k for k, s in sids.items() if s not in open_ and not referenced(k)}
+
+        return {
+            f"{BLOB_REMOTE_PREFIX}/": blobs,
+            LEGACY_TASK_PREFIX: legacy_task_files,
+            LEGACY_INPUT_PREFIX: unreferenced,
+            UPLOAD_PREFIX: uploads,
+        }
+
+    def _scan_bucket(self, db: Session, cutoff: float) -> int:
+        client, bucket = self.storage._tos_target()
+        if not client:
+            return 0
+        found = 0
+        for prefix, orphans_of in self._orphan_checkers(db).items():
+            token = None
+            while True:
+                page = client.list_objects_type2(bucket, prefix=prefix, continuation_token=token, max_keys=1000)
+                old = [o.key for o in page.contents if o.last_modified and o.last_modified.timestamp() < cutoff]
+                keys = orphans_of(old) if old else set()
+                keys -= self.repo.pending_keys(db, list(keys))
+                if keys:
+                    found += self.repo.add_many(db, [
+                        {"backend": "tos", "bucket": bucket, "object_key": k, "reason": "reconcile"} for k in sorted(keys)
+                    ], int(time.time()), 0)
+                if not page.is_truncated:
+                    break
+                token = page.next_continuation_token
+        return found
+
+    def _scan_local(self, db: Session, cutoff: float) -> int:
+        """Blob files on this node's disk with no row (and abandoned scratch files)."""
+        root = os.path.join(APP_DIR, BLOB_LOCAL_DIR)
+        if not os.path.isdir(root):
+            return 0
+        candidates = {}
+        for dirpath, _, files in os.walk(root):
+            for name in files:
+                path = os.path.join(dirpath, name)
+                try:
+                    if os.path.getmtime(path) >= cutoff:
+                        continue
+                except OSError:
+                    continue
+                rel = os.path.relpath(path, APP_DIR).replace(os.sep, "/")
+                candidates[rel] = None if rel.startswith(f"{INCOMING_DIR}/") or ".part-" in name else os.path.splitext(name)[0]
+        shas = [s for s in candidates.values() if s]
+        known = set()
+        for start in range(0, len(shas), 500):
+            known |= {s for (s,) in db.query(Blob.sha256).filter(Blob.sha256.in_(shas[start:start + 500])).all()}
+        stray = [rel for rel, sha in candidates.items() if sha not in known]
+        pending = set()
+        for start in range(0, len(stray), 500):
+            pending |= self.repo.pending_keys(db, stray[start:start + 500])
+        stray = [rel for rel in stray if rel not in pending]
+        return self.repo.add_many(db, [{"backend": "local", "object_key": rel, "reason": "reconcile"} for rel in stray],
+                                  int(time.time()), 0)
+
+    def reconcile(self, db: Session) -> dict:
+        now = time.time()
+        cutoff = now - settings.STORAGE_GC_ORPHAN_AGE_SECONDS
+        from ..repositories.blob_repo import BlobRepo
+        out = {"started_at": int(now)}
+        orphans = self._release_dangling_refs(db)
+        orphans += BlobRepo().drop_unreferenced(db, int(cutoff), commit=False)
+        out["blobs"] = self.bury_blobs(db, orphans, "reconcile")
+        try:
+            out["bucket_objects"] = self._scan_bucket(db, cutoff)
+        except Exception as e:
+            db.rollback()
+            out["bucket_error"] = str(e)
+            print(f"StorageGC: bucket scan failed: {e}")
+        out["local_files"] = self._scan_local(db, cutoff)
+        out["seconds"] = round(time.time() - now, 2)
+        self.reconcile_runs += 1
+        self.last_reconcile = out
+        print(f"StorageGC: reconcile {out}")
+        return out
+
+    async def _reconcile_loop(self):
+        while True:
+            await asyncio.sleep(settings.STORAGE_GC_RECONCILE_SECONDS)
+            try:
+                await io_pools.run("storage", self._in_session, self.reconcile)
+            except Exception as e:
+                print(f"StorageGC: reconcile failed: {e}")
+
+    def start(self):
+        if not settings.STORAGE_GC_ENABLED or self._task is not None:
+            return
+        self._task = asyncio.create_task(self._loop())
+        if settings.STORAGE_GC_RECONCILE_SECONDS > 0:
+            self._reconcile_task = asyncio.create_task(self._reconcile_loop())
+
+    async def stop(self):
+        for t in (self._task, self._reconcile_task):
+            if t:
+                t.cancel()
+        self._task = self._reconcile_task = None
+
+    def stats(self, db: Session) -> dict:
+        out = self.repo.stats(db, int(time.time()))
+        out.update(
+            deleted_remote=self.deleted_remote, deleted_local=self.deleted_local, batches=self.batches,
+            failures=self.failures, cancelled=self.cancelled, limiter=self.limiter.stats(),
+            reconcile_runs=self.reconcile_runs, last_reconcile=self.last_reconcile,
+        )
+        return out
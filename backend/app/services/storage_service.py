@@ -1,32 +1,43 @@
 import os
 import asyncio
-import aiohttp
 import aiofiles
 import time
-import tos
+import uuid
+import hashlib
 from typing import Optional, Union
 from urllib.parse import urlparse
 from sqlalchemy.orm import Session
-from ..repositories.system_config_repo import SystemConfigRepo
+from .http_singleton import http_clients
+from .io_singleton import io_pools
+from .config_singleton import config_cache
+from .tos_singleton import tos_clients, signed_urls
+from .. import settings
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+TOS_CLIENT_KEYS = ("storage_ak", "storage_sk", "storage_endpoint", "storage_region")
 
 class StorageService:
     def __init__(self, db: Session = None):
-        self.repo = SystemConfigRepo()
+        # db is kept for callers that pass one; config comes from the process-wide cache
         self.db = db
 
     def _get_config(self, key: str) -> Optional[str]:
-        if not self.db: return None
-        cfg = self.repo.get(self.db, key)
-        return cfg.value if cfg else None
+        return config_cache.get(key)
 
     def _get_tos_client(self):
-        ak = self._get_config("storage_ak")
-        sk = self._get_config("storage_sk")
-        endpoint = self._get_config("storage_endpoint")
-        region = self._get_config("storage_region")
+        ak, sk, endpoint, region = (self._get_config(k) for k in TOS_CLIENT_KEYS)
         if not (ak and sk and endpoint and region):
             return None
-        return tos.TosClientV2(ak, sk, endpoint, region)
+        return tos_clients.get(ak, sk, endpoint, region)
+
+    def _tos_target(self):
+        """(client, bucket) if TOS uploads are possible, else (None, None)."""
+        client = self._get_tos_client()
+        bucket = self._get_config("storage_bucket")
+        if client and bucket:
+            return client, bucket
+        return None, None
 
     def refresh_signed_url(self, url: str) -> str:
         """
@@ -79,85 +90,103 @@ class StorageService:
             print(f"Refresh sign failed for {url}: {e}")
             return url
 
-    async def upload_content(self, content: Union[bytes, str], task_id: int, file_type: str, filename: str) -> str:
+    def object_url(self, bucket: str, key: str) -> str:
+        """Unsigned URL of an object; refresh_signed_url() turns it into a redirect link."""
+        endpoint = self._get_config("storage_endpoint") or ""
+        scheme, host = endpoint.split("://", 1) if "://" in endpoint else ("https", endpoint)
+        return f"{scheme}://{bucket}.{host}/{key}"
+
+    def object_key(self, url: str) -> Optional[str]:
+        """Key of `url` if it points into the configured bucket (signed or not), else None."""
+        endpoint = self._get_config("storage_endpoint") or ""
+        bucket = self._get_config("storage_bucket")
+        host = endpoint.split("://", 1)[-1]
+        if not (url and host and bucket) or not url.startswith("http"):
+            return None
+        parsed = urlparse(url)
+        if parsed.netloc != f"{bucket}.{host}":
+            return None
+        return parsed.path.lstrip("/") or None
+
+    def _sign_get(self, client, bucket: str, key: str, expires: int = 3600) -> str:
+        url, _ = signed_urls.sign(client, bucket, key, expires, query={"response-content-disposition": "inline"})
+        return url
+
+    def sign_key(self, key: str, expires: int = None):
         """
-        Upload content (bytes or string) to storage.
-        If TOS is configured, upload to TOS.
-        Otherwise, fallback to LOCAL storage (to prevent 500 errors if TOS is missing).
+        (signed_url, expires_at) for an object key in the configured bucket, reusing a
+        cached signature while it is still comfortably valid; (None, None) without TOS.
         """
-        # 1. Local Cache (Always keep for internal use)
-        app_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-        
-        # Determine local path
-        if file_type == "video":
-            local_rel_path = f"static/cache/{task_id}_{filename}"
-        else:
-            # Default structure for images/others
-            local_rel_path = f"static/uploads/{task_id}_{filename}"
-            
-        local_abs_path = os.path.join(app_dir, local_rel_path)
-        os.makedirs(os.path.dirname(local_abs_path), exist_ok=True)
-        
-        # Write to local disk
-        try:
-            mode = 'wb' if isinstance(content, bytes) else 'w'
-            async with aiofiles.open(local_abs_path, mode) as f:
-                await f.write(content)
-            print(f"Saved local file to {local_abs_path}")
-        except Exception as e:
-            print(f"Failed to save local file: {e}")
-            
-        # 2. Try TOS Upload
+        client, bucket = self._tos_target()
+        if not client:
+            return None, None
+        return signed_urls.sign(client, bucket, key, expires or settings.SIGNED_URL_TTL_SECONDS)
+
+    def _owner(self, task_id: int, role: str):
+        # task_id 0 is used for scratch files that belong to no task
+        return ("task", task_id, role) if task_id else None
+
+    async def upload_content(self, content: Union[bytes, str], task_id: int, file_type: str, filename: str, role: str = None) -> str:
+        """
+        Store content (bytes or string) as a content-addressed blob, referenced by the task.
+        Identical content is written and uploaded only once. Returns the signed TOS URL,
+        or the local /static URL if TOS is not configured (or the upload failed).
+        """
+        from .blob_singleton import blobs
+        data = content if isinstance(content, bytes) else content.encode("utf-8")
+        blob = await blobs.put_bytes(data, filename, owner=self._owner(task_id, role or file_type))
+        return await io_pools.run("storage", blobs.url, blob, True)
+
+    async def upload_file_path(self, local_abs_path: str, task_id: int, file_type: str, filename: str,
+                               sha256: Optional[str] = None, role: str = None) -> str:
+        """
+        Store a file that is already on local disk without reading it into memory.
+        Large files go through TOS multipart upload; a file whose content is already
+        stored is not uploaded again. Returns the same kind of URL as upload_content.
+        """
+        from .blob_singleton import blobs
+        blob = await blobs.put_file(local_abs_path, filename, sha256=sha256, owner=self._owner(task_id, role or file_type))
+        return await io_pools.run("storage", blobs.url, blob, True)
+
+    async def _stream_to_file(self, url: str, dest_path: str) -> Optional[str]:
+        """
+        Stream url into dest_path chunk by chunk, hashing as it goes.
+        Writes to a temp file first so a partial download never looks like a cached file.
+        Returns the sha256 hex digest, or None on failure.
+        """
+        tmp_path = f"{dest_path}.part-{uuid.uuid4().hex[:8]}"
+        client = http_clients.get("download")
         try:
-            client = self._get_tos_client()
-            bucket = self._get_config("storage_bucket")
-            
-            if client and bucket:
-                remote_key = f"anime_platform/project/default/{file_type}/{task_id}/{filename}"
-                client.put_object(bucket, remote_key, content=content)
-                
-                # Generate Pre-signed URL
-                out = client.pre_signed_url(
-                    tos.HttpMethodType.Http_Method_Get, 
-                    bucket, 
-                    remote_key, 
-                    expires=3600,
-                    response_content_disposition='inline'
-                )
-                if hasattr(out, 'signed_url'):
-                     return out.signed_url
-                return out
+            sha = hashlib.sha256()
+            async with client.stream("GET", url, timeout=settings.STORAGE_DOWNLOAD_TIMEOUT) as resp:
+                if resp.status_code != 200:
+                    print(f"Download failed for {url}: HTTP {resp.status_code}")
+                    return None
+                async with aiofiles.open(tmp_path, "wb") as f:
+                    async for chunk in resp.aiter_bytes(settings.STORAGE_STREAM_CHUNK_SIZE):
+                        sha.update(chunk)
+                        await f.write(chunk)
+            os.replace(tmp_path, dest_path)
+            return sha.hexdigest()
         except Exception as e:
-            print(f"TOS Upload skipped/failed: {e}")
-            # Do NOT raise exception here, fallback to local URL
-            
-        # 3. Fallback to Local URL
-        # URL should be relative to backend root, e.g. /static/cache/...
-        return f"/{local_rel_path}"
+            print(f"Download failed for {url}: {e}")
+            return None
+        finally:
+            if os.path.exists(tmp_path):
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
 
-    async def save_file(self, url: str, task_id: int, file_type: str, filename: str = None) -> str:
+    async def save_file(self, url: str, task_id: int, file_type: str, filename: str = None, role: str = None) -> str:
         """
         Download file from url and save it to storage.
+        The body is streamed to a scratch file and then handed to the blob store, so peak
+        memory stays bounded by the chunk size regardless of the clip length.
         """
+        from .blob_singleton import blobs
         if not url: return ""
         
-        # Download content with simple retry
-        content = None
-        attempts = 3
-        async with aiohttp.ClientSession() as session:
-            for _ in range(attempts):
-                try:
-                    async with session.get(url) as resp:
-                        if resp.status == 200:
-                            content = await resp.read()
-                            break
-                except Exception as e:
-                    pass
-                await asyncio.sleep(0.5)
-        
-        if not content:
-            return url # Failed to download
-            
         if not filename:
             filename = os.path.basename(urlparse(url).path)
             if "?" in filename:
@@ -165,7 +194,28 @@ class StorageService:
             if not filename:
                 filename = f"{int(time.time())}.bin"
         
-        return await self.upload_content(content, task_id, file_type, filename)
+        local_abs_path = blobs.incoming_path()
+        
+        # Download content with simple retry
+        sha256 = None
+        attempts = 3
+        for _ in range(attempts):
+            sha256 = await self._stream_to_file(url, local_abs_path)
+            if sha256:
+                break
+            await asyncio.sleep(0.5)
+        
+        if not sha256:
+            return url # Failed to download
+        
+        try:
+            blob = await blobs.put_file(local_abs_path, filename, sha256=sha256, move=True,
+                                        owner=self._owner(task_id, role or file_type))
+        finally:
+            if os.path.exists(local_abs_path):
+                os.remove(local_abs_path)
+        print(f"Saved {filename} for task {task_id} as blob {sha256[:12]}")
+        return await io_pools.run("storage", blobs.url, blob, True)
 
     async def delete_file(self, url: str) -> bool:
         """
@@ -198,15 +248,13 @@ class StorageService:
                     path = parsed.path.lstrip("/")
                     
                     # Heuristic: If we have TOS creds, try to delete.
-                    client = self._get_tos_client()
-                    if client:
-                        bucket = self._get_config("storage_bucket")
-                        if bucket:
-                            # If the URL contains the bucket name or endpoint, it's likely ours.
-                            # Even if not, trying to delete doesn't hurt (unless key conflict, unlikely).
-                            print(f"Attempting TOS delete: bucket={bucket}, key={path}")
-                            client.delete_object(bucket, path)
-                            return True
+                    client, bucket = self._tos_target()
+                    if client and bucket:
+                        # If the URL contains the bucket name or endpoint, it's likely ours.
+                        # Even if not, trying to delete doesn't hurt (unless key conflict, unlikely).
+                        print(f"Attempting TOS delete: bucket={bucket}, key={path}")
+                        await io_pools.run("storage", client.delete_object, bucket, path)
+                        return True
                 except Exception as e:
                     print(f"TOS Delete failed for {url}: {e}")
                     return False
@@ -1,13 +1,154 @@
 import asyncio
+import time
+from collections import deque
+from typing import Optional
 
 class TokenBucket:
-    def __init__(self, capacity: int):
-        self.capacity = capacity
-        self.sem = None
-    async def acquire(self):
-        if self.sem is None:
-            self.sem = asyncio.Semaphore(self.capacity)
-        await self.sem.acquire()
+    """
+    Per-model limiter combining a concurrency cap with a sustained request rate.
+
+    - capacity: max jobs holding a slot at once (ModelConfig.concurrency_quota)
+    - rate / window: `rate` requests refill evenly over `window` seconds (ModelConfig.request_quota);
+      0 disables rate limiting
+    - burst: max tokens that can accumulate; defaults to the whole window's quota
+
+    Waiters are served FIFO. resize() changes limits in place, so slots held by
+    in-flight jobs stay accounted for when an admin edits the model. set_limit()
+    lowers the effective concurrency below capacity (used by the adaptive controller).
+    """
+    def __init__(self, capacity: int, rate: int = 0, window: float = 86400, burst: int = 0):
+        self.capacity = max(1, capacity or 1)
+        self.limit = self.capacity # effective concurrency, <= capacity
+        self.rate = max(0, rate or 0)
+        self.window = window
+        self.burst = self._burst(burst)
+        self.tokens = float(self.burst)
+        self.in_flight = 0
+        self._waiters: deque = deque()
+        self._updated = time.monotonic()
+        self._timer: Optional[asyncio.TimerHandle] = None
+        # Counters for stats()
+        self.acquired = 0
+        self.rate_limited = 0
+        self.wait_seconds = 0.0
+
+    def _burst(self, burst: int) -> int:
+        if not self.rate:
+            return 0
+        return max(1, burst or self.rate)
+
+    @property
+    def refill_per_second(self) -> float:
+        return self.rate / self.window if self.rate and self.window > 0 else 0.0
+
+    def _refill(self):
+        now = time.monotonic()
+        if self.rate:
+            self.tokens = min(float(self.burst), self.tokens + (now - self._updated) * self.refill_per_second)
+        self._updated = now
+
+    def _wake(self):
+        """Hand slots to waiters in order while both a slot and a token are available."""
+        self._refill()
+        while self._waiters and self.in_flight < self.limit:
+            fut, cost = self._waiters[0]
+            if fut.done():
+                self._waiters.popleft()
+                continue
+            if self.rate and cost and self.tokens < cost:
+                self._schedule((cost - self.tokens) / self.refill_per_second)
+                return
+            self._waiters.popleft()
+            if self.rate and cost:
+                self.tokens -= cost
+            self.in_flight += 1
+            fut.set_result(True)
+
+    def _schedule(self, delay: float):
+        if self._timer is not None:
+            return
+        def fire():
+            self._timer = None
+            self._wake()
+        self._timer = asyncio.get_running_loop().call_later(max(delay, 0.01), fire)
+
+    async def acquire(self, cost: int = 1):
+        """
+        Wait for a concurrency slot and `cost` rate tokens.
+        Use cost=0 for work that holds a slot without sending a new upstream request
+        (e.g. resuming a task that was already created).
+        """
+        t0 = time.monotonic()
+        self._refill()
+        if not self._waiters and self.in_flight < self.limit and (not self.rate or not cost or self.tokens >= cost):
+            if self.rate and cost:
+                self.tokens -= cost
+            self.in_flight += 1
+            self.acquired += 1
+            return
+        if self.in_flight < self.limit:
+            self.rate_limited += 1
+        fut = asyncio.get_running_loop().create_future()
+        self._waiters.append((fut, cost))
+        self._wake()
+        try:
+            await fut
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                # Slot was granted just as we got cancelled; give it back
+                self.release()
+            raise
+        self.acquired += 1
+        self.wait_seconds += time.monotonic() - t0
+
     def release(self):
-        if self.sem:
-            self.sem.release()
+        if self.in_flight > 0:
+            self.in_flight -= 1
+        self._wake()
+
+    def resize(self, capacity: int, rate: int = None, window: float = None, burst: int = 0):
+        """Apply new quotas in place. Jobs already holding slots keep them."""
+        unconstrained = self.limit >= self.capacity
+        self.capacity = max(1, capacity or 1)
+        self.limit = self.capacity if unconstrained else min(self.limit, self.capacity)
+        self._refill()
+        if rate is not None:
+            had_rate = bool(self.rate)
+            self.rate = max(0, rate or 0)
+            if window is not None:
+                self.window = window
+            self.burst = self._burst(burst)
+            self.tokens = float(self.burst) if not had_rate else min(self.tokens, float(self.burst))
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._waiters:
+            self._wake()
+
+    def set_limit(self, limit: int):
+        """Set the effective concurrency, clamped to [1, capacity]. Held slots are never revoked."""
+        limit = min(max(1, int(limit)), self.capacity)
+        grew = limit > self.limit
+        self.limit = limit
+        if grew and self._waiters:
+            self._wake()
+
+    def stats(self) -> dict:
+        """Read-only, so it is safe off the loop: tokens are projected to now, not refilled."""
+        tokens = self.tokens
+        if self.rate:
+            tokens = min(float(self.burst), tokens + (time.monotonic() - self._updated) * self.refill_per_second)
+        return {
+            "capacity": self.capacity,
+            "limit": self.limit,
+            "in_flight": self.in_flight,
+            "waiters": sum(1 for f, _ in list(self._waiters) if not f.done()),
+            "utilization": round(self.in_flight / self.limit, 3),
+            "request_quota": self.rate,
+            "window_seconds": self.window,
+            "burst": self.burst,
+            "tokens": round(tokens, 2) if self.rate else None,
+            "acquired": self.acquired,
+            "rate_limited_waits": self.rate_limited,
+            "avg_wait_seconds": round(self.wait_seconds / self.acquired, 3) if self.acquired else 0.0,
+        }
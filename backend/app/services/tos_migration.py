@@ -0,0 +1,281 @@
+import asyncio
+import json
+import os
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+from sqlalchemy.orm import Session
+from ..db import SessionLocal
+from ..models.asset import Asset
+from ..models.best_practice import BestPractice
+from ..models.task import Task
+from ..repositories.migration_repo import MigrationRepo
+from .storage_service import StorageService, APP_DIR
+from .input_staging import decode_data_uri
+from .io_singleton import io_pools
+
+REDIRECT_PREFIX = "/api/storage/redirect"
+SCAN_BATCH = 500
+
+# owner_type -> (model, id column, [(field, holds a JSON list, blob ref role)])
+# Task roles follow the uploads they replace; None means the task type ("image" / "video")
+SOURCES = {
+    "task": (Task, Task.id, [("input_images", True, "input"), ("result_urls", True, None),
+                             ("video_url", False, "video"), ("last_frame_url", False, "last_frame")]),
+    "asset": (Asset, Asset.asset_id, [("cover_image", False, "media"), ("gallery", True, "media")]),
+    "best_practice": (BestPractice, BestPractice.id, [("url", False, "media")]),
+}
+
+def _unwrap(url: str) -> str:
+    if url.startswith(REDIRECT_PREFIX):
+        return (parse_qs(urlparse(url).query).get("url") or [url])[0]
+    return url
+
+def _as_list(value) -> list:
+    if isinstance(value, list):
+        return value
+    if not value:
+        return []
+    try:
+        out = json.loads(value)
+        return out if isinstance(out, list) else [value]
+    except (TypeError, ValueError):
+        return value.split(",")
+
+class TosMigration:
+    """
+    Moves files referenced by tasks, assets and best practices into TOS.
+
+    discover() walks the tables in id order and checkpoints every URL that is not in the
+    configured bucket yet (local /static files, data URIs, other hosts) into
+    migration_items. run() feeds those items to `workers` concurrent uploads: files go
+    through the blob store, so they are streamed from disk (multipart above
+    STORAGE_MULTIPART_THRESHOLD), uploaded once per content and referenced by their owner.
+    Each finished item rewrites its column only if it still holds the source URL.
+    A crashed or interrupted run picks up the items that are not done.
+    """
+    def __init__(self, run: str = "local_to_tos", owner_types: Optional[List[str]] = None,
+                 workers: int = 8, max_attempts: int = 3, storage: StorageService = None):
+        self.run_name = run
+        self.owner_types = owner_types or list(SOURCES)
+        self.workers = max(1, workers)
+        self.max_attempts = max_attempts
+        self.storage = storage or StorageService()
+        self.repo = MigrationRepo()
+        self._owner_locks: Dict[Tuple[str, str], asyncio.Lock] = {}
+        self.started = 0.0
+        self.done = 0
+        self.failed = 0
+        self.bytes_done = 0
+
+    def _in_session(self, fn, *args):
+        db = SessionLocal()
+        try:
+            return fn(db, *args)
+        finally:
+            db.close()
+
+    def needs_migration(self, url) -> bool:
+        if not isinstance(url, str) or not url:
+            return False
+        url = _unwrap(url)
+        if self.storage.object_key(url):
+            return False
+        return url.startswith(("/static/", "data:", "http"))
+
+    def _source_size(self, url: str) -> Optional[int]:
+        url = _unwrap(url)
+        if url.startswith("/static/"):
+            path = os.path.join(APP_DIR, url.split("?")[0].lstrip("/"))
+            return os.path.getsize(path) if os.path.exists(path) else None
+        if url.startswith("data:"):
+            return len(url.split(",", 1)[-1]) * 3 // 4
+        return None # remote; known after download
+
+    # Discovery
+
+    def _scan(self, db: Session, owner_type: str) -> Iterator[List[dict]]:
+        """Candidate items of one table, one id-ordered batch at a time."""
+        model, id_col, fields = SOURCES[owner_type]
+        last = None
+        while True:
+            q = db.query(model).order_by(id_col)
+            if last is not None:
+                q = q.filter(id_col > last)
+            rows = q.limit(SCAN_BATCH).all()
+            if not rows:
+                return
+            batch = []
+            for row in rows:
+                owner_id = getattr(row, id_col.key)
+                for field, is_list, _ in fields:
+                    value = getattr(row, field)
+                    urls = _as_list(value) if is_list else [value]
+                    for pos, url in enumerate(urls):
+                        if self.needs_migration(url):
+                            batch.append({"owner_type": owner_type, "owner_id": owner_id, "field": field,
+                                          "position": pos, "source_url": url, "size": self._source_size(url)})
+            last = getattr(rows[-1], id_col.key)
+            db.expunge_all()
+            yield batch
+
+    def estimate(self, db: Session) -> dict:
+        """Dry run: objects and bytes that would be migrated, without writing anything."""
+        out = {}
+        for owner_type in self.owner_types:
+            est = {"items": 0, "unique_sources": 0, "bytes": 0, "local_missing": 0, "remote_unknown_size": 0}
+            seen = set()
+            for batch in self._scan(db, owner_type):
+                for it in batch:
+                    est["items"] += 1
+                    src = _unwrap(it["source_url"]).split("?")[0]
+                    if src in seen:
+                        continue # same file, uploaded once
+                    seen.add(src)
+                    if it["size"] is not None:
+                        est["bytes"] += it["size"]
+                    elif src.startswith("/static/"):
+                        est["local_missing"] += 1
+                    else:
+                        est["remote_unknown_size"] += 1
+            est["unique_sources"] = len(seen)
+            out[owner_type] = est
+        out["checkpoint"] = self.repo.summary(db, self.run_name)
+        return out
+
+    def discover(self, db: Session) -> int:
+        added = 0
+        for owner_type in self.owner_types:
+            for batch in self._scan(db, owner_type):
+                added += self.repo.add_missing(db, self.run_name, batch)
+        return added
+
+    # Migration
+
+    async def _store(self, item, role: str):
+        from .blob_singleton import blobs
+        owner = (item.owner_type, item.owner_id, role)
+        src = _unwrap(item.source_url)
+        if src.startswith("/static/"):
+            path = os.path.join(APP_DIR, src.split("?")[0].lstrip("/"))
+            if not os.path.exists(path):
+                return None
+            return await blobs.put_file(path, os.path.basename(path), owner=owner)
+        if src.startswith("data:"):
+            data, mime = await io_pools.run("file", decode_data_uri, src)
+            return await blobs.put_bytes(data, None, mime, owner=owner)
+        dest = blobs.incoming_path()
+        sha = await self.storage._stream_to_file(src, dest)
+        if not sha:
+            raise RuntimeError("download failed")
+        name = os.path.basename(urlparse(src).path)
+        return await blobs.put_file(dest, name, sha256=sha, move=True, owner=owner)
+
+    def _apply(self, db: Session, item, url: str) -> bool:
+        """Swap the source URL for `url` in the owner's column; False if the column changed meanwhile."""
+        model, id_col, fields = SOURCES[item.owner_type]
+        owner_id = int(item.owner_id) if item.owner_type != "asset" else item.owner_id
+        row = db.query(model).filter(id_col == owner_id).first()
+        if row is None:
+            return False
+        is_list = next(f[1] for f in fields if f[0] == item.field)
+        value = getattr(row, item.field)
+        if not is_list:
+            if value != item.source_url:
+                return False
+            setattr(row, item.field, url)
+        else:
+            urls = list(_as_list(value))
+            if item.position >= len(urls) or urls[item.position] != item.source_url:
+                return False
+            urls[item.position] = url
+            # Task columns are JSON text, Asset.gallery is a JSON column
+            setattr(row, item.field, urls if isinstance(value, list) else json.dumps(urls))
+        db.commit()
+        return True
+
+    async def _migrate(self, item):
+        from .blob_singleton import blobs
+        fields = SOURCES[item.owner_type][2]
+        role = next(f[2] for f in fields if f[0] == item.field)
+        try:
+            if role is None:
+                role = await io_pools.run("db", self._in_session, lambda db: db.query(Task.type).filter(
+                    Task.id == int(item.owner_id)).scalar()) or "image"
+            blob = await self._store(item, role)
+            if blob is None:
+                await io_pools.run("db", self._in_session, self.repo.finish, item.id, "missing", None, None, None, "local file not found")
+                self.failed += 1
+                return
+            if not blob.object_key:
+                raise RuntimeError("TOS upload failed, blob kept locally")
+            url = await io_pools.run("storage", blobs.url, blob)
+            if item.owner_type != "task":
+                # Asset and best practice URLs are shown as-is; the redirect link re-signs on access
+                url = self.storage.refresh_signed_url(url)
+            lock = self._owner_locks.setdefault((item.owner_type, item.owner_id), asyncio.Lock())
+            async with lock:
+                applied = await io_pools.run("db", self._in_session, self._apply, item, url)
+            await io_pools.run("db", self._in_session, self.repo.finish, item.id, "done" if applied else "stale",
+                               url, blob.sha256, blob.size)
+            self.done += 1
+            self.bytes_done += blob.size or 0
+        except Exception as e:
+            print(f"  [{item.owner_type} {item.owner_id}] {item.field}[{item.position}] failed: {e}")
+            await io_pools.run("db", self._in_session, self.repo.finish, item.id, "failed", None, None, None, str(e))
+            self.failed += 1
+
+    async def _report(self, total: int, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            print(self.progress(total))
+
+    def progress(self, total: int) -> str:
+        elapsed = max(time.monotonic() - self.started, 1e-6)
+        finished = self.done + self.failed
+        rate = self.bytes_done / elapsed
+        items_per_s = finished / elapsed
+        eta = (total - finished) / items_per_s if items_per_s and total > finished else 0
+        return (f"  {finished}/{total} items ({self.failed} failed), {self.bytes_done / 1e6:.1f} MB, "
+                f"{rate / 1e6:.2f} MB/s, {items_per_s:.1f} items/s, ETA {eta:.0f}s")
+
+    async def run(self, report_interval: float = 10.0) -> dict:
+        client, bucket = self.storage._tos_target()
+        if not client:
+            raise RuntimeError("TOS is not configured")
+        added = await io_pools.run("db", self._in_session, self.discover)
+        summary = await io_pools.run("db", self._in_session, self.repo.summary, self.run_name)
+        total = summary.get("pending", {}).get("items", 0) + summary.get("failed", {}).get("items", 0)
+        print(f"Migrating to TOS bucket {bucket}: {added} new items checkpointed, {total} to do")
+
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.workers * 4)
+
+        async def produce():
+            after = 0
+            while True:
+                batch = await io_pools.run("db", self._in_session, self.repo.next_batch,
+                                           self.run_name, after, SCAN_BATCH, self.max_attempts)
+                if not batch:
+                    break
+                for item in batch:
+                    await queue.put(item)
+                after = batch[-1].id
+            for _ in range(self.workers):
+                await queue.put(None)
+
+        async def work():
+            while True:
+                item = await queue.get()
+                if item is None:
+                    return
+                await self._migrate(item)
+
+        self.started = time.monotonic()
+        self.done = self.failed = self.bytes_done = 0
+        reporter = asyncio.create_task(self._report(total, report_interval))
+        try:
+            await asyncio.gather(produce(), *(work() for _ in range(self.workers)))
+        finally:
+            reporter.cancel()
+        print(self.progress(total))
+        return await io_pools.run("db", self._in_session, self.repo.summary, self.run_name)
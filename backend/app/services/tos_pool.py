@@ -0,0 +1,88 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+import tos
+from .. import settings
+
+class TosClientPool:
+    """
+    One TosClientV2 per (ak, sk, endpoint, region). The client keeps its own HTTP
+    connection pool, so reusing it also reuses connections to TOS.
+    """
+    def __init__(self):
+        self._clients: Dict[tuple, tos.TosClientV2] = {}
+        self._lock = threading.Lock()
+        self.created = 0
+        self.reused = 0
+
+    def get(self, ak: str, sk: str, endpoint: str, region: str) -> tos.TosClientV2:
+        key = (ak, sk, endpoint, region)
+        with self._lock:
+            client = self._clients.get(key)
+            if client is not None:
+                self.reused += 1
+                return client
+        client = tos.TosClientV2(ak, sk, endpoint, region)
+        with self._lock:
+            # Another thread may have built one meanwhile; keep the first
+            client = self._clients.setdefault(key, client)
+            self.created += 1
+        return client
+
+    def clear(self):
+        with self._lock:
+            self._clients.clear()
+
+    def stats(self) -> dict:
+        return {"clients": len(self._clients), "created": self.created, "reused": self.reused}
+
+class SignedUrlCache:
+    """
+    Pre-signed GET URLs keyed by (client, bucket, key, expires, query).
+    A signature is handed out again until SIGNED_URL_REFRESH_BEFORE seconds before it
+    expires, so callers always get at least that much validity. Bounded LRU.
+    """
+    def __init__(self):
+        self.refresh_before = settings.SIGNED_URL_REFRESH_BEFORE
+        self.max_entries = settings.SIGNED_URL_CACHE_MAX_ENTRIES
+        self._entries: "OrderedDict[tuple, Tuple[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def sign(self, client, bucket: str, key: str, expires: int, query: Optional[dict] = None) -> Tuple[str, float]:
+        """(signed_url, expires_at epoch seconds)."""
+        ck = (id(client), bucket, key, expires, tuple(sorted((query or {}).items())))
+        now = time.time()
+        with self._lock:
+            hit = self._entries.get(ck)
+            if hit and hit[1] - now > min(self.refresh_before, expires / 2):
+                self._entries.move_to_end(ck)
+                self.hits += 1
+                return hit
+        out = client.pre_signed_url(tos.HttpMethodType.Http_Method_Get, bucket, key, expires=expires, query=query)
+        url = out.signed_url if hasattr(out, "signed_url") else out
+        entry = (url, now + expires)
+        with self._lock:
+            self.misses += 1
+            self._entries[ck] = entry
+            self._entries.move_to_end(ck)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "refresh_before_seconds": self.refresh_before,
+        }
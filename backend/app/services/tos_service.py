@@ -1,29 +1,19 @@
 import os
-import tos
-from ..db import SessionLocal
-from ..repositories.system_config_repo import SystemConfigRepo
+from .config_singleton import config_cache
+from .tos_singleton import tos_clients, signed_urls
 
 class TOSService:
     def __init__(self):
-        # 从数据库加载配置，与 VikingDBService 保持一致
-        db = SessionLocal()
-        repo = SystemConfigRepo()
-        
-        def get_config(key, default):
-            conf = repo.get(db, key)
-            return conf.value if conf else default
-
-        self.ak = get_config("vikingdb_ak", os.environ.get("VIKINGDB_AK", ""))
-        self.sk = get_config("vikingdb_sk", os.environ.get("VIKINGDB_SK", ""))
-        self.region = get_config("vikingdb_region", os.environ.get("VIKINGDB_REGION", "cn-beijing"))
-        
-        db.close()
+        # 从配置缓存加载，与 VikingDBService 保持一致
+        self.ak = config_cache.get("vikingdb_ak", os.environ.get("VIKINGDB_AK", ""))
+        self.sk = config_cache.get("vikingdb_sk", os.environ.get("VIKINGDB_SK", ""))
+        self.region = config_cache.get("vikingdb_region", os.environ.get("VIKINGDB_REGION", "cn-beijing"))
         
         self.endpoint = f"tos-{self.region}.volces.com"
         
         if self.ak and self.sk:
             try:
-                self.client = tos.TosClientV2(self.ak, self.sk, self.endpoint, self.region)
+                self.client = tos_clients.get(self.ak, self.sk, self.endpoint, self.region)
             except Exception as e:
                 print(f"Failed to init TOS client: {e}")
                 self.client = None
@@ -56,8 +46,8 @@ class TOSService:
             # method, bucket, key, expires, headers=None, query=None
             # Force inline display
             query = {"response-content-disposition": "inline"}
-            out = self.client.pre_signed_url(tos.HttpMethodType.Http_Method_Get, bucket, key, expires, query=query)
-            return out.signed_url
+            signed_url, _ = signed_urls.sign(self.client, bucket, key, expires, query=query)
+            return signed_url
         except Exception as e:
             print(f"Error signing TOS url {url}: {e}")
             return url
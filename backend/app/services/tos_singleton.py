@@ -0,0 +1,17 @@
+from .tos_pool import TosClientPool, SignedUrlCache
+from .config_singleton import config_cache
+
+tos_clients = TosClientPool()
+signed_urls = SignedUrlCache()
+
+# Keys any pooled client is built from; rotating credentials drops the clients and their signatures
+CREDENTIAL_KEYS = (
+    "storage_ak", "storage_sk", "storage_endpoint", "storage_region",
+    "vikingdb_ak", "vikingdb_sk", "vikingdb_region",
+)
+
+def _reset(changed):
+    tos_clients.clear()
+    signed_urls.clear()
+
+config_cache.subscribe(CREDENTIAL_KEYS, _reset)
@@ -0,0 +1,167 @@
+import hashlib
+import math
+import os
+import re
+import time
+import uuid
+import aiofiles
+import tos
+from tos.models2 import UploadedPart
+from typing import AsyncIterator, List, Optional, Tuple
+from sqlalchemy.orm import Session
+from ..models.upload_session import UploadSession
+from ..repositories.upload_session_repo import UploadSessionRepo
+from .storage_service import StorageService, APP_DIR
+from .blob_singleton import blobs
+from .. import settings
+
+PURPOSES = ("task_input", "asset", "best_practice")
+REF_PREFIX = "upload:"
+MAX_PARTS = 10000
+
+def is_upload_ref(value: str) -> bool:
+    return isinstance(value, str) and value.startswith(REF_PREFIX)
+
+def _safe_filename(name: str) -> str:
+    name = os.path.basename(name or "").strip() or "file.bin"
+    return re.sub(r"[^A-Za-z0-9._-]", "_", name)[-100:]
+
+class UploadService:
+    """
+    Upload sessions: the browser sends file bytes straight to TOS through presigned
+    PUT (or multipart part) URLs, then confirms; the API nodes only see small JSON.
+    With storage_type "local" the target is PUT /api/uploads/{id}/content, which
+    streams the body to disk. Any S3-compatible endpoint configured as
+    storage_endpoint works as a stand-in for TOS.
+    """
+    def __init__(self, db: Session):
+        self.db = db
+        self.repo = UploadSessionRepo()
+        self.storage = StorageService(db)
+
+    def _local_rel_path(self, purpose: str, session_id: str, filename: str) -> str:
+        folder = "best_practices" if purpose == "best_practice" else "uploads"
+        return f"static/{folder}/{session_id}_{filename}"
+
+    def local_path(self, s: UploadSession) -> str:
+        return os.path.join(APP_DIR, s.object_key)
+
+    def start(self, user_id: int, filename: str, content_type: Optional[str], size: Optional[int], purpose: str) -> dict:
+        if purpose not in PURPOSES:
+            raise ValueError(f"Unknown upload purpose: {purpose}")
+        if size is not None and (size < 0 or size > settings.UPLOAD_MAX_BYTES):
+            raise ValueError(f"File too large (max {settings.UPLOAD_MAX_BYTES} bytes)")
+        session_id = uuid.uuid4().hex
+        filename = _safe_filename(filename)
+        now = int(time.time())
+        ttl = settings.UPLOAD_URL_TTL_SECONDS
+        data = {
+            "id": session_id, "user_id": user_id, "purpose": purpose, "filename": filename,
+            "content_type": content_type, "size": size, "status": "pending",
+            "created_at": now, "expires_at": now + ttl,
+        }
+        out = {"id": session_id, "ref": REF_PREFIX + session_id, "method": "PUT", "headers": {}, "expires_at": now + ttl}
+        if content_type:
+            out["headers"]["Content-Type"] = content_type
+
+        client, bucket = self.storage._tos_target() if self.storage._get_config("storage_type") == "tos" else (None, None)
+        if not client:
+            data.update(backend="local", object_key=self._local_rel_path(purpose, session_id, filename))
+            self.repo.create(self.db, data)
+            out.update(backend="local", url=f"/api/uploads/{session_id}/content")
+            return out
+
+        key = f"anime_platform/uploads/{purpose}/{session_id}/{filename}"
+        header = {"Content-Type": content_type} if content_type else None
+        data.update(backend="tos", bucket=bucket, object_key=key)
+        if size and size >= settings.STORAGE_MULTIPART_THRESHOLD:
+            part_size = max(settings.STORAGE_MULTIPART_PART_SIZE, math.ceil(size / MAX_PARTS))
+            mp = client.create_multipart_upload(bucket, key, content_type=content_type)
+            data["upload_id"] = mp.upload_id
+            out.update(part_size=part_size, parts=[
+                {"part_number": n, "url": client.pre_signed_url(
+                    tos.HttpMethodType.Http_Method_Put, bucket, key, expires=ttl,
+                    query={"partNumber": str(n), "uploadId": mp.upload_id}).signed_url}
+                for n in range(1, math.ceil(size / part_size) + 1)
+            ])
+            # Content-Type was fixed when the multipart upload was created
+            out["headers"] = {}
+        else:
+            out["url"] = client.pre_signed_url(tos.HttpMethodType.Http_Method_Put, bucket, key, expires=ttl, header=header).signed_url
+        self.repo.create(self.db, data)
+        out["backend"] = "tos"
+        return out
+
+    async def receive_local(self, s: UploadSession, chunks: AsyncIterator[bytes]) -> Tuple[int, str]:
+        """Stream a local-backend upload body to disk. Returns (size, sha256)."""
+        dest = self.local_path(s)
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        tmp = f"{dest}.part-{uuid.uuid4().hex[:8]}"
+        sha = hashlib.sha256()
+        size = 0
+        try:
+            async with aiofiles.open(tmp, "wb") as f:
+                async for chunk in chunks:
+                    size += len(chunk)
+                    if size > settings.UPLOAD_MAX_BYTES:
+                        raise ValueError(f"File too large (max {settings.UPLOAD_MAX_BYTES} bytes)")
+                    sha.update(chunk)
+                    await f.write(chunk)
+            os.replace(tmp, dest)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        return size, sha.hexdigest()
+
+    def complete(self, s: UploadSession, parts: Optional[List[dict]] = None) -> UploadSession:
+        """Verify the object landed in storage and mark the session completed."""
+        if s.status == "completed":
+            return s
+        if s.expires_at and s.expires_at < int(time.time()):
+            raise ValueError("Upload session expired")
+
+        if s.backend == "local":
+            path = self.local_path(s)
+            if not os.path.exists(path):
+                raise ValueError("Nothing was uploaded for this session")
+            # Hand the file to the blob store; identical content already stored is kept once
+            blob = blobs.store_file(self.db, path, s.filename, s.content_type, s.sha256, move=True, remote=False)
+            return self.repo.complete(self.db, s.id, blob.size, f"/{blob.local_path}",
+                                      sha256=blob.sha256, object_key=blob.local_path)
+
+        client, bucket = self.storage._tos_target()
+        if not client:
+            raise ValueError("TOS is no longer configured")
+        if s.upload_id:
+            if parts:
+                client.complete_multipart_upload(
+                    s.bucket, s.object_key, s.upload_id,
+                    parts=[UploadedPart(p["part_number"], p["etag"]) for p in sorted(parts, key=lambda p: p["part_number"])]
+                )
+            else:
+                client.complete_multipart_upload(s.bucket, s.object_key, s.upload_id, complete_all=True)
+        try:
+            head = client.head_object(s.bucket, s.object_key)
+        except tos.exceptions.TosServerError as e:
+            if e.status_code == 404:
+                raise ValueError("Nothing was uploaded for this session")
+            raise
+        if s.size and not s.upload_id and head.content_length != s.size:
+            raise ValueError(f"Uploaded size {head.content_length} does not match declared size {s.size}")
+        url = self.storage.object_url(s.bucket, s.object_key)
+        return self.repo.complete(self.db, s.id, head.content_length, url, etag=(head.etag or "").strip('"'))
+
+    def resolve(self, ref: str, user_id: int) -> UploadSession:
+        """Completed session behind an "upload:<id>" reference owned by user_id."""
+        s = self.repo.get(self.db, ref[len(REF_PREFIX):])
+        if not s or s.user_id != user_id:
+            raise ValueError(f"Unknown upload {ref}")
+        if s.status != "completed":
+            raise ValueError(f"Upload {ref} is not completed")
+        return s
+
+    def identity(self, s: UploadSession) -> str:
+        """Content identity for result-cache keys (signed URLs differ on every signing)."""
+        if s.sha256:
+            return f"sha256:{s.sha256}"
+        return f"etag:{s.etag or s.id}"
@@ -0,0 +1,302 @@
+import asyncio
+import heapq
+import itertools
+import time
+from typing import Dict, Optional
+from sqlalchemy.orm import Session
+from ..db import SessionLocal
+from ..models.task import Task
+from ..repositories.task_repo import TaskRepo
+from .. import settings
+from .volc_video_client import VolcVideoClient
+from .manager_singleton import manager
+from .storage_service import StorageService
+from .io_singleton import io_pools
+from .mezzanine_singleton import mezzanines
+
+TERMINAL_STATUSES = {"succeeded", "failed", "cancelled", "expired"}
+
+class _PollEntry:
+    def __init__(self, task_id: int, ext_id: str, api_key: Optional[str], model: Optional[str], started_at: float):
+        self.task_id = task_id
+        self.ext_id = ext_id
+        self.api_key = api_key
+        self.model = model or "default"
+        self.started_at = started_at # wall clock, used for expected-duration math
+        self.next_at = 0.0 # monotonic
+        self.overdue_polls = 0
+        self.errors = 0
+        self.finalize_errors = 0
+        self.last_status: Optional[str] = None
+        self.checking = False
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+
+class VideoTaskPoller:
+    """
+    One shared poller for all in-flight Seedance tasks.
+
+    Instead of one `while True` loop per task, every tracked external_id sits in a
+    time-ordered heap. Checks are scheduled from the model's typical generation time
+    (sparse polling before it, exponential backoff after it), the total poll rate is
+    capped, intermediate status writes are batched into one DB session and a websocket
+    event is sent only when a task's status actually changes.
+    """
+    def __init__(self, video_client: VolcVideoClient, task_repo: TaskRepo):
+        self.video_client = video_client
+        self.task_repo = task_repo
+        self._entries: Dict[str, _PollEntry] = {}
+        self._heap: list = []
+        self._seq = itertools.count()
+        self._wakeup: asyncio.Event = None
+        self._loop_task: asyncio.Task = None
+        self._jobs: set = set()
+        self._finalizing: Dict[int, asyncio.Task] = {} # task_id -> _finalize job
+        self._next_slot = 0.0
+        self._last_flush = 0.0
+        self._pending_status: Dict[int, str] = {}
+        # EWMA of observed generation time per model (seconds)
+        self._expected: Dict[str, float] = {}
+        self.total_polls = 0
+
+    def track(self, task_id: int, ext_id: str, api_key: str = None, model: str = None, started_at: float = None) -> asyncio.Future:
+        """Start tracking an upstream task. The returned future resolves to True when it succeeded."""
+        e = self._entries.get(ext_id)
+        if e:
+            return e.future
+        e = _PollEntry(task_id, ext_id, api_key, model, started_at or time.time())
+        self._entries[ext_id] = e
+        self._schedule(e, self._initial_delay(e))
+        self._ensure_loop()
+        return e.future
+
+    def untrack(self, ext_id: str) -> bool:
+        e = self._entries.pop(ext_id, None)
+        if not e:
+            return False
+        if not e.future.done():
+            e.future.set_result(False)
+        return True
+
+    def untrack_task(self, task_id: int) -> bool:
+        """Stop polling a task (cancellation), including a result download already under way."""
+        found = False
+        for ext_id, e in list(self._entries.items()):
+            if e.task_id == task_id:
+                found = self.untrack(ext_id) or found
+        self._pending_status.pop(task_id, None)
+        job = self._finalizing.pop(task_id, None)
+        if job and not job.done():
+            job.cancel()
+            found = True
+        return found
+
+    def stats(self) -> dict:
+        return {
+            "tracked": len(self._entries),
+            "total_polls": self.total_polls,
+            "pending_status_writes": len(self._pending_status),
+            "expected_duration": {k: round(v, 1) for k, v in self._expected.items()},
+            "max_polls_per_second": settings.VIDEO_POLL_MAX_PER_SECOND,
+        }
+
+    async def stop(self):
+        if self._loop_task:
+            self._loop_task.cancel()
+        for t in list(self._jobs):
+            t.cancel()
+        await self._flush_status()
+
+    # --- scheduling ---
+
+    def _expected_duration(self, e: _PollEntry) -> float:
+        return self._expected.get(e.model, settings.VIDEO_POLL_EXPECTED_SECONDS)
+
+    def _initial_delay(self, e: _PollEntry) -> float:
+        # Resumed tasks may already be past their expected time; check those soon
+        remaining = self._expected_duration(e) * 0.8 - (time.time() - e.started_at)
+        return min(max(remaining, settings.VIDEO_POLL_MIN_INTERVAL), settings.VIDEO_POLL_MAX_INTERVAL)
+
+    def _next_interval(self, e: _PollEntry) -> float:
+        if e.errors:
+            return min(settings.VIDEO_POLL_MIN_INTERVAL * (2 ** e.errors), settings.VIDEO_POLL_MAX_INTERVAL)
+        elapsed = time.time() - e.started_at
+        expected = self._expected_duration(e)
+        if elapsed < expected * 0.8:
+            # Nothing will be ready yet, jump close to the expected finish time
+            return min(max(expected * 0.8 - elapsed, settings.VIDEO_POLL_MIN_INTERVAL), settings.VIDEO_POLL_MAX_INTERVAL)
+        interval = settings.VIDEO_POLL_MIN_INTERVAL * (settings.VIDEO_POLL_BACKOFF ** e.overdue_polls)
+        e.overdue_polls += 1
+        return min(interval, settings.VIDEO_POLL_MAX_INTERVAL)
+
+    def _schedule(self, e: _PollEntry, delay: float):
+        e.next_at = time.monotonic() + delay
+        heapq.heappush(self._heap, (e.next_at, next(self._seq), e.ext_id))
+        if self._wakeup:
+            self._wakeup.set()
+
+    def _ensure_loop(self):
+        if self._loop_task is None or self._loop_task.done():
+            self._wakeup = asyncio.Event()
+            self._loop_task = asyncio.create_task(self._run())
+
+    def _spawn(self, coro):
+        t = asyncio.create_task(coro)
+        self._jobs.add(t)
+        t.add_done_callback(self._jobs.discard)
+        return t
+
+    async def _run(self):
+        min_gap = 1.0 / max(settings.VIDEO_POLL_MAX_PER_SECOND, 0.1)
+        while self._entries or self._pending_status:
+            self._wakeup.clear()
+            now = time.monotonic()
+            if self._heap and self._heap[0][0] <= now and now >= self._next_slot:
+                next_at, _, ext_id = heapq.heappop(self._heap)
+                e = self._entries.get(ext_id)
+                # Skip stale heap items (rescheduled or untracked entries)
+                if e is None or e.checking or e.next_at != next_at:
+                    continue
+                e.checking = True
+                self._next_slot = now + min_gap
+                self._spawn(self._check(e))
+                continue
+
+            if self._pending_status and now - self._last_flush >= settings.VIDEO_POLL_FLUSH_INTERVAL:
+                await self._flush_status()
+                continue
+
+            timeout = settings.VIDEO_POLL_FLUSH_INTERVAL if self._pending_status else settings.VIDEO_POLL_MAX_INTERVAL
+            if self._heap:
+                timeout = min(timeout, max(self._heap[0][0], self._next_slot) - now)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=max(timeout, 0.01))
+            except asyncio.TimeoutError:
+                pass
+
+    async def _flush_status(self):
+        """Write all intermediate status changes collected since the last flush in one session."""
+        if not self._pending_status:
+            return
+        pending, self._pending_status = self._pending_status, {}
+        self._last_flush = time.monotonic()
+        by_status: Dict[str, list] = {}
+        for task_id, status in pending.items():
+            by_status.setdefault(status, []).append(task_id)
+        try:
+            await io_pools.run("db", self._write_status, by_status)
+        except Exception as ex:
+            print(f"VideoTaskPoller: batched status write failed: {ex}")
+
+    def _write_status(self, by_status: Dict[str, list]):
+        db: Session = SessionLocal()
+        try:
+            for status, ids in by_status.items():
+                db.query(Task).filter(Task.id.in_(ids), Task.status != "cancelled").update({Task.status: status}, synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+    def _in_session(self, fn, *args):
+        db: Session = SessionLocal()
+        try:
+            return fn(db, *args)
+        finally:
+            db.close()
+
+    # --- checks ---
+
+    async def _check(self, e: _PollEntry):
+        try:
+            data = await self.video_client.get_task_status(e.ext_id, api_key=e.api_key)
+            self.total_polls += 1
+            e.errors = 0
+        except asyncio.CancelledError:
+            raise
+        except Exception as ex:
+            self.total_polls += 1
+            e.errors += 1
+            print(f"Polling Error for task {e.task_id}: {ex}")
+            e.checking = False
+            if e.ext_id in self._entries:
+                self._schedule(e, self._next_interval(e))
+            return
+
+        e.checking = False
+        if e.ext_id not in self._entries:
+            return # untracked while the request was in flight
+        # Volcengine status: queued, running, succeeded, failed, cancelled, expired
+        status = data.get("status")
+        if status in TERMINAL_STATUSES:
+            self._entries.pop(e.ext_id, None)
+            job = self._spawn(self._finalize(e, status, data))
+            self._finalizing[e.task_id] = job
+            job.add_done_callback(lambda _, tid=e.task_id: self._finalizing.pop(tid, None))
+            return
+
+        if status != e.last_status:
+            print(f"Task {e.task_id} polling status: {status}")
+            e.last_status = status
+            if status == "running":
+                self._pending_status[e.task_id] = "running"
+                await manager.publish(1, {"type": "task_update", "id": str(e.task_id), "status": "running"})
+        self._schedule(e, self._next_interval(e))
+
+    async def _finalize(self, e: _PollEntry, status: str, data: dict):
+        # Terminal writes must land after any batched "running" write for the same task
+        self._pending_status.pop(e.task_id, None)
+        db: Session = SessionLocal()
+        storage = StorageService(db)
+        ok = False
+        try:
+            api_end = int(time.time())
+            if status == "succeeded":
+                content = data.get("content") or {}
+                video_url = content.get("video_url")
+                last_frame_url = content.get("last_frame_url")
+
+                if video_url:
+                    local_video = await storage.save_file(video_url, e.task_id, "video", "output_video.mp4")
+                    local_cover = await storage.save_file(last_frame_url, e.task_id, "video", "output_cover.png", role="last_frame")
+                    await io_pools.run("db", self._in_session, self.task_repo.set_video_result, e.task_id, local_video, local_cover)
+                    await manager.publish(1, {"type": "task_update", "id": str(e.task_id), "status": "succeeded", "video_url": local_video, "last_frame_url": local_cover, "finished_at": api_end})
+                    # Transcoded to the stitching format in the background
+                    await mezzanines.submit(e.task_id, local_video)
+                    self._observe_duration(e, api_end - e.started_at)
+                    ok = True
+                else:
+                    print(f"Task {e.task_id} succeeded but no video_url found")
+            else:
+                # failed, cancelled and expired upstream all end as "failed" here
+                print(f"Task {e.task_id} ended upstream as {status}")
+
+            final_status = "succeeded" if ok else "failed"
+            await io_pools.run("db", self._in_session, self.task_repo.update_status, e.task_id, final_status, api_end)
+            if not ok:
+                await manager.publish(1, {"type": "task_update", "id": str(e.task_id), "status": "failed"})
+        except Exception:
+            import traceback
+            print(f"Finalize Error for task {e.task_id}:")
+            print(traceback.format_exc())
+            e.finalize_errors += 1
+            if e.finalize_errors < settings.VIDEO_FINALIZE_MAX_ATTEMPTS:
+                # Poll again: the next terminal status runs _finalize once more (downloads are idempotent)
+                self._entries[e.ext_id] = e
+                self._schedule(e, min(settings.VIDEO_POLL_MIN_INTERVAL * (2 ** e.finalize_errors), settings.VIDEO_POLL_MAX_INTERVAL))
+                self._ensure_loop()
+                return
+            ok = False
+            try:
+                await io_pools.run("db", self._in_session, self.task_repo.update_status, e.task_id, "failed", int(time.time()))
+                await manager.publish(1, {"type": "task_update", "id": str(e.task_id), "status": "failed"})
+            except Exception as ex:
+                print(f"Could not mark task {e.task_id} failed: {ex}")
+        finally:
+            db.close()
+            if e.ext_id not in self._entries and not e.future.done():
+                e.future.set_result(ok)
+
+    def _observe_duration(self, e: _PollEntry, seconds: float):
+        if seconds <= 0:
+            return
+        prev = self._expected.get(e.model)
+        self._expected[e.model] = seconds if prev is None else prev * 0.8 + seconds * 0.2
@@ -0,0 +1,293 @@
+import asyncio
+import json
+import os
+import time
+from collections import Counter
+from fractions import Fraction
+from typing import Callable, Dict, List, Optional, Tuple
+from .. import settings
+
+# Stream parameters that must be equal for the concat demuxer to join clips with -c copy.
+# (Differing H.264 SPS/PPS are fine: concat inserts h264_mp4toannexb per file.)
+VIDEO_KEYS = ("vcodec", "width", "height", "pix_fmt", "fps", "sar", "timescale")
+AUDIO_KEYS = ("acodec", "sample_rate", "channels")
+
+VIDEO_ENCODERS = {"h264": "libx264", "hevc": "libx265"}
+AUDIO_ENCODERS = {"aac": "aac", "mp3": "libmp3lame", "opus": "libopus"}
+COPY_WEIGHT = 0.05 # progress weight of a copied media second relative to an encoded one
+X264_PROFILES = {"Constrained Baseline": "baseline", "Baseline": "baseline", "Main": "main", "High": "high"}
+
+ProgressFn = Callable[[float], None]
+
+async def run_ffmpeg(args: List[str], cwd: Optional[str] = None,
+                     on_time: Optional[Callable[[float], None]] = None) -> Tuple[int, str, str]:
+    """
+    (returncode, stdout, stderr) of an ffmpeg/ffprobe command. With `on_time`, ffmpeg
+    writes -progress to stdout and on_time(seconds of output written) is called as it
+    advances. Cancelling the caller kills the process.
+    """
+    if on_time:
+        args = [args[0], "-progress", "pipe:1", "-nostats"] + list(args[1:])
+    process = await asyncio.create_subprocess_exec(
+        *args, cwd=cwd,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE
+    )
+    try:
+        if not on_time:
+            stdout, stderr = await process.communicate()
+            return process.returncode, stdout.decode(errors="replace"), stderr.decode(errors="replace")
+        stderr_task = asyncio.create_task(process.stderr.read())
+        async for line in process.stdout:
+            key, _, value = line.decode(errors="replace").strip().partition("=")
+            # out_time_us (out_time_ms is microseconds too in older builds)
+            if key in ("out_time_us", "out_time_ms") and value.isdigit():
+                on_time(int(value) / 1e6)
+        stderr = await stderr_task
+        await process.wait()
+        return process.returncode, "", stderr.decode(errors="replace")
+    except asyncio.CancelledError:
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
+        raise
+
+class _Progress:
+    """Overall fraction done across ffmpeg steps weighted by the media seconds they process."""
+    def __init__(self, callback: Optional[ProgressFn], total: float):
+        self.callback = callback
+        self.total = max(total, 1e-6)
+        self.done = 0.0
+
+    def step(self, weight: float, media_seconds: float) -> Optional[Callable[[float], None]]:
+        if not self.callback:
+            return None
+        base = self.done
+        self.done += weight
+        def on_time(t: float):
+            frac = min(t / media_seconds, 1.0) if media_seconds > 0 else 0.0
+            self.callback(min((base + weight * frac) / self.total, 1.0))
+        return on_time
+
+def _ratio(value: Optional[str], default: str) -> str:
+    return value if value and value not in ("0/0", "0:1", "N/A") else default
+
+async def probe(path: str) -> Optional[dict]:
+    """Stream parameters of a clip (see VIDEO_KEYS/AUDIO_KEYS), or None if ffprobe fails."""
+    try:
+        code, out, err = await run_ffmpeg([
+            settings.FFPROBE_PATH, "-v", "error", "-print_format", "json",
+            "-show_streams", "-show_format", path,
+        ])
+    except OSError as e:
+        print(f"ffprobe unavailable: {e}")
+        return None
+    if code != 0:
+        print(f"ffprobe failed for {path}: {err.strip()}")
+        return None
+    data = json.loads(out or "{}")
+    streams = data.get("streams", [])
+    v = next((s for s in streams if s.get("codec_type") == "video"), None)
+    if not v:
+        return None
+    a = next((s for s in streams if s.get("codec_type") == "audio"), None)
+    return {
+        "vcodec": v.get("codec_name"),
+        "profile": v.get("profile"),
+        "width": v.get("width"),
+        "height": v.get("height"),
+        "pix_fmt": v.get("pix_fmt"),
+        "fps": _ratio(v.get("r_frame_rate"), "25/1"),
+        "sar": _ratio(v.get("sample_aspect_ratio"), "1:1"),
+        "timescale": int(_ratio(v.get("time_base"), "1/90000").split("/")[1]),
+        "acodec": a.get("codec_name") if a else None,
+        "sample_rate": int(a["sample_rate"]) if a and a.get("sample_rate") else None,
+        "channels": a.get("channels") if a else None,
+        "duration": float(data.get("format", {}).get("duration") or 0),
+    }
+
+def signature(info: dict) -> tuple:
+    return tuple(info.get(k) for k in VIDEO_KEYS + AUDIO_KEYS)
+
+def plan(infos: List[Optional[dict]]) -> Tuple[str, Optional[dict], List[int]]:
+    """
+    (path, target, clips to normalize). path is "copy" when every clip matches,
+    "normalize_copy" when only some differ from the most common format, and "reencode"
+    when clips could not be probed or the common format cannot be encoded to.
+    """
+    if not infos or any(i is None for i in infos):
+        return "reencode", None, list(range(len(infos)))
+    target_sig, _ = Counter(signature(i) for i in infos).most_common(1)[0]
+    target = next(i for i in infos if signature(i) == target_sig)
+    if target["vcodec"] not in VIDEO_ENCODERS or (target["acodec"] and target["acodec"] not in AUDIO_ENCODERS):
+        return "reencode", None, list(range(len(infos)))
+    odd = [n for n, i in enumerate(infos) if signature(i) != target_sig]
+    return ("normalize_copy" if odd else "copy"), target, odd
+
+def normalize_args(src: str, info: dict, target: dict, dest: str) -> List[str]:
+    """ffmpeg arguments re-encoding `src` into exactly the stream format of `target`."""
+    w, h = target["width"], target["height"]
+    args = [settings.FFMPEG_PATH, "-y", "-i", src]
+    if target["acodec"] and not info.get("acodec"):
+        # Silent track so the concat keeps one audio stream throughout
+        layout = "mono" if target["channels"] == 1 else "stereo"
+        args += ["-f", "lavfi", "-i", f"anullsrc=r={target['sample_rate']}:cl={layout}",
+                 "-map", "0:v:0", "-map", "1:a:0", "-shortest"]
+    else:
+        args += ["-map", "0:v:0"] + (["-map", "0:a:0"] if target["acodec"] else [])
+    sar = target["sar"].replace(":", "/")
+    args += [
+        "-vf", f"scale={w}:{h}:force_original_aspect_ratio=decrease,pad={w}:{h}:(ow-iw)/2:(oh-ih)/2,"
+               f"setsar={sar},fps={target['fps']}",
+        "-c:v", VIDEO_ENCODERS[target["vcodec"]], "-pix_fmt", target["pix_fmt"],
+        "-video_track_timescale", str(target["timescale"]),
+    ]
+    if target["vcodec"] == "h264" and target.get("profile") in X264_PROFILES:
+        args += ["-profile:v", X264_PROFILES[target["profile"]]]
+    args += ["-threads", str(settings.STITCH_FFMPEG_THREADS)]
+    if target["acodec"]:
+        args += ["-c:a", AUDIO_ENCODERS[target["acodec"]], "-ar", str(target["sample_rate"]), "-ac", str(target["channels"])]
+    else:
+        args += ["-an"]
+    return args + [dest]
+
+def mezzanine_target() -> dict:
+    """Stream format every mezzanine is transcoded to (see MEZZANINE_* settings)."""
+    return {
+        "vcodec": "h264", "profile": "High", "width": settings.MEZZANINE_WIDTH, "height": settings.MEZZANINE_HEIGHT,
+        "pix_fmt": "yuv420p", "fps": settings.MEZZANINE_FPS if "/" in settings.MEZZANINE_FPS else f"{settings.MEZZANINE_FPS}/1", "sar": "1:1", "timescale": 90000,
+        "acodec": "aac", "sample_rate": settings.MEZZANINE_SAMPLE_RATE, "channels": 2,
+    }
+
+def mezzanine_profile() -> str:
+    """Identifies the mezzanine settings; mezzanines made with other settings are not reused."""
+    t = mezzanine_target()
+    return (f"h264-{t['width']}x{t['height']}-{settings.MEZZANINE_FPS}fps-g{settings.MEZZANINE_GOP_SECONDS}s-"
+            f"crf{settings.MEZZANINE_CRF}-aac{t['sample_rate']}")
+
+def mezzanine_args(src: str, info: Optional[dict], dest: str) -> List[str]:
+    """
+    normalize_args to the mezzanine format, plus a closed, fixed GOP (a keyframe every
+    MEZZANINE_GOP_SECONDS, none on scene cuts) so mezzanines also split cleanly into segments.
+    Clips that could not be probed are assumed to have audio.
+    """
+    fps = float(Fraction(settings.MEZZANINE_FPS))
+    gop = str(max(1, round(fps * settings.MEZZANINE_GOP_SECONDS)))
+    args = normalize_args(src, info or {"acodec": "aac"}, mezzanine_target(), dest)[:-1]
+    return args + [
+        "-preset", settings.MEZZANINE_PRESET, "-crf", str(settings.MEZZANINE_CRF),
+        "-g", gop, "-keyint_min", gop, "-sc_threshold", "0", "-flags", "+cgop",
+        "-movflags", "+faststart", dest,
+    ]
+
+def _concat_list(workdir: str, files: List[str]) -> str:
+    list_path = os.path.join(workdir, "list.txt")
+    with open(list_path, "w") as f:
+        for path in files:
+            escaped = os.path.abspath(path).replace("'", "'\\''")
+            f.write(f"file '{escaped}'\n")
+    return list_path
+
+async def concat_copy(workdir: str, files: List[str], output: str, on_time=None):
+    list_path = _concat_list(workdir, files)
+    code, _, err = await run_ffmpeg([
+        settings.FFMPEG_PATH, "-y", "-f", "concat", "-safe", "0", "-i", list_path,
+        "-map", "0:v", "-map", "0:a?", "-c", "copy", "-movflags", "+faststart", output,
+    ], cwd=workdir, on_time=on_time)
+    if code != 0:
+        raise RuntimeError(f"ffmpeg concat -c copy failed: {err[-2000:]}")
+
+async def concat_reencode(workdir: str, files: List[str], output: str, on_time=None):
+    """Re-encode the whole concatenation to STITCH_WIDTH x STITCH_HEIGHT H.264/AAC (last resort)."""
+    w, h = settings.STITCH_WIDTH, settings.STITCH_HEIGHT
+    list_path = _concat_list(workdir, files)
+    cmd = [
+        settings.FFMPEG_PATH, "-y",
+        "-f", "concat", "-safe", "0",
+        "-i", list_path,
+        "-vf", f"scale={w}:{h}:force_original_aspect_ratio=decrease,pad={w}:{h}:(ow-iw)/2:(oh-ih)/2",
+        "-c:v", "libx264", "-pix_fmt", "yuv420p",
+        "-profile:v", "main", "-level", "4.0",
+        "-c:a", "aac", "-ar", "48000", "-ac", "2",
+        "-threads", str(settings.STITCH_FFMPEG_THREADS),
+        "-movflags", "+faststart",
+        output
+    ]
+    print(f"Running FFmpeg: {' '.join(cmd)}")
+    code, _, err = await run_ffmpeg(cmd, cwd=workdir, on_time=on_time)
+    if code != 0:
+        raise RuntimeError(f"FFmpeg concatenation failed: {err[-2000:]}")
+
+async def _segments(workdir: str, files: List[str], jobs: Dict[int, List[str]], durations: List[float],
+                    on_progress: Optional[ProgressFn], segments, report: dict) -> Tuple[List[str], "_Progress"]:
+    """
+    Run the ffmpeg commands in `jobs` (clip index -> args writing that clip's segment),
+    taking segments from the `segments` cache where the same clip was encoded with the
+    same arguments before. Returns the files to concatenate and the progress tracker.
+    """
+    keys, cached = {}, set()
+    if segments:
+        for n, args in jobs.items():
+            keys[n] = await segments.key(files[n], args)
+            if await segments.fetch(keys[n], args[-1]):
+                cached.add(n)
+    todo = [n for n in jobs if n not in cached]
+    progress = _Progress(on_progress, sum(durations[n] for n in todo) + COPY_WEIGHT * sum(durations))
+    for n in todo:
+        code, _, err = await run_ffmpeg(jobs[n], cwd=workdir, on_time=progress.step(durations[n], durations[n]))
+        if code != 0:
+            raise RuntimeError(f"encoding clip {n} failed: {err[-2000:]}")
+        if segments:
+            await segments.put(keys[n], jobs[n][-1])
+    report["segments"] = {"cached": len(cached), "encoded": len(todo)}
+    parts = list(files)
+    for n, args in jobs.items():
+        parts[n] = args[-1]
+    return parts, progress
+
+async def stitch(workdir: str, files: List[str], output: str, on_progress: Optional[ProgressFn] = None,
+                 segments=None) -> dict:
+    """
+    Join clips into `output`, re-encoding as little as possible:
+      copy           - every clip has the same stream format; concat with -c copy
+      normalize_copy - clips that differ from the most common format are re-encoded to
+                       it first, then everything is joined with -c copy
+      reencode       - every clip is re-encoded to the mezzanine format, then joined with
+                       -c copy (clips could not be probed, or the paths above failed)
+      reencode_full  - one ffmpeg decoding and encoding the whole concatenation
+    Encoded clips are looked up in and added to `segments` (a SegmentCache), so a
+    re-stitch only encodes clips that changed. on_progress(fraction) is called as ffmpeg
+    advances; encoded media seconds count fully, copied ones at COPY_WEIGHT.
+    Returns the path taken, the normalized clips, segment cache use and timings.
+    """
+    t0 = time.monotonic()
+    infos = await asyncio.gather(*(probe(f) for f in files))
+    path, target, odd = plan(list(infos))
+    report = {"path": path, "clips": len(files), "normalized": odd if path == "normalize_copy" else [],
+              "probe_seconds": round(time.monotonic() - t0, 2)}
+    durations = [i["duration"] if i else 0.0 for i in infos]
+    total = sum(durations)
+    if target:
+        report["format"] = {k: target[k] for k in VIDEO_KEYS + AUDIO_KEYS}
+    if path != "reencode":
+        try:
+            jobs = {n: normalize_args(files[n], infos[n], target, os.path.join(workdir, f"norm_{n}.mp4")) for n in odd}
+            parts, progress = await _segments(workdir, files, jobs, durations, on_progress, segments, report)
+            await concat_copy(workdir, parts, output, on_time=progress.step(COPY_WEIGHT * total, total))
+        except RuntimeError as e:
+            print(f"Stitch {path} path failed, re-encoding every clip: {e}")
+            report["fallback_from"] = path
+            report["path"] = path = "reencode"
+    if path == "reencode":
+        try:
+            jobs = {n: mezzanine_args(f, infos[n], os.path.join(workdir, f"seg_{n}.mp4")) for n, f in enumerate(files)}
+            parts, progress = await _segments(workdir, files, jobs, durations, on_progress, segments, report)
+            await concat_copy(workdir, parts, output, on_time=progress.step(COPY_WEIGHT * total, total))
+        except RuntimeError as e:
+            print(f"Stitch reencode path failed, re-encoding the concatenation: {e}")
+            report["path"] = "reencode_full"
+            progress = _Progress(on_progress, total)
+            await concat_reencode(workdir, files, output, on_time=progress.step(total, total))
+    report["seconds"] = round(time.monotonic() - t0, 2)
+    print(f"Stitched {len(files)} clips via {report['path']} in {report['seconds']}s")
+    return report
@@ -3,8 +3,7 @@ import json
 import os
 import hashlib
 import time
-from ..db import SessionLocal
-from ..repositories.system_config_repo import SystemConfigRepo
+from .config_singleton import config_cache
 
 try:
     from volcengine.viking_db import VikingDBService as SDKVikingDBService
@@ -15,6 +14,15 @@ except ImportError as e:
     print(f"volcengine.viking_db import failed: {e}, using mock implementation")
     VIKINGDB_AVAILABLE = False
 
+CONFIG_KEYS = ("vikingdb_host", "vikingdb_region", "vikingdb_scheme", "vikingdb_ak", "vikingdb_sk",
+               "vikingdb_collection", "vikingdb_index")
+_shared = {} # SDK client and resolved collection/index, rebuilt only when CONFIG_KEYS change
+
+def _drop_sdk(changed):
+    _shared.clear()
+
+config_cache.subscribe(CONFIG_KEYS, _drop_sdk)
+
 class VikingDBService:
     def __init__(self):
         self.load_config()
@@ -26,14 +34,9 @@ class VikingDBService:
             self.service = None
 
     def load_config(self):
-        """从数据库加载配置"""
+        """从配置缓存加载配置"""
         try:
-            db = SessionLocal()
-            repo = SystemConfigRepo()
-            
-            def get_config(key, default):
-                conf = repo.get(db, key)
-                return conf.value if conf else default
+            get_config = config_cache.get
 
             self.host = get_config("vikingdb_host", os.environ.get("VIKINGDB_HOST", "api-vikingdb.volces.com"))
             self.region = get_config("vikingdb_region", os.environ.get("VIKINGDB_REGION", "cn-beijing"))
@@ -42,8 +45,6 @@ class VikingDBService:
             self.sk = get_config("vikingdb_sk", os.environ.get("VIKINGDB_SK", ""))
             self.collection_name = get_config("vikingdb_collection", "material_assets")
             self.index_name = get_config("vikingdb_index", "material_assets_index")
-            
-            db.close()
         except Exception as e:
             print(f"Error loading VikingDB config: {e}")
             # Fallback defaults
@@ -56,6 +57,12 @@ class VikingDBService:
             self.index_name = "material_assets_index"
 
     def _init_sdk(self):
+        if "service" in _shared:
+            # Reuse the process-wide client; resources were already ensured for this config
+            self.service = _shared["service"]
+            self.collection = _shared.get("collection")
+            self.index = _shared.get("index")
+            return
         try:
             self.service = SDKVikingDBService(
                 host=self.host,
@@ -67,12 +74,14 @@ class VikingDBService:
             # 尝试初始化资源，但不阻塞启动（因为可能配置还没填）
             if self.ak and self.sk:
                 self._ensure_resources()
+            _shared.update(service=self.service, collection=getattr(self, "collection", None), index=getattr(self, "index", None))
         except Exception as e:
             print(f"Failed to initialize VikingDB SDK: {e}")
             self.service = None
 
     def reload_config(self):
         """重新加载配置并初始化SDK"""
+        _shared.clear()
         self.load_config()
         if VIKINGDB_AVAILABLE:
             self._init_sdk()
@@ -3,6 +3,7 @@ import asyncio
 import os
 from typing import Optional, List
 from ..settings import ARK_API_KEY
+from .http_singleton import http_clients
 
 class VolcImageClient:
     def __init__(self):
@@ -26,8 +27,8 @@ class VolcImageClient:
         attempts = 3
         for i in range(attempts):
             try:
-                async with httpx.AsyncClient(timeout=timeout) as client:
-                    r = await client.post(self.url, json=payload, headers=headers)
+                client = http_clients.get("ark")
+                r = await client.post(self.url, json=payload, headers=headers, timeout=timeout)
                 print(f"VolcImageClient Response: {r.status_code} {r.text}")
                 if r.is_error:
                     print(f"VolcImageClient Error: {r.status_code} {r.text}")
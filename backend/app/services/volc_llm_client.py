@@ -5,6 +5,7 @@ import os
 from typing import Optional, Dict, Any, List
 from ..settings import ARK_API_KEY
 from openai import AsyncOpenAI
+from .http_singleton import http_clients
 
 class VolcLLMClient:
     def __init__(self):
@@ -37,10 +38,11 @@ class VolcLLMClient:
         masked_key = key[:6] + "..." + key[-4:] if key and len(key) > 10 else "******"
         print(f"VolcLLMClient Debug: API Key in use: {masked_key}")
         
-        # Initialize OpenAI Client (Async)
+        # Initialize OpenAI Client (Async) on top of the shared keep-alive pool
         client = AsyncOpenAI(
             api_key=key,
-            base_url=self.base_url
+            base_url=self.base_url,
+            http_client=http_clients.get("ark")
         )
         
         try:
@@ -1,5 +1,6 @@
 import httpx
 from ..settings import ARK_API_KEY
+from .http_singleton import http_clients
 
 BASE = "https://ark.cn-beijing.volces.com/api/v3/contents/generations/tasks"
 
@@ -39,26 +40,26 @@ class VolcVideoClient:
         key = api_key or ARK_API_KEY
         headers = {"Authorization": f"Bearer {key}", "Content-Type": "application/json"}
 
-        async with httpx.AsyncClient() as client:
-            r = await client.post(BASE, json=req_payload, headers=headers, timeout=60)
-            if r.is_error:
-                print(f"VolcVideoClient Error: {r.status_code} {r.text}")
-            r.raise_for_status()
-            data = r.json()
-            return str(data.get("id") or data.get("task_id") or "")
+        client = http_clients.get("ark")
+        r = await client.post(BASE, json=req_payload, headers=headers, timeout=60)
+        if r.is_error:
+            print(f"VolcVideoClient Error: {r.status_code} {r.text}")
+        r.raise_for_status()
+        data = r.json()
+        return str(data.get("id") or data.get("task_id") or "")
     
     async def get_task_status(self, task_id: str, api_key: str = None) -> dict:
         """获取任务状态"""
         key = api_key or ARK_API_KEY
         headers = {"Authorization": f"Bearer {key}"}
-        async with httpx.AsyncClient() as client:
-            r = await client.get(f"{BASE}/{task_id}", headers=headers, timeout=30)
-            r.raise_for_status()
-            return r.json()
+        client = http_clients.get("ark")
+        r = await client.get(f"{BASE}/{task_id}", headers=headers, timeout=30)
+        r.raise_for_status()
+        return r.json()
     
     async def delete_task(self, task_id: str, api_key: str = None) -> None:
         """删除任务"""
         key = api_key or ARK_API_KEY
         headers = {"Authorization": f"Bearer {key}"}
-        async with httpx.AsyncClient() as client:
-            await client.delete(f"{BASE}/{task_id}", headers=headers, timeout=30)
+        client = http_clients.get("ark")
+        await client.delete(f"{BASE}/{task_id}", headers=headers, timeout=30)
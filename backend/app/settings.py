@@ -7,3 +7,138 @@ ARK_API_KEY = os.getenv("ARK_API_KEY", "")
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///app.db")
 CORS_ORIGINS = os.getenv("CORS_ORIGINS", "*").split(",")
 WS_ALLOWED_ORIGINS = os.getenv("WS_ALLOWED_ORIGINS", "*").split(",")
+
+# Durable task queue
+QUEUE_LEASE_SECONDS = int(os.getenv("QUEUE_LEASE_SECONDS", "60"))
+QUEUE_POLL_INTERVAL = float(os.getenv("QUEUE_POLL_INTERVAL", "2"))
+QUEUE_MAX_ATTEMPTS = int(os.getenv("QUEUE_MAX_ATTEMPTS", "3"))
+QUEUE_DISPATCH_BATCH = int(os.getenv("QUEUE_DISPATCH_BATCH", "50"))
+QUEUE_FINISHED_RETENTION_SECONDS = int(os.getenv("QUEUE_FINISHED_RETENTION_SECONDS", str(24 * 3600))) # done/failed/cancelled rows are pruned after this
+QUEUE_PRUNE_INTERVAL = float(os.getenv("QUEUE_PRUNE_INTERVAL", "600"))
+
+# Shared Seedance status poller
+VIDEO_POLL_EXPECTED_SECONDS = float(os.getenv("VIDEO_POLL_EXPECTED_SECONDS", "60"))
+VIDEO_POLL_MIN_INTERVAL = float(os.getenv("VIDEO_POLL_MIN_INTERVAL", "3"))
+VIDEO_POLL_MAX_INTERVAL = float(os.getenv("VIDEO_POLL_MAX_INTERVAL", "30"))
+VIDEO_POLL_BACKOFF = float(os.getenv("VIDEO_POLL_BACKOFF", "1.5"))
+VIDEO_POLL_MAX_PER_SECOND = float(os.getenv("VIDEO_POLL_MAX_PER_SECOND", "10"))
+VIDEO_POLL_FLUSH_INTERVAL = float(os.getenv("VIDEO_POLL_FLUSH_INTERVAL", "1"))
+VIDEO_FINALIZE_MAX_ATTEMPTS = int(os.getenv("VIDEO_FINALIZE_MAX_ATTEMPTS", "3")) # result downloads before the task is failed
+
+# Shared HTTP client pools
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "200"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "50"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "60"))
+HTTP_DEFAULT_TIMEOUT = float(os.getenv("HTTP_DEFAULT_TIMEOUT", "60"))
+HTTP2_ENABLED = os.getenv("HTTP2_ENABLED", "1") not in ("0", "false", "False")
+
+# Storage streaming / multipart upload
+STORAGE_STREAM_CHUNK_SIZE = int(os.getenv("STORAGE_STREAM_CHUNK_SIZE", str(1024 * 1024)))
+STORAGE_DOWNLOAD_TIMEOUT = float(os.getenv("STORAGE_DOWNLOAD_TIMEOUT", "300"))
+STORAGE_MULTIPART_THRESHOLD = int(os.getenv("STORAGE_MULTIPART_THRESHOLD", str(32 * 1024 * 1024)))
+STORAGE_MULTIPART_PART_SIZE = int(os.getenv("STORAGE_MULTIPART_PART_SIZE", str(8 * 1024 * 1024)))
+STORAGE_MULTIPART_THREADS = int(os.getenv("STORAGE_MULTIPART_THREADS", "4"))
+
+# Thread pools for blocking I/O and event-loop lag monitoring
+IO_POOL_DB_SIZE = int(os.getenv("IO_POOL_DB_SIZE", "8"))
+IO_POOL_STORAGE_SIZE = int(os.getenv("IO_POOL_STORAGE_SIZE", "16"))
+IO_POOL_FILE_SIZE = int(os.getenv("IO_POOL_FILE_SIZE", "4"))
+LOOP_LAG_INTERVAL = float(os.getenv("LOOP_LAG_INTERVAL", "0.1"))
+LOOP_LAG_THRESHOLD_MS = float(os.getenv("LOOP_LAG_THRESHOLD_MS", "100"))
+
+# Per-model limiter: request_quota is spent over this window (86400 = per day, matching quota_usage; 60 = per minute)
+MODEL_REQUEST_WINDOW_SECONDS = float(os.getenv("MODEL_REQUEST_WINDOW_SECONDS", "86400"))
+# Max requests that may be sent back-to-back; 0 means the whole window's quota
+MODEL_REQUEST_BURST = int(os.getenv("MODEL_REQUEST_BURST", "0"))
+
+# Adaptive (AIMD) concurrency per model, between a floor and concurrency_quota
+ADAPTIVE_CONCURRENCY_ENABLED = os.getenv("ADAPTIVE_CONCURRENCY_ENABLED", "1") not in ("0", "false", "False")
+ADAPTIVE_MIN_CONCURRENCY = int(os.getenv("ADAPTIVE_MIN_CONCURRENCY", "1"))
+ADAPTIVE_DECREASE_FACTOR = float(os.getenv("ADAPTIVE_DECREASE_FACTOR", "0.7"))
+ADAPTIVE_LATENCY_TOLERANCE = float(os.getenv("ADAPTIVE_LATENCY_TOLERANCE", "2.0"))
+ADAPTIVE_COOLDOWN_SECONDS = float(os.getenv("ADAPTIVE_COOLDOWN_SECONDS", "5"))
+
+# Fair scheduler in front of the model buckets
+SCHEDULER_WINDOW = int(os.getenv("SCHEDULER_WINDOW", "1000")) # ready entries considered per dispatch round
+SCHEDULER_AGING_SECONDS = float(os.getenv("SCHEDULER_AGING_SECONDS", "600")) # each period waited promotes an entry one lane
+SCHEDULER_USER_WEIGHTS = os.getenv("SCHEDULER_USER_WEIGHTS", "") # e.g. "1:2,7:0.5" (user_id:weight)
+SCHEDULER_DEFAULT_JOB_SECONDS = float(os.getenv("SCHEDULER_DEFAULT_JOB_SECONDS", "30"))
+SCHEDULER_POSITIONS_TTL = float(os.getenv("SCHEDULER_POSITIONS_TTL", "5")) # max age of the queue positions snapshot
+
+# Result cache for identical generation requests
+RESULT_CACHE_ENABLED = os.getenv("RESULT_CACHE_ENABLED", "1") not in ("0", "false", "False")
+RESULT_CACHE_TTL_SECONDS = int(os.getenv("RESULT_CACHE_TTL_SECONDS", str(24 * 3600)))
+RESULT_CACHE_MAX_ENTRIES = int(os.getenv("RESULT_CACHE_MAX_ENTRIES", "5000"))
+
+# Task list
+TASK_COUNT_CACHE_SECONDS = float(os.getenv("TASK_COUNT_CACHE_SECONDS", "30"))
+
+# Process-wide SystemConfig cache: how often other workers' config writes are picked up
+CONFIG_CACHE_CHECK_SECONDS = float(os.getenv("CONFIG_CACHE_CHECK_SECONDS", "5"))
+
+# Pre-signed TOS URLs: lifetime of redirect signatures and when a cached one is renewed
+SIGNED_URL_TTL_SECONDS = int(os.getenv("SIGNED_URL_TTL_SECONDS", "3600"))
+SIGNED_URL_REFRESH_BEFORE = int(os.getenv("SIGNED_URL_REFRESH_BEFORE", "300"))
+SIGNED_URL_CACHE_MAX_ENTRIES = int(os.getenv("SIGNED_URL_CACHE_MAX_ENTRIES", "20000"))
+
+# Upload sessions (direct browser -> TOS uploads)
+UPLOAD_URL_TTL_SECONDS = int(os.getenv("UPLOAD_URL_TTL_SECONDS", "3600"))
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(5 * 1024 * 1024 * 1024)))
+
+# Task input staging: lifetime of the signed reference-image URLs handed to the model API
+INPUT_URL_TTL_SECONDS = int(os.getenv("INPUT_URL_TTL_SECONDS", "3600"))
+
+# Bounded local media cache (local copies of TOS media, stitch/badcase downloads)
+# Relative to the app dir and outside static/: the index lists every cached key and source URL
+MEDIA_CACHE_DIR = os.getenv("MEDIA_CACHE_DIR", "data/media_cache")
+MEDIA_CACHE_INDEX = os.getenv("MEDIA_CACHE_INDEX", "") # SQLite index file; default <MEDIA_CACHE_DIR>/index.db
+MEDIA_CACHE_MAX_BYTES = int(os.getenv("MEDIA_CACHE_MAX_BYTES", str(20 * 1024 * 1024 * 1024)))
+MEDIA_CACHE_PROJECT_PIN_SECONDS = int(os.getenv("MEDIA_CACHE_PROJECT_PIN_SECONDS", str(7 * 24 * 3600)))
+SEGMENT_DIGEST_CACHE_MAX_ENTRIES = int(os.getenv("SEGMENT_DIGEST_CACHE_MAX_ENTRIES", "10000")) # clip file -> sha256 memo of the segment cache
+
+# Background storage garbage collector (tombstoned TOS objects / local files)
+STORAGE_GC_ENABLED = os.getenv("STORAGE_GC_ENABLED", "true") not in ("0", "false", "False")
+STORAGE_GC_INTERVAL_SECONDS = float(os.getenv("STORAGE_GC_INTERVAL_SECONDS", "10"))
+STORAGE_GC_BATCH_SIZE = int(os.getenv("STORAGE_GC_BATCH_SIZE", "500")) # keys per DeleteMultiObjects call, max 1000
+STORAGE_GC_DELETES_PER_SECOND = int(os.getenv("STORAGE_GC_DELETES_PER_SECOND", "200")) # 0 = unthrottled
+STORAGE_GC_GRACE_SECONDS = int(os.getenv("STORAGE_GC_GRACE_SECONDS", "300"))
+STORAGE_GC_MAX_ATTEMPTS = int(os.getenv("STORAGE_GC_MAX_ATTEMPTS", "5"))
+STORAGE_GC_LEASE_SECONDS = int(os.getenv("STORAGE_GC_LEASE_SECONDS", "120"))
+STORAGE_GC_RECONCILE_SECONDS = int(os.getenv("STORAGE_GC_RECONCILE_SECONDS", str(6 * 3600))) # 0 = only on demand
+STORAGE_GC_ORPHAN_AGE_SECONDS = int(os.getenv("STORAGE_GC_ORPHAN_AGE_SECONDS", str(24 * 3600)))
+
+# Video stitching
+FFMPEG_PATH = os.getenv("FFMPEG_PATH", "ffmpeg")
+FFPROBE_PATH = os.getenv("FFPROBE_PATH", "ffprobe")
+STITCH_WIDTH = int(os.getenv("STITCH_WIDTH", "1280")) # frame size of the full re-encode path
+STITCH_HEIGHT = int(os.getenv("STITCH_HEIGHT", "720"))
+# Stitch job engine: concurrent ffmpeg jobs per process, and threads each job's encoder may use
+STITCH_WORKERS = int(os.getenv("STITCH_WORKERS", str(max(1, (os.cpu_count() or 1) // 4))))
+STITCH_FFMPEG_THREADS = int(os.getenv("STITCH_FFMPEG_THREADS", str(max(1, (os.cpu_count() or 1) // STITCH_WORKERS))))
+STITCH_POLL_SECONDS = float(os.getenv("STITCH_POLL_SECONDS", "2"))
+STITCH_LEASE_SECONDS = int(os.getenv("STITCH_LEASE_SECONDS", "60"))
+STITCH_MAX_ATTEMPTS = int(os.getenv("STITCH_MAX_ATTEMPTS", "2"))
+STITCH_FETCH_CONCURRENCY = int(os.getenv("STITCH_FETCH_CONCURRENCY", "6")) # clip downloads at a time per job
+# Mezzanines: every finished clip is transcoded once in the background to one stream format,
+# so stitching clips that all have one is a stream copy
+MEZZANINE_ENABLED = os.getenv("MEZZANINE_ENABLED", "1") != "0"
+MEZZANINE_WIDTH = int(os.getenv("MEZZANINE_WIDTH", str(STITCH_WIDTH)))
+MEZZANINE_HEIGHT = int(os.getenv("MEZZANINE_HEIGHT", str(STITCH_HEIGHT)))
+MEZZANINE_FPS = os.getenv("MEZZANINE_FPS", "24")
+MEZZANINE_GOP_SECONDS = int(os.getenv("MEZZANINE_GOP_SECONDS", "2")) # fixed keyframe interval, no scene-cut keyframes
+MEZZANINE_CRF = int(os.getenv("MEZZANINE_CRF", "18"))
+MEZZANINE_PRESET = os.getenv("MEZZANINE_PRESET", "veryfast")
+MEZZANINE_SAMPLE_RATE = int(os.getenv("MEZZANINE_SAMPLE_RATE", "48000"))
+MEZZANINE_WORKERS = int(os.getenv("MEZZANINE_WORKERS", "1")) # transcodes at a time per process
+MEZZANINE_POLL_SECONDS = float(os.getenv("MEZZANINE_POLL_SECONDS", "10"))
+MEZZANINE_LEASE_SECONDS = int(os.getenv("MEZZANINE_LEASE_SECONDS", "900"))
+MEZZANINE_MAX_ATTEMPTS = int(os.getenv("MEZZANINE_MAX_ATTEMPTS", "3"))
+
+# HLS packaging of stitched films and generated clips (optional)
+HLS_ENABLED = os.getenv("HLS_ENABLED", "0") == "1"
+HLS_SEGMENT_SECONDS = int(os.getenv("HLS_SEGMENT_SECONDS", "4")) # a multiple of MEZZANINE_GOP_SECONDS cuts on keyframes
+HLS_PREVIEW_HEIGHT = int(os.getenv("HLS_PREVIEW_HEIGHT", "360")) # low-bitrate preview rendition; 0 = none
+HLS_PREVIEW_VIDEO_BITRATE = os.getenv("HLS_PREVIEW_VIDEO_BITRATE", "600k")
+HLS_PREVIEW_AUDIO_BITRATE = os.getenv("HLS_PREVIEW_AUDIO_BITRATE", "64k")
+# Cache-Control max-age of files under /static whose content never changes (blobs, HLS, stitched outputs)
+STATIC_IMMUTABLE_MAX_AGE = int(os.getenv("STATIC_IMMUTABLE_MAX_AGE", str(365 * 24 * 3600)))
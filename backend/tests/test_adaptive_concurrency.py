@@ -0,0 +1,44 @@
+import httpx
+from app.services.adaptive_concurrency import AdaptiveConcurrency
+from app.services.token_bucket import TokenBucket
+
+def _controller():
+    c = AdaptiveConcurrency()
+    c.enabled = True
+    c.floor = 2
+    c.decrease_factor = 0.5
+    c.cooldown = 0
+    return c
+
+def test_throttle_decreases_to_floor_and_recovers_additively():
+    c = _controller()
+    b = TokenBucket(10)
+    c.configure(1, 10, b)
+    c.observe(1, b, "throttled", 0.1)
+    assert b.limit == 5
+    c.observe(1, b, "server_error", 0.1)
+    c.observe(1, b, "timeout", 0.1)
+    assert b.limit == 2 # floor
+    for _ in range(20):
+        c.observe(1, b, "ok", 0.1)
+    assert 2 < b.limit <= 10
+    reasons = [d["reason"] for d in c.stats()["recent_decisions"]]
+    assert reasons[0] == "throttled" and "additive increase" in reasons
+
+def test_classify_ignores_client_errors():
+    req = httpx.Request("POST", "https://ark.example/api")
+    err = lambda code: httpx.HTTPStatusError("x", request=req, response=httpx.Response(code, request=req))
+    assert AdaptiveConcurrency.classify(err(429)) == "throttled"
+    assert AdaptiveConcurrency.classify(err(503)) == "server_error"
+    assert AdaptiveConcurrency.classify(err(400)) is None
+    assert AdaptiveConcurrency.classify(httpx.ReadTimeout("t", request=req)) == "timeout"
+
+def test_ceiling_follows_configured_quota():
+    c = _controller()
+    b = TokenBucket(10)
+    c.configure(1, 10, b)
+    b.resize(4)
+    c.configure(1, 4, b)
+    for _ in range(50):
+        c.observe(1, b, "ok", 0.1)
+    assert b.limit == 4
@@ -0,0 +1,32 @@
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app.models.blob import Blob, BlobRef
+from app.repositories.blob_repo import BlobRepo
+
+def _session():
+    engine = create_engine("sqlite://")
+    Blob.__table__.create(engine)
+    BlobRef.__table__.create(engine)
+    return sessionmaker(bind=engine)()
+
+def test_blob_is_orphaned_only_after_last_ref():
+    db, repo = _session(), BlobRepo()
+    repo.ensure(db, "a" * 64, 3, "image/png", "static/blobs/aa/a.png", None, None)
+    assert repo.add_ref(db, "a" * 64, "task", 1, "input")
+    assert not repo.add_ref(db, "a" * 64, "task", 1, "input")
+    assert repo.add_ref(db, "a" * 64, "asset", "as-1", "media")
+    assert repo.get(db, "a" * 64).ref_count == 2
+
+    assert repo.release(db, "task", 1) == []
+    assert repo.get(db, "a" * 64).ref_count == 1
+    orphans = repo.release(db, "asset", "as-1")
+    assert [b.local_path for b in orphans] == ["static/blobs/aa/a.png"]
+    assert repo.get(db, "a" * 64) is None
+
+def test_share_copies_refs():
+    db, repo = _session(), BlobRepo()
+    repo.ensure(db, "b" * 64, 1, None, "static/blobs/bb/b", None, None)
+    repo.add_ref(db, "b" * 64, "task", 1, "image")
+    assert repo.share(db, "task", 1, "task", 2) == 1
+    assert repo.release(db, "task", 1) == []
+    assert len(repo.release(db, "task", 2)) == 1
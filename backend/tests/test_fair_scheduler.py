@@ -0,0 +1,32 @@
+from types import SimpleNamespace
+from app.services.fair_scheduler import FairScheduler, normalize_priority
+
+def _row(id, user_id, priority="interactive", project_id=None, created_at=1000, model_id=1):
+    return SimpleNamespace(id=id, task_id=100 + id, model_id=model_id, user_id=user_id, priority=priority,
+                           project_id=project_id, created_at=created_at)
+
+def _scheduler():
+    s = FairScheduler()
+    s.weights = {}
+    s.aging = 600
+    return s
+
+def test_single_task_is_not_starved_by_backlog():
+    rows = [_row(i, user_id=1, priority="batch") for i in range(300)] + [_row(300, user_id=2)]
+    order = _scheduler().order(rows, now=1000)
+    assert order[0].id == 300
+
+def test_users_interleave_and_projects_round_robin():
+    rows = [_row(1, 1, project_id="a"), _row(2, 1, project_id="a"), _row(3, 1, project_id="b"), _row(4, 2), _row(5, 2)]
+    ids = [r.id for r in _scheduler().order(rows, now=1000)]
+    assert ids == [1, 4, 3, 5, 2]
+
+def test_aging_and_positions():
+    s = _scheduler()
+    old_bg = _row(1, 1, priority="background", created_at=100)
+    new_batch = _row(2, 2, priority="batch", created_at=1300)
+    ids = [r.id for r in s.order([new_batch, old_bg], now=1300)]
+    assert ids == [1, 2] # waited 2 aging periods -> interactive
+    pos = s.positions([_row(i, 1) for i in range(5)], now=1000, limits={1: 2}, avg_seconds={1: 10.0})
+    assert pos[100] == (0, 0.0) and pos[104] == (4, 20.0)
+    assert normalize_priority(None) == "interactive" and normalize_priority("nope") is None
@@ -0,0 +1,86 @@
+import asyncio
+import os
+import time
+from app.services.media_cache import MediaCache, static_path
+
+def _cache(tmp_path, max_bytes):
+    c = MediaCache()
+    c.index_path = str(tmp_path / "index.db")
+    c.max_bytes = max_bytes
+    return c
+
+def _file(tmp_path, name, size):
+    p = tmp_path / name
+    p.write_bytes(b"x" * size)
+    return str(p)
+
+def test_lru_eviction_skips_pinned_entries(tmp_path):
+    c = _cache(tmp_path, 10)
+    a, b = _file(tmp_path, "a", 4), _file(tmp_path, "b", 4)
+    c.admit("a", a, 4, object_key="k/a")
+    c.admit("b", b, 4, object_key="k/b")
+    assert c.get("a") == a # a is now the most recently used
+    c.pin("job-1", ["b"])
+    c.admit("c", _file(tmp_path, "c", 4), 4, object_key="k/c")
+    # b is older but pinned by the job, so a goes
+    assert not os.path.exists(a) and os.path.exists(b)
+    assert c.total_bytes == 8
+
+    c.unpin("job-1")
+    c.pin_until(["c"], time.time() + 60)
+    c.admit("d", _file(tmp_path, "d", 4), 4, object_key="k/d")
+    assert not os.path.exists(b) and c.get("c")
+
+def test_index_survives_reopen_and_drops_missing_files(tmp_path):
+    c = _cache(tmp_path, 100)
+    a = _file(tmp_path, "a", 5)
+    c.admit("a", a, 5, url="https://example.com/a.mp4")
+    c.close()
+
+    c2 = _cache(tmp_path, 100)
+    c2.open()
+    assert c2.total_bytes == 5
+    os.remove(a)
+    assert c2.get("a") is None
+    assert c2.total_bytes == 0
+
+class _SlowStorage:
+    def __init__(self):
+        self.downloads = 0
+
+    def object_key(self, url):
+        return None
+
+    async def _stream_to_file(self, url, dest):
+        self.downloads += 1
+        await asyncio.sleep(0.05)
+        with open(dest, "wb") as f:
+            f.write(b"v" * 8)
+        return "sha"
+
+def test_concurrent_misses_download_once(tmp_path):
+    storage = _SlowStorage()
+    c = _cache(tmp_path, 100)
+    c.storage = storage
+    c.root_rel = str(tmp_path / "media") # absolute, so it is not joined onto the app dir
+
+    async def main():
+        return await asyncio.gather(*(c.local_copy("https://example.com/clip.mp4?sig=1", "stitch") for _ in range(3)))
+
+    results = asyncio.run(main())
+    assert storage.downloads == 1
+    assert len({path for path, _ in results}) == 1 and all(not hit for _, hit in results)
+    assert asyncio.run(c.local_copy("https://example.com/clip.mp4", "stitch"))[1] is True
+
+def test_static_path_accepts_localhost_urls():
+    assert static_path("http://localhost:8000/static/outputs/a.mp4?x=1").endswith(os.path.join("static", "outputs", "a.mp4"))
+    assert static_path("/static/outputs/a.mp4") == static_path("http://127.0.0.1/static/outputs/a.mp4")
+    assert static_path("https://cdn.example.com/static/a.mp4") is None
+
+def test_cache_files_and_index_are_not_served_under_static():
+    from app.services.storage_service import APP_DIR
+    public = os.path.join(APP_DIR, "static") + os.sep
+    c = MediaCache()
+    _, rel, _, _ = c.target("https://cdn.example.com/clips/a.mp4?sig=1")
+    assert not os.path.join(APP_DIR, rel).startswith(public)
+    assert not c.index_path.startswith(public) # it lists signed source URLs
@@ -0,0 +1,39 @@
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app.models.blob import Blob
+from app.models.mezzanine import Mezzanine
+from app.repositories.mezzanine_repo import MezzanineRepo
+
+def _session():
+    engine = create_engine("sqlite://")
+    Blob.__table__.create(engine)
+    Mezzanine.__table__.create(engine)
+    return sessionmaker(bind=engine)()
+
+def test_request_claim_and_lookup():
+    db, repo = _session(), MezzanineRepo()
+    m = repo.request(db, "a" * 64, "p1", 7)
+    assert repo.request(db, "a" * 64, "p1", 8).id == m.id # queued once per clip and profile
+    claimed = repo.claim(db, "w1", now=100, lease_seconds=60)
+    assert claimed.id == m.id and repo.claim(db, "w2", now=110, lease_seconds=60) is None
+    db.add(Blob(sha256="b" * 64, size=1, ref_count=1, created_at=0))
+    db.commit()
+    assert repo.done(db, m.id, "w1", "b" * 64, 3.5)
+    assert list(repo.ready_for(db, ["a" * 64, "c" * 64], "p1")) == ["a" * 64]
+    assert repo.ready_for(db, ["a" * 64], "p2") == {}
+
+def test_failures_back_off_and_deleted_mezzanines_are_requeued():
+    db, repo = _session(), MezzanineRepo()
+    m = repo.request(db, "a" * 64, "p1", 7)
+    repo.claim(db, "w1", now=100, lease_seconds=60)
+    assert repo.retry(db, m.id, "w1", "boom", now=100, max_attempts=2) == "pending"
+    assert repo.claim(db, "w1", now=150, lease_seconds=60) is None
+    repo.claim(db, "w1", now=300, lease_seconds=60)
+    assert repo.retry(db, m.id, "w1", "boom", now=300, max_attempts=2) == "failed"
+    # Asked for again later (backfill, or the same clip in a new task): tried afresh
+    assert repo.request(db, "a" * 64, "p1", 9).status == "pending"
+    repo.claim(db, "w1", now=400, lease_seconds=60)
+    repo.done(db, m.id, "w1", "d" * 64, 1.0)
+    # The mezzanine blob is gone (its tasks were deleted)
+    assert repo.ready_for(db, ["a" * 64], "p1") == {}
+    assert repo.request(db, "a" * 64, "p1", 10).status == "pending"
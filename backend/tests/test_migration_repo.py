@@ -0,0 +1,30 @@
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app.models.migration_item import MigrationItem
+from app.repositories.migration_repo import MigrationRepo
+
+def _session():
+    engine = create_engine("sqlite://")
+    MigrationItem.__table__.create(engine)
+    return sessionmaker(bind=engine)()
+
+def _item(pos, url, size=10):
+    return {"owner_type": "task", "owner_id": 1, "field": "result_urls", "position": pos, "source_url": url, "size": size}
+
+def test_checkpoint_resumes_unfinished_items():
+    db, repo = _session(), MigrationRepo()
+    assert repo.add_missing(db, "r", [_item(0, "/static/a.png"), _item(1, "/static/b.png")]) == 2
+    first, second = repo.next_batch(db, "r", 0, 10, max_attempts=2)
+    repo.finish(db, first.id, "done", target_url="https://b/x")
+    repo.finish(db, second.id, "failed", error="timeout")
+
+    # Rediscovery after a crash adds nothing new; only the failed item is left
+    assert repo.add_missing(db, "r", [_item(0, "/static/a.png"), _item(1, "/static/b.png")]) == 0
+    assert [i.source_url for i in repo.next_batch(db, "r", 0, 10, max_attempts=2)] == ["/static/b.png"]
+    repo.finish(db, second.id, "failed", error="timeout")
+    assert repo.next_batch(db, "r", 0, 10, max_attempts=2) == []
+    assert repo.summary(db, "r") == {"done": {"items": 1, "bytes": 10}, "failed": {"items": 1, "bytes": 10}}
+
+    # A column that now holds another URL is migrated again
+    assert repo.add_missing(db, "r", [_item(1, "/static/c.png")]) == 1
+    assert [i.source_url for i in repo.next_batch(db, "r", 0, 10, max_attempts=2)] == ["/static/c.png"]
@@ -0,0 +1,36 @@
+from app.services.result_cache import ResultCache
+
+def test_key_hashes_images_by_content():
+    a = {"model": "m", "prompt": "cat", "images": ["data:image/png;base64,aGVsbG8="], "size": "1K"}
+    b = {"size": "1K", "images": ["data:image/png;base64,aGVs\nbG8="], "prompt": "cat", "model": "m"}
+    c = dict(a, images=["data:image/png;base64,d29ybGQ="])
+    assert ResultCache.key_for(1, "image", a) == ResultCache.key_for(1, "image", b)
+    assert ResultCache.key_for(1, "image", a) != ResultCache.key_for(1, "image", c)
+    assert ResultCache.key_for(1, "image", a) != ResultCache.key_for(2, "image", a)
+
+def test_coalesced_followers_hold_no_model_slot(monkeypatch):
+    import asyncio
+    from app.services.queue_worker import QueueWorker
+    from app.services.token_bucket import TokenBucket
+    w = QueueWorker()
+    w.buckets = {1: TokenBucket(2)}
+
+    async def no_hit(fn, *args):
+        return None
+
+    async def serve(task_id, ttype, result, source_task_id):
+        return True
+
+    monkeypatch.setattr(w, "_db", no_hit)
+    monkeypatch.setattr(w, "_serve_cached", serve)
+
+    async def run():
+        assert w.result_cache.join("k") is None # leader
+        w._inflight_meta = {1: (1, 1), 2: (1, 1)}
+        follower = asyncio.create_task(w._run_cached(2, 20, 1, "image", {}, "k", True))
+        await asyncio.sleep(0)
+        assert w._free_slots() == {1: 1}
+        w.result_cache.finish("k", ({"result_urls": ["u"]}, 10))
+        assert await follower is True
+        assert w._free_slots() == {1: 0}
+    asyncio.run(run())
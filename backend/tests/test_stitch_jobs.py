@@ -0,0 +1,49 @@
+import os
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app.models.stitch_job import StitchJob
+from app.repositories.stitch_job_repo import StitchJobRepo
+from app.services.media_cache import link_or_copy
+
+def _session():
+    engine = create_engine("sqlite://")
+    StitchJob.__table__.create(engine)
+    return sessionmaker(bind=engine)()
+
+def test_claim_heartbeat_and_expired_lease():
+    db, repo = _session(), StitchJobRepo()
+    repo.create(db, "a", ["/static/a.mp4"])
+    job = repo.claim_next(db, "w1", now=100, lease_seconds=60, max_attempts=2)
+    assert job.id == "a" and job.attempts == 1
+    assert repo.claim_next(db, "w2", now=120, lease_seconds=60, max_attempts=2) is None
+    assert repo.heartbeat(db, "a", "w1", now=150, lease_seconds=60, stage="stitching", progress=40.0) is False
+    # w1 stops heartbeating: the job goes to w2 once the lease runs out, and w1 has lost it
+    assert repo.claim_next(db, "w2", now=200, lease_seconds=60, max_attempts=2) is None
+    assert repo.claim_next(db, "w2", now=211, lease_seconds=60, max_attempts=2).attempts == 2
+    assert repo.heartbeat(db, "a", "w1", now=212, lease_seconds=60) is None
+    # A third death fails the job instead of retrying it forever
+    assert repo.claim_next(db, "w3", now=400, lease_seconds=60, max_attempts=2) is None
+    assert repo.get(db, "a").status == "failed"
+
+def test_release_and_cancel():
+    db, repo = _session(), StitchJobRepo()
+    repo.create(db, "a", [])
+    repo.create(db, "b", [])
+    job = repo.claim_next(db, "w1", now=100, lease_seconds=60, max_attempts=2)
+    repo.release(db, job.id, "w1")
+    assert repo.get(db, job.id).status == "queued" and repo.get(db, job.id).attempts == 0
+    assert repo.request_cancel(db, "b") == "cancelled"
+    job = repo.claim_next(db, "w1", now=100, lease_seconds=60, max_attempts=2)
+    assert job.id == "a"
+    assert repo.request_cancel(db, "a") == "processing"
+    assert repo.heartbeat(db, "a", "w1", now=110, lease_seconds=60) is True
+    repo.finish(db, "a", "w1", "cancelled")
+    assert repo.count_active(db) == {"queued": 0, "processing": 0}
+
+def test_link_or_copy_shares_the_cached_file(tmp_path):
+    src = tmp_path / "cached.mp4"
+    src.write_bytes(b"clip")
+    dest = tmp_path / "clip_0.mp4"
+    assert link_or_copy(str(src), str(dest)) == "hardlink" # same directory, so same filesystem
+    assert os.path.samefile(src, dest)
+    assert dest.read_bytes() == b"clip"
@@ -0,0 +1,51 @@
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app.models.task_queue import TaskQueueEntry
+from app.repositories.task_queue_repo import TaskQueueRepo
+
+def _session():
+    engine = create_engine("sqlite://")
+    TaskQueueEntry.__table__.create(engine)
+    return sessionmaker(bind=engine)()
+
+def test_prune_finished_keeps_pending_and_recent_entries():
+    db, repo = _session(), TaskQueueRepo()
+    for task_id in (1, 2, 3, 4):
+        repo.enqueue(db, task_id, 1, "image", {})
+    assert repo.claim(db, 1, "w1", now=100, lease_seconds=60)
+    repo.complete(db, 1, "w1", "done")
+    repo.cancel_task(db, 2)
+    db.query(TaskQueueEntry).filter(TaskQueueEntry.task_id.in_([1, 2])).update({TaskQueueEntry.updated_at: 10})
+    repo.cancel_task(db, 3)
+    db.commit()
+    assert repo.prune_finished(db, before=50) == 2
+    assert sorted(e.task_id for e in db.query(TaskQueueEntry).all()) == [3, 4]
+
+def test_delete_for_tasks():
+    db, repo = _session(), TaskQueueRepo()
+    repo.enqueue(db, 1, 1, "image", {})
+    repo.enqueue(db, 2, 1, "image", {})
+    assert repo.delete_for_tasks(db, [1]) == 1
+    assert not repo.has_pending(db, 1) and repo.has_pending(db, 2)
+
+def test_ready_ahead_counts_ready_entries_of_the_same_model():
+    db, repo = _session(), TaskQueueRepo()
+    for task_id, model_id in ((1, 1), (2, 2), (3, 1), (4, 1)):
+        repo.enqueue(db, task_id, model_id, "image", {})
+    assert repo.claim(db, 1, "w1", now=100, lease_seconds=60)
+    assert repo.ready_ahead(db, 100, [1, 2, 4]) == {2: (2, 0), 4: (1, 1)}
+
+def test_queue_positions_read_only_the_loops_copies():
+    from app.services.queue_worker import QueueWorker
+
+    class LiveDict(dict):
+        def values(self):
+            raise AssertionError("live in-flight state read off the event loop")
+        items = values
+
+    db, w = _session(), QueueWorker()
+    w.queue_repo.enqueue(db, 1, 1, "image", {})
+    w.queue_repo.enqueue(db, 2, 1, "image", {})
+    w._inflight_meta = LiveDict()
+    w._sched_inputs = ({1: 1}, {1: 10.0}, {})
+    assert w.queue_positions(db, [1, 2, 3]) == {1: (0, 0.0), 2: (1, 10.0)}
@@ -0,0 +1,17 @@
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app.models.task import Task
+from app.repositories.task_repo import TaskRepo
+
+def _session():
+    engine = create_engine("sqlite://")
+    Task.__table__.create(engine)
+    return sessionmaker(bind=engine)()
+
+def test_clear_all_removes_every_finished_status():
+    db, repo = _session(), TaskRepo()
+    for i, status in enumerate(["succeeded", "failed", "cancelled", "running", "queued"], start=1):
+        repo.create(db, {"id": i, "user_id": 1, "type": "video", "status": status, "video_url": f"/static/v{i}.mp4", "created_at": i})
+    rows = repo.clear_all(db, 1)
+    assert sorted(r[0] for r in rows) == [1, 2, 3]
+    assert sorted(t.status for t in db.query(Task).all()) == ["queued", "running"]
@@ -0,0 +1,62 @@
+import asyncio
+from app.services.token_bucket import TokenBucket
+
+def test_concurrency_cap_and_resize_in_place():
+    async def run():
+        b = TokenBucket(2)
+        await b.acquire()
+        await b.acquire()
+        waiter = asyncio.create_task(b.acquire())
+        await asyncio.sleep(0.01)
+        assert not waiter.done()
+        assert b.stats()["waiters"] == 1
+        # Growing the bucket admits the waiter without dropping the two held slots
+        b.resize(3)
+        await asyncio.wait_for(waiter, 1)
+        assert b.in_flight == 3
+        b.resize(1)
+        b.release()
+        b.release()
+        assert b.in_flight == 1
+        late = asyncio.create_task(b.acquire())
+        await asyncio.sleep(0.01)
+        assert not late.done()
+        b.release()
+        await asyncio.wait_for(late, 1)
+    asyncio.run(run())
+
+def test_request_rate_with_burst():
+    async def run():
+        # 20 requests per second, burst of 2
+        b = TokenBucket(10, rate=20, window=1, burst=2)
+        await b.acquire()
+        await b.acquire()
+        assert b.stats()["tokens"] < 1
+        t0 = asyncio.get_running_loop().time()
+        await b.acquire()
+        assert asyncio.get_running_loop().time() - t0 >= 0.03
+        assert b.stats()["rate_limited_waits"] == 1
+        # cost=0 holds a slot without spending a token
+        await asyncio.wait_for(b.acquire(0), 0.01)
+        assert b.in_flight == 4
+    asyncio.run(run())
+
+def test_cancelled_waiter_does_not_leak_slot():
+    async def run():
+        b = TokenBucket(1)
+        await b.acquire()
+        waiter = asyncio.create_task(b.acquire())
+        await asyncio.sleep(0.01)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        b.release()
+        assert b.in_flight == 0
+        await asyncio.wait_for(b.acquire(), 0.1)
+    asyncio.run(run())
+
+def test_stats_projects_tokens_without_refilling():
+    b = TokenBucket(1, rate=10, window=1, burst=5)
+    b.tokens, b._updated = 0.0, b._updated - 0.2
+    before = (b.tokens, b._updated)
+    assert 1.9 < b.stats()["tokens"] <= 5
+    assert (b.tokens, b._updated) == before
@@ -0,0 +1,45 @@
+import asyncio
+from app import settings
+from app.services import video_poller as vp
+from app.services.video_poller import VideoTaskPoller
+
+class _Client:
+    def __init__(self):
+        self.polls = 0
+
+    async def get_task_status(self, ext_id, api_key=None):
+        self.polls += 1
+        return {"status": "succeeded", "content": {"video_url": "https://upstream/v.mp4"}}
+
+class _Repo:
+    def __init__(self):
+        self.status = {}
+
+    def update_status(self, db, task_id, status, finished_at=None):
+        self.status[task_id] = status
+
+    def set_video_result(self, db, task_id, video_url, last_frame_url):
+        pass
+
+async def _broken_save_file(self, *args, **kwargs):
+    raise RuntimeError("TOS unavailable")
+
+def test_failed_result_download_is_retried_then_marks_task_failed(monkeypatch):
+    monkeypatch.setattr(vp.StorageService, "save_file", _broken_save_file)
+    monkeypatch.setattr(vp.VideoTaskPoller, "_in_session", lambda self, fn, *args: fn(None, *args))
+    monkeypatch.setattr(settings, "VIDEO_POLL_MIN_INTERVAL", 0.01)
+    monkeypatch.setattr(settings, "VIDEO_POLL_EXPECTED_SECONDS", 0)
+    monkeypatch.setattr(settings, "VIDEO_POLL_MAX_PER_SECOND", 1000)
+    monkeypatch.setattr(settings, "VIDEO_FINALIZE_MAX_ATTEMPTS", 2)
+    client, repo = _Client(), _Repo()
+
+    async def main():
+        poller = VideoTaskPoller(client, repo)
+        ok = await asyncio.wait_for(poller.track(7, "ext-7", started_at=0), 5)
+        await poller.stop()
+        return ok
+
+    assert asyncio.run(main()) is False
+    # Polled again after the first failed download, then given up on: never left "running"
+    assert client.polls == 2
+    assert repo.status[7] == "failed"
@@ -0,0 +1,73 @@
+from app.services import video_stitcher
+
+def _clip(**kw):
+    info = {"vcodec": "h264", "profile": "High", "width": 1280, "height": 720, "pix_fmt": "yuv420p",
+            "fps": "24/1", "sar": "1:1", "timescale": 12288, "acodec": "aac", "sample_rate": 44100,
+            "channels": 2, "duration": 5.0}
+    info.update(kw)
+    return info
+
+def test_matching_clips_are_copy_concatenated():
+    path, target, odd = video_stitcher.plan([_clip(), _clip(duration=4.2), _clip()])
+    assert (path, odd) == ("copy", [])
+
+def test_only_clips_off_the_common_format_are_normalized():
+    clips = [_clip(), _clip(width=1920, height=1080), _clip(), _clip(acodec=None, sample_rate=None, channels=None)]
+    path, target, odd = video_stitcher.plan(clips)
+    assert (path, odd, target["width"]) == ("normalize_copy", [1, 3], 1280)
+    args = video_stitcher.normalize_args("in.mp4", clips[3], target, "out.mp4")
+    assert "anullsrc=r=44100:cl=stereo" in args and args[args.index("-video_track_timescale") + 1] == "12288"
+
+def test_unprobeable_clip_falls_back_to_reencode():
+    assert video_stitcher.plan([_clip(), None])[0] == "reencode"
+    assert video_stitcher.plan([_clip(vcodec="prores")])[0] == "reencode"
+
+def test_mezzanines_share_one_copyable_format():
+    target = video_stitcher.mezzanine_target()
+    args = video_stitcher.mezzanine_args("in.mp4", _clip(acodec=None, sample_rate=None, channels=None), "out.mp4")
+    gop = args[args.index("-g") + 1]
+    assert args[args.index("-keyint_min") + 1] == gop and args[args.index("-sc_threshold") + 1] == "0"
+    assert "anullsrc=r=48000:cl=stereo" in args and args[-1] == "out.mp4"
+    # Two clips transcoded to the mezzanine format concatenate without re-encoding
+    mezz = dict(target, duration=5.0)
+    assert video_stitcher.plan([mezz, dict(mezz, duration=3.0)])[0] == "copy"
+
+def test_segment_keys_follow_clip_content_and_encode_args(tmp_path):
+    import asyncio
+    from app.services.media_cache import MediaCache
+    from app.services.segment_cache import SegmentCache
+    cache = MediaCache()
+    cache.index_path = str(tmp_path / "index.db")
+    segments = SegmentCache(cache)
+    a, b = tmp_path / "a.mp4", tmp_path / "b.mp4"
+    a.write_bytes(b"clip")
+    b.write_bytes(b"clip")
+    target = video_stitcher.mezzanine_target()
+
+    def key(path, dest, **kw):
+        args = video_stitcher.normalize_args(str(path), _clip(), dict(target, **kw), str(dest))
+        return asyncio.run(segments.key(str(path), args))
+
+    # Same bytes and arguments: same segment, wherever the clip and output live
+    assert key(a, tmp_path / "x/norm_0.mp4") == key(b, tmp_path / "y/norm_3.mp4")
+    assert key(a, "out.mp4") != key(a, "out.mp4", width=1920)
+    b.write_bytes(b"regenerated scene")
+    assert key(a, "out.mp4") != key(b, "out.mp4")
+    # The clip digest memo is an LRU bounded by SEGMENT_DIGEST_CACHE_MAX_ENTRIES
+    segments.max_digests = 1
+    c = tmp_path / "c.mp4"
+    c.write_bytes(b"another scene")
+    segments._digest(str(c))
+    assert len(segments._digests) == 1
+
+def test_hls_master_playlist_and_static_caching():
+    from app.services.hls_packager import master_playlist
+    from app.services.media_static import cache_control
+    playlist = master_playlist([("main/index.m3u8", 4000000, 1280, 720), ("preview/index.m3u8", 664000, 640, 360)])
+    assert playlist.splitlines()[2:] == [
+        "#EXT-X-STREAM-INF:BANDWIDTH=4000000,RESOLUTION=1280x720", "main/index.m3u8",
+        "#EXT-X-STREAM-INF:BANDWIDTH=664000,RESOLUTION=640x360", "preview/index.m3u8",
+    ]
+    assert "immutable" in cache_control("blobs/ab/abc.mp4") and "immutable" in cache_control("hls/clip_x/main/seg_00001.ts")
+    assert cache_control("uploads/avatar.png") == "no-cache"
+    assert cache_control("outputs/stitched_abc.mp4") == "no-cache" # rewritten when a job is retried